@@ -1,120 +1,209 @@
+import functools
+import os
+import re
+
 import streamlit as st
 import pandas as pd
-import sqlite3
-
-# ---------------- DB Connection ----------------
-def get_conn():
-    return sqlite3.connect("food_wastage.db")
-
-def run_query(query, params=None):
-    conn = get_conn()
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return pd.DataFrame([dict(row) for row in rows])
-
-def run_commit(query, params=None):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(query, params or ())
-    conn.commit()
-    lastrow = cur.lastrowid
-    cur.close()
-    conn.close()
-    return lastrow
+
+import archive
+import cascade
+import cdc
+import forecast
+import geo
+import notifications
+import replica
+import reports
+import snapshot
+import sweeper
+import trends
+import workflow
+from db import cached_query, ensure_schema, run_query, run_commit, update_row
+from metrics import render_metrics
+from profiling import profiler
+from queries import ANALYTICS_QUERIES, browse_query
+from schema import ActivityRecord, format_date
+from shared_cache import shared_cache
+from sketches import CMS_DELTA, claim_sketches
 
 # Helper: Distinct values for filters
 def get_distinct_values(table, column):
-    df = run_query(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
+    df = cached_query(f"SELECT DISTINCT {column} FROM {table} WHERE {column} IS NOT NULL")
     if df.empty:
         return []
     return sorted(df[df.columns[0]].dropna().astype(str).tolist())
 
+# ---------------- Fragments ----------------
+def page_fragment(page, name):
+    """st.fragment that keeps profiler and rerun-metrics attribution.
+
+    Inside a full rerun the body just runs as part of the page. When only the
+    fragment reruns, it is timed on its own under "<page> / <name>".
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def body(*args, **kwargs):
+            if render_metrics.in_rerun():
+                return func(*args, **kwargs)
+            key = f"{page} / {name}"
+            render_metrics.start_rerun()
+            profiler.set_page(key)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                render_metrics.finish_rerun(key)
+        return st.fragment(body)
+    return decorate
+
 # ---------------- Browse Listings ----------------
+FOOD_TYPES = ["Non-Vegetarian", "Vegetarian", "Vegan"]  # Fixed food types
+
 def browse_listings():
     st.header("Browse Food Listings")
     st.markdown("Find available food items and submit claims to reduce waste")
-    
-    cities = ["All"] + get_distinct_values("food_listings", "Location")
-    providers = ["All"] + get_distinct_values("providers", "Name")
-    food_types = ["Non-Vegetarian", "Vegetarian", "Vegan"]  # Fixed food types
-    meal_types = ["All"] + get_distinct_values("food_listings", "Meal_Type")
 
+    # Filter catalogs are loaded once per full run and handed to the search fragment,
+    # so changing a filter does not repeat the distinct-value queries.
+    catalogs = {
+        "cities": ["All"] + get_distinct_values("food_listings", "Location"),
+        "providers": ["All"] + get_distinct_values("providers", "Name"),
+        "meal_types": ["All"] + get_distinct_values("food_listings", "Meal_Type"),
+    }
+    browse_search(catalogs)
+
+def browse_filters(catalogs):
     col1, col2, col3 = st.columns(3)
     with col1:
-        city = st.selectbox("City", cities)
+        city = st.selectbox("City", catalogs["cities"])
     with col2:
-        provider = st.selectbox("Provider", providers)
+        provider = st.selectbox("Provider", catalogs["providers"])
     with col3:
-        food_type = st.multiselect("Food Type", options=food_types)
+        food_type = st.multiselect("Food Type", options=FOOD_TYPES)
 
-    meal = st.selectbox("Meal Type", meal_types)
+    col1, col2 = st.columns(2)
+    with col1:
+        meal = st.selectbox("Meal Type", catalogs["meal_types"])
+    with col2:
+        radius_km = st.slider("Also within (km) of the city", 0, 500, 0, step=25, disabled=city == "All")
+    return {"city": city, "provider": provider, "food_type": food_type, "meal": meal, "radius_km": radius_km}
+
+def search_listings(city=None, provider=None, food_type=None, meal=None, radius_km=0):
+    distances = None
+    if radius_km and city and city != "All":
+        distances = geo.city_locator.nearby(city, radius_km, get_distinct_values("food_listings", "Location"))
+        # A city missing from the gazetteer falls back to the exact match
+        if distances is not None and len(distances):
+            city = distances["name"].tolist()
+        else:
+            distances = None
+    df = _search_listings(city, provider, food_type, meal)
+    if distances is not None:
+        df.insert(df.columns.get_loc("Location") + 1, "Distance_km",
+                  df["Location"].astype(object).map(dict(zip(distances["name"], distances["distance_km"].round(1)))))
+    return df
+
+def _search_listings(city, provider, food_type, meal):
+    """`city` is one name or a list of names"""
+    if snapshot.ENABLED:
+        snapshot.listing_snapshot.refresh()
+        return snapshot.listing_snapshot.filter(city, provider, food_type, meal)
+
+    return run_query(*browse_query(city, provider, food_type, meal))
+
+@page_fragment("Browse Listings", "search")
+def browse_search(catalogs):
+    """Filters and results grid; a filter change reruns only this block"""
+    filters = browse_filters(catalogs)
+    df = search_listings(**filters)
 
-    base_q = """
-      SELECT f.Food_ID, f.Food_Name, f.Quantity, f.Expiry_Date, f.Meal_Type, f.Food_Type, f.Location,
-             p.Provider_ID, p.Name as Provider_Name, p.Contact as Provider_Contact, p.Address as Provider_Address
-      FROM food_listings f
-      JOIN providers p ON f.Provider_ID = p.Provider_ID
-    """
-    where = []
-    params = []
-    if city and city != "All":
-        where.append("f.Location = ?"); params.append(city)
-    if provider and provider != "All":
-        where.append("p.Name = ?"); params.append(provider)
-    if food_type:
-        where.append("f.Food_Type IN (" + ",".join(["?"]*len(food_type)) + ")")
-        params.extend(food_type)
-    if meal and meal != "All":
-        where.append("f.Meal_Type = ?"); params.append(meal)
-
-    if where:
-        base_q += " WHERE " + " AND ".join(where)
-    base_q += " ORDER BY f.Expiry_Date ASC;"
-
-    df = run_query(base_q, tuple(params))
-    
     st.subheader(f"Search Results ({len(df)} listings found)")
     
     if not df.empty:
         st.dataframe(df, use_container_width=True)
+        listing_detail(df)
     else:
         st.info("No listings found matching your criteria. Try adjusting your filters.")
 
-    if not df.empty:
-        sel = st.selectbox("Select a listing to see details / claim", df['Food_ID'].astype(str).tolist())
-        row = df[df['Food_ID'] == int(sel)].iloc[0]
-        
-        st.subheader(row['Food_Name'])
-        col1, col2 = st.columns(2)
-        with col1:
-            st.write(f"**Quantity:** {row['Quantity']} servings")
-            st.write(f"**Expiry Date:** {row['Expiry_Date']}")
-            st.write(f"**Food Type:** {row['Food_Type']}")
-        with col2:
-            st.write(f"**Provider:** {row['Provider_Name']}")
-            st.write(f"**Meal Type:** {row['Meal_Type']}")
-            st.write(f"**Location:** {row['Location']}")
-        
-        with st.expander("Provider Contact Details"):
-            st.write(f"**Contact:** {row['Provider_Contact']}")
-            st.write(f"**Address:** {row['Provider_Address']}")
-
-        st.divider()
-        with st.form("claim_form"):
-            receiver_id = st.text_input("Enter your Receiver ID")
-            submit = st.form_submit_button("Submit Claim")
-            if submit:
-                if not receiver_id:
-                    st.error("Please provide your Receiver ID.")
-                else:
-                    insert_q = "INSERT INTO claims (Food_ID, Receiver_ID, Status, Timestamp) VALUES (?, ?, 'Pending', datetime('now'));"
-                    last_id = run_commit(insert_q, (int(sel), int(receiver_id)))
-                    log_activity("Add", "claims", last_id, f"Food claim submitted: Food ID {sel} by Receiver ID {receiver_id}")
-                    st.success("Claim submitted. Provider will be notified.")
+@page_fragment("Browse Listings", "detail")
+def listing_detail(df):
+    """Detail and claim panel for the current results, rerun on its own"""
+    sel = st.selectbox("Select a listing to see details / claim", df['Food_ID'].dropna().astype(str).tolist())
+    if sel is None:
+        return
+    row = df[df['Food_ID'] == int(sel)].iloc[0]
+    
+    st.subheader(row['Food_Name'])
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write(f"**Quantity:** {row['Quantity']} servings")
+        st.write(f"**Expiry Date:** {format_date(row['Expiry_Date'])}")
+        st.write(f"**Food Type:** {row['Food_Type']}")
+    with col2:
+        st.write(f"**Provider:** {row['Provider_Name']}")
+        st.write(f"**Meal Type:** {row['Meal_Type']}")
+        st.write(f"**Location:** {row['Location']}")
+    
+    with st.expander("Provider Contact Details"):
+        st.write(f"**Contact:** {row['Provider_Contact']}")
+        st.write(f"**Address:** {row['Provider_Address']}")
+        point = geo.city_locator.gazetteer.address(row['Provider_Address'])
+        if point is not None:
+            st.write(f"**Coordinates:** {point[0]:.3f}, {point[1]:.3f} (approximate, {point[2]} level)")
+
+    st.divider()
+    with st.form("claim_form"):
+        receiver_id = st.text_input("Enter your Receiver ID")
+        submit = st.form_submit_button("Submit Claim")
+        if submit:
+            receiver_id = receiver_id.strip()
+            if not receiver_id:
+                st.error("Please provide your Receiver ID.")
+            elif not receiver_id.isdigit():
+                st.error("Receiver ID must be a number.")
+            elif run_query("SELECT 1 FROM receivers WHERE Receiver_ID = ?", (int(receiver_id),)).empty:
+                st.error(f"No receiver with ID {receiver_id}.")
+            else:
+                last_id = workflow.submit(sel, receiver_id)
+                log_activity("Add", "claims", last_id, f"Food claim submitted: Food ID {sel} by Receiver ID {receiver_id}")
+                # The change log row written with the claim is read into the outbox by the next notification round
+                st.success("Claim submitted. It is queued for the provider's next notification digest.")
+
+# ---------------- Versioned Edits ----------------
+def load_for_edit(form, table, key_column, key):
+    """The row as it was when `form` first showed it, kept until it is saved.
+
+    Reading it again on the submit rerun would pick up another editor's
+    version and hide the conflict.
+    """
+    if st.session_state.pop(f"conflict_{form}", False):
+        st.error("Someone else changed or deleted this record after you opened it, so your changes "
+                 "were not saved. Check the current values below and save again.")
+    held = st.session_state.get(f"editing_{form}")
+    if held is None or held[0] != key:
+        rec = run_query(f"SELECT * FROM {table} WHERE {key_column} = ?", (key,)).iloc[0]
+        held = st.session_state[f"editing_{form}"] = (key, rec)
+    return held[1]
+
+def _edit_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if hasattr(value, "strftime"):
+        return format_date(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def save_edit(form, table, key_column, key, values):
+    """Write the fields that differ from the loaded row; returns them.
+
+    If someone else saved first, nothing is written and the page reruns
+    with the current row and a conflict message.
+    """
+    original = st.session_state.pop(f"editing_{form}")[1]
+    changes = {c: v for c, v in values.items() if _edit_value(v) != _edit_value(original.get(c))}
+    if not update_row(table, key_column, key, int(original["Row_Version"]), changes):
+        st.session_state[f"conflict_{form}"] = True
+        st.rerun()
+    return changes
 
 # ---------------- Admin Food Listings ----------------
 def admin_food_listings():
@@ -143,17 +232,16 @@ def admin_food_listings():
 
     # Edit existing
     st.divider()
-    df = run_query("SELECT Food_ID, Food_Name FROM food_listings ORDER BY Food_ID DESC;")
+    df = cached_query("SELECT Food_ID, Food_Name FROM food_listings ORDER BY Food_ID DESC;")
     if not df.empty:
-        chosen = st.selectbox("Choose listing to edit", df['Food_ID'].astype(str).tolist())
+        chosen = st.selectbox("Choose listing to edit", df['Food_ID'].dropna().astype(str).tolist())
         if chosen:
-            # Convert chosen to int, handling float values from database
-            food_id = int(float(chosen))
-            rec = run_query("SELECT * FROM food_listings WHERE Food_ID = ?", (food_id,)).iloc[0]
+            food_id = int(chosen)
+            rec = load_for_edit("edit_food", "food_listings", "Food_ID", food_id)
             with st.form("edit_food"):
                 name = st.text_input("Food Name", value=rec['Food_Name'])
                 qty = st.number_input("Quantity", min_value=0, value=int(rec['Quantity']))
-                expiry = st.date_input("Expiry Date", value=pd.to_datetime(rec['Expiry_Date']).date() if rec['Expiry_Date'] else None)
+                expiry = st.date_input("Expiry Date", value=rec['Expiry_Date'].date() if pd.notna(rec['Expiry_Date']) else None)
                 provider_id = st.text_input("Provider_ID", value=str(rec['Provider_ID']))
                 provider_type = st.text_input("Provider Type", value=rec.get('Provider_Type', ''))
                 location = st.text_input("Location", value=rec.get('Location', ''))
@@ -161,13 +249,17 @@ def admin_food_listings():
                 meal_type = st.text_input("Meal Type", value=rec.get('Meal_Type', ''))
                 submit_edit = st.form_submit_button("Save changes")
                 if submit_edit:
-                    upd_q = """UPDATE food_listings SET Food_Name=?, Quantity=?, Expiry_Date=?,
-                               Provider_ID=?, Provider_Type=?, Location=?, Food_Type=?, Meal_Type=?
-                               WHERE Food_ID=?;"""
-                    run_commit(upd_q, (name, int(qty), expiry.strftime("%Y-%m-%d"), int(provider_id),
-                                       provider_type, location, food_type, meal_type, food_id))
-                    log_activity("Edit", "food_listings", food_id, f"Updated food listing: {name} ({qty} servings, {food_type})")
-                    st.success("Listing updated.")
+                    # Saving makes an expired listing available again; the sweeper re-expires it if the date has passed
+                    changes = save_edit("edit_food", "food_listings", "Food_ID", food_id, {
+                        "Food_Name": name, "Quantity": int(qty), "Expiry_Date": expiry.strftime("%Y-%m-%d"),
+                        "Provider_ID": int(provider_id), "Provider_Type": provider_type, "Location": location,
+                        "Food_Type": food_type, "Meal_Type": meal_type, "Listing_Status": "Available",
+                    })
+                    if changes:
+                        log_activity("Edit", "food_listings", food_id, f"Updated food listing: {name} ({', '.join(changes)})")
+                        st.success("Listing updated.")
+                    else:
+                        st.info("No changes to save.")
 
     # Delete
     st.divider()
@@ -180,8 +272,8 @@ def admin_food_listings():
                 details = listing_details.iloc[0]
                 log_activity("Delete", "food_listings", int(del_id), f"Deleted food listing: {details['Food_Name']} ({details['Quantity']} servings, {details['Food_Type']})")
             
-            run_commit("DELETE FROM food_listings WHERE Food_ID = ?", (int(del_id),))
-            st.success(f"Deleted listing {del_id}.")
+            cascade.delete("food_listings", int(del_id))
+            st.success(f"Deleted listing {del_id} and its claims.")
 
 # ---------------- Provider Portal ----------------
 def provider_portal():
@@ -205,23 +297,127 @@ def provider_portal():
         my_listings = run_query("SELECT * FROM food_listings WHERE Provider_ID = ?", (pid,))
         st.dataframe(my_listings)
         if not my_listings.empty:
-            sel = st.selectbox("Select your Food_ID to edit/delete", my_listings['Food_ID'].astype(str).tolist())
-            # Convert sel to int, handling float values from database
-            food_id = int(float(sel))
-            rec = my_listings[my_listings['Food_ID'] == food_id].iloc[0]
+            sel = st.selectbox("Select your Food_ID to edit/delete", my_listings['Food_ID'].dropna().astype(str).tolist())
+            food_id = int(sel)
+            rec = load_for_edit("provider_edit", "food_listings", "Food_ID", food_id)
             with st.form("provider_edit"):
                 name = st.text_input("Food Name", value=rec['Food_Name'])
                 qty = st.number_input("Quantity", value=int(rec['Quantity']), min_value=0)
-                expiry = st.date_input("Expiry Date", value=pd.to_datetime(rec['Expiry_Date']).date() if rec['Expiry_Date'] else None)
+                expiry = st.date_input("Expiry Date", value=rec['Expiry_Date'].date() if pd.notna(rec['Expiry_Date']) else None)
                 submit = st.form_submit_button("Save")
                 if submit:
-                    run_commit("""UPDATE food_listings SET Food_Name=?, Quantity=?, Expiry_Date=? WHERE Food_ID=?""",
-                               (name, int(qty), expiry.strftime("%Y-%m-%d"), food_id))
-                    st.success("Updated listing.")
+                    changes = save_edit("provider_edit", "food_listings", "Food_ID", food_id, {
+                        "Food_Name": name, "Quantity": int(qty), "Expiry_Date": expiry.strftime("%Y-%m-%d"),
+                        "Listing_Status": "Available",
+                    })
+                    st.success("Updated listing." if changes else "No changes to save.")
             if st.button("Delete selected listing"):
-                run_commit("DELETE FROM food_listings WHERE Food_ID = ?", (food_id,))
+                cascade.delete("food_listings", food_id)
                 st.success("Listing deleted.")
 
+        provider_claims_panel(pid)
+
+# Provider bulk actions: button label -> target state
+CLAIM_ACTIONS = {"Approve": workflow.APPROVED, "Mark collected": workflow.COMPLETED, "Cancel": workflow.CANCELLED}
+
+def provider_claims_panel(pid):
+    """Pending and approved claims on the provider's listings, moved in bulk"""
+    st.subheader("Claims on your listings")
+    result = st.session_state.pop("provider_claims_result", None)
+    if result:
+        st.success(result)
+    claims = workflow.provider_claims(pid)
+    if claims.empty:
+        st.info("No pending or approved claims.")
+        return
+    st.dataframe(claims, use_container_width=True)
+    chosen = st.multiselect("Claims to update", claims["Claim_ID"].dropna().astype(int).tolist())
+    cols = st.columns(len(CLAIM_ACTIONS) + 1)
+    for col, (label, state) in zip(cols, CLAIM_ACTIONS.items()):
+        if col.button(label, disabled=not chosen):
+            _finish_claim_action(pid, label, workflow.transition(chosen, state, provider_id=pid))
+    if cols[-1].button("Approve all pending"):
+        _finish_claim_action(pid, "Approve", workflow.approve_all(pid))
+    claim_history(claims, "provider")
+
+def claim_history(claims, key):
+    """State changes of one of the listed claims"""
+    with st.expander("Claim history"):
+        claim_id = st.selectbox("Claim", claims["Claim_ID"].dropna().astype(int).tolist(), key=f"history_{key}")
+        changes = workflow.history(claim_id)
+        if changes.empty:
+            st.info("No state changes yet.")
+        else:
+            st.dataframe(changes, use_container_width=True)
+
+def _finish_claim_action(pid, label, result):
+    """Log a bulk claim action and rerun so the table shows the new states"""
+    log_activity("Edit", "claims", "-", f"{label}: {result['moved']} claims for provider {pid}", user_type="Provider")
+    skipped = f"; {result['skipped']} were no longer open" if result["skipped"] else ""
+    st.session_state["provider_claims_result"] = f"{label}: {result['moved']} claims updated{skipped}."
+    st.rerun()
+
+# ---------------- Receiver Portal ----------------
+RECEIVER_CLAIM_LISTS = {"Active claims": workflow.OPEN, "Past claims": workflow.CLOSED}
+
+def receiver_portal():
+    st.header("Receiver Portal")
+    st.markdown("Track your claims")
+
+    receiver_id = st.text_input("Receiver ID")
+    contact = st.text_input("Receiver Contact (for verification)")
+
+    if st.button("Login as Receiver"):
+        df = run_query("SELECT * FROM receivers WHERE Receiver_ID = ? AND Contact = ?", (receiver_id, contact))
+        if df.empty:
+            st.error("Invalid Receiver ID or contact.")
+            return
+        st.success(f"Logged in as {df.iloc[0]['Name']}")
+        st.session_state['receiver_id'] = int(receiver_id)
+        for title in RECEIVER_CLAIM_LISTS:
+            st.session_state.pop(f"receiver_pages_{title}", None)
+
+    if st.session_state.get('receiver_id'):
+        rid = st.session_state['receiver_id']
+        result = st.session_state.pop("receiver_claims_result", None)
+        if result:
+            st.success(result)
+        summary = workflow.receiver_summary(rid)
+        names = list(workflow.STATES) + ["Archived"]
+        for col, name in zip(st.columns(len(names)), names):
+            col.metric(name, f"{summary[name]:,}")
+        for title, states in RECEIVER_CLAIM_LISTS.items():
+            receiver_claims_page(rid, title, states)
+
+def receiver_claims_page(rid, title, states):
+    """One page of the receiver's claims; the session keeps the cursor of each page shown so far"""
+    st.subheader(title)
+    cursors = st.session_state.setdefault(f"receiver_pages_{title}", [None])
+    page, next_after = workflow.receiver_claims(rid, states, cursors[-1])
+    if page.empty and len(cursors) == 1:
+        st.info("No claims.")
+        return
+    st.dataframe(page, use_container_width=True)
+    prev_col, page_col, next_col = st.columns(3)
+    page_col.caption(f"Page {len(cursors)}")
+    if prev_col.button("Previous", key=f"prev_{title}", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if next_col.button("Next", key=f"next_{title}", disabled=next_after is None):
+        cursors.append(next_after)
+        st.rerun()
+    if not page.empty:
+        claim_history(page, title)
+    if states == workflow.OPEN:
+        chosen = st.multiselect("Claims to cancel", page["Claim_ID"].dropna().astype(int).tolist())
+        if st.button("Cancel selected claims", disabled=not chosen):
+            result = workflow.transition(chosen, workflow.CANCELLED, receiver_id=rid)
+            log_activity("Edit", "claims", "-", f"Cancel: {result['moved']} claims by receiver {rid}", user_type="Receiver")
+            skipped = f"; {result['skipped']} were no longer open" if result["skipped"] else ""
+            st.session_state["receiver_claims_result"] = f"Cancelled {result['moved']} claims{skipped}."
+            st.session_state.pop(f"receiver_pages_{title}", None)
+            st.rerun()
+
 # ---------------- Admin Providers ----------------
 def admin_providers():
     st.header("Providers Management")
@@ -242,13 +438,12 @@ def admin_providers():
                 st.success("Provider added.")
 
     st.divider()
-    df = run_query("SELECT Provider_ID, Name FROM providers ORDER BY Provider_ID DESC;")
+    df = cached_query("SELECT Provider_ID, Name FROM providers ORDER BY Provider_ID DESC;")
     if not df.empty:
-        chosen = st.selectbox("Choose provider to edit", df['Provider_ID'].astype(str).tolist())
+        chosen = st.selectbox("Choose provider to edit", df['Provider_ID'].dropna().astype(str).tolist())
         if chosen:
-            # Convert chosen to int, handling float values from database
-            provider_id = int(float(chosen))
-            rec = run_query("SELECT * FROM providers WHERE Provider_ID = ?", (provider_id,)).iloc[0]
+            provider_id = int(chosen)
+            rec = load_for_edit("edit_provider", "providers", "Provider_ID", provider_id)
             with st.form("edit_provider"):
                 name = st.text_input("Provider Name", value=rec['Name'])
                 ptype = st.text_input("Type", value=rec['Type'])
@@ -257,10 +452,14 @@ def admin_providers():
                 contact = st.text_input("Contact", value=rec['Contact'])
                 submit_edit = st.form_submit_button("Save changes")
                 if submit_edit:
-                    upd_q = """UPDATE providers SET Name=?, Type=?, Address=?, City=?, Contact=? WHERE Provider_ID=?;"""
-                    run_commit(upd_q, (name, ptype, address, city, contact, provider_id))
-                    log_activity("Edit", "providers", provider_id, f"Updated provider: {name} ({ptype}) in {city}")
-                    st.success("Provider updated.")
+                    changes = save_edit("edit_provider", "providers", "Provider_ID", provider_id, {
+                        "Name": name, "Type": ptype, "Address": address, "City": city, "Contact": contact,
+                    })
+                    if changes:
+                        log_activity("Edit", "providers", provider_id, f"Updated provider: {name} ({', '.join(changes)})")
+                        st.success("Provider updated.")
+                    else:
+                        st.info("No changes to save.")
 
     st.divider()
     del_id = st.number_input("Enter Provider_ID to delete", min_value=0, value=0)
@@ -272,8 +471,8 @@ def admin_providers():
                 details = provider_details.iloc[0]
                 log_activity("Delete", "providers", int(del_id), f"Deleted provider: {details['Name']} ({details['Type']}) in {details['City']}")
             
-            run_commit("DELETE FROM providers WHERE Provider_ID = ?", (int(del_id),))
-            st.success(f"Deleted provider {del_id}.")
+            cascade.delete("providers", int(del_id))
+            st.success(f"Deleted provider {del_id} and their listings and claims.")
 
 # ---------------- Admin Receivers ----------------
 def admin_receivers():
@@ -294,13 +493,12 @@ def admin_receivers():
                 st.success("Receiver added.")
 
     st.divider()
-    df = run_query("SELECT Receiver_ID, Name FROM receivers ORDER BY Receiver_ID DESC;")
+    df = cached_query("SELECT Receiver_ID, Name FROM receivers ORDER BY Receiver_ID DESC;")
     if not df.empty:
-        chosen = st.selectbox("Choose receiver to edit", df['Receiver_ID'].astype(str).tolist())
+        chosen = st.selectbox("Choose receiver to edit", df['Receiver_ID'].dropna().astype(str).tolist())
         if chosen:
-            # Convert chosen to int, handling float values from database
-            receiver_id = int(float(chosen))
-            rec = run_query("SELECT * FROM receivers WHERE Receiver_ID = ?", (receiver_id,)).iloc[0]
+            receiver_id = int(chosen)
+            rec = load_for_edit("edit_receiver", "receivers", "Receiver_ID", receiver_id)
             with st.form("edit_receiver"):
                 name = st.text_input("Receiver Name", value=rec['Name'])
                 rtype = st.text_input("Type", value=rec['Type'])
@@ -308,10 +506,14 @@ def admin_receivers():
                 contact = st.text_input("Contact", value=rec['Contact'])
                 submit_edit = st.form_submit_button("Save changes")
                 if submit_edit:
-                    upd_q = """UPDATE receivers SET Name=?, Type=?, City=?, Contact=? WHERE Receiver_ID=?;"""
-                    run_commit(upd_q, (name, rtype, city, contact, receiver_id))
-                    log_activity("Edit", "receivers", receiver_id, f"Updated receiver: {name} ({rtype}) in {city}")
-                    st.success("Receiver updated.")
+                    changes = save_edit("edit_receiver", "receivers", "Receiver_ID", receiver_id, {
+                        "Name": name, "Type": rtype, "City": city, "Contact": contact,
+                    })
+                    if changes:
+                        log_activity("Edit", "receivers", receiver_id, f"Updated receiver: {name} ({', '.join(changes)})")
+                        st.success("Receiver updated.")
+                    else:
+                        st.info("No changes to save.")
 
     st.divider()
     del_id = st.number_input("Enter Receiver_ID to delete", min_value=0, value=0)
@@ -323,8 +525,8 @@ def admin_receivers():
                 details = receiver_details.iloc[0]
                 log_activity("Delete", "receivers", int(del_id), f"Deleted receiver: {details['Name']} ({details['Type']}) in {details['City']}")
             
-            run_commit("DELETE FROM receivers WHERE Receiver_ID = ?", (int(del_id),))
-            st.success(f"Deleted receiver {del_id}.")
+            cascade.delete("receivers", int(del_id))
+            st.success(f"Deleted receiver {del_id} and their claims.")
 
 # ---------------- Activity History ----------------
 def log_activity(action_type, table_name, record_id, details, user_type="Admin"):
@@ -336,14 +538,9 @@ def log_activity(action_type, table_name, record_id, details, user_type="Admin")
     if 'activity_history' not in st.session_state:
         st.session_state['activity_history'] = []
     
-    st.session_state['activity_history'].append({
-        'timestamp': timestamp,
-        'user_type': user_type,
-        'action': action_type,
-        'table': table_name,
-        'record_id': record_id,
-        'details': details
-    })
+    st.session_state['activity_history'].append(
+        ActivityRecord(timestamp, user_type, action_type, table_name, record_id, details)
+    )
 
 def activity_history_page():
     st.header("Activity History")
@@ -370,27 +567,27 @@ def activity_history_page():
         
         # Apply filters
         if action_filter != "All":
-            activities = [a for a in activities if a['action'] == action_filter]
+            activities = [a for a in activities if a.action == action_filter]
         if table_filter != "All":
-            activities = [a for a in activities if a['table'] == table_filter]
+            activities = [a for a in activities if a.table == table_filter]
         if user_filter != "All":
-            activities = [a for a in activities if a['user_type'] == user_filter]
+            activities = [a for a in activities if a.user_type == user_filter]
         
         # Display activities in a nice format
         if activities:
             st.subheader(f"Showing {len(activities)} activities")
             
             for activity in reversed(activities):  # Show newest first
-                action_class = activity['action'].lower()
-                with st.expander(f"{activity['action']} - {activity['table']} (ID: {activity['record_id']})"):
-                    st.write(f"**User Type:** {activity['user_type']}")
-                    st.write(f"**Table:** {activity['table']}")
-                    st.write(f"**Record ID:** {activity['record_id']}")
-                    st.write(f"**Details:** {activity['details']}")
+                action_class = activity.action.lower()
+                with st.expander(f"{activity.action} - {activity.table} (ID: {activity.record_id})"):
+                    st.write(f"**User Type:** {activity.user_type}")
+                    st.write(f"**Table:** {activity.table}")
+                    st.write(f"**Record ID:** {activity.record_id}")
+                    st.write(f"**Details:** {activity.details}")
                     
-                    if activity['action'] == 'Add':
+                    if activity.action == 'Add':
                         st.success("✅ New record created")
-                    elif activity['action'] == 'Edit':
+                    elif activity.action == 'Edit':
                         st.info("✏️ Record updated")
                     else:
                         st.error("��️ Record deleted")
@@ -409,7 +606,7 @@ def activity_history_page():
                 csv_data = io.StringIO()
                 csv_data.write("Timestamp,User Type,Action,Table,Record ID,Details\n")
                 for activity in activities:
-                    csv_data.write(f"{activity['timestamp']},{activity['user_type']},{activity['action']},{activity['table']},{activity['record_id']},{activity['details']}\n")
+                    csv_data.write(f"{activity.timestamp},{activity.user_type},{activity.action},{activity.table},{activity.record_id},{activity.details}\n")
                 
                 st.download_button(
                     label="Download CSV",
@@ -421,44 +618,326 @@ def activity_history_page():
             st.info("No activity history available yet. Activities will appear here as you use the system.")
 
 # ---------------- Analytics ----------------
-ANALYTICS_QUERIES = {
-    "Provider count per city": "SELECT City, COUNT(*) AS provider_count FROM providers GROUP BY City ORDER BY provider_count DESC;",
-    "Receiver count per city": "SELECT City, COUNT(*) AS receiver_count FROM receivers GROUP BY City;",
-    "Most contributing provider type": """SELECT p.Type AS provider_type, SUM(f.Quantity) AS total_qty
-                                         FROM providers p JOIN food_listings f ON p.Provider_ID=f.Provider_ID
-                                         GROUP BY p.Type ORDER BY total_qty DESC LIMIT 10;""",
-    "Total available food quantity": "SELECT SUM(Quantity) AS total_available FROM food_listings;",
-    "City with most listings": "SELECT Location AS city, COUNT(*) AS listings FROM food_listings GROUP BY Location ORDER BY listings DESC LIMIT 10;",
-    "Most common food types": "SELECT Food_Type, COUNT(*) AS freq FROM food_listings GROUP BY Food_Type ORDER BY freq DESC LIMIT 10;",
-    "Claims per food item": "SELECT f.Food_ID, f.Food_Name, COUNT(c.Claim_ID) AS claim_count FROM food_listings f LEFT JOIN claims c ON f.Food_ID=c.Food_ID GROUP BY f.Food_ID ORDER BY claim_count DESC LIMIT 20;",
-    "Provider with most completed claims": "SELECT p.Provider_ID, p.Name, COUNT(c.Claim_ID) AS completed_claims FROM providers p JOIN food_listings f ON p.Provider_ID=f.Provider_ID JOIN claims c ON f.Food_ID=c.Food_ID WHERE c.Status='Completed' GROUP BY p.Provider_ID ORDER BY completed_claims DESC LIMIT 10;",
-    "Claim status percent": "SELECT Status, COUNT(*)*100.0/(SELECT COUNT(*) FROM claims) AS percent FROM claims GROUP BY Status;",
-    "Avg quantity claimed per receiver": "SELECT c.Receiver_ID, r.Name, AVG(f.Quantity) AS avg_quantity FROM claims c JOIN food_listings f ON c.Food_ID=f.Food_ID JOIN receivers r ON c.Receiver_ID=r.Receiver_ID GROUP BY c.Receiver_ID ORDER BY avg_quantity DESC LIMIT 20;",
-    "Most claimed meal type": "SELECT f.Meal_Type, COUNT(c.Claim_ID) AS times_claimed FROM food_listings f JOIN claims c ON f.Food_ID=c.Food_ID GROUP BY f.Meal_Type ORDER BY times_claimed DESC;",
-    "Total quantity donated by provider": "SELECT p.Provider_ID, p.Name, SUM(f.Quantity) AS total_donated FROM providers p JOIN food_listings f ON p.Provider_ID=f.Provider_ID GROUP BY p.Provider_ID ORDER BY total_donated DESC LIMIT 20;",
-    "Listings near expiry (next 2 days)": "SELECT * FROM food_listings WHERE Expiry_Date BETWEEN date('now') AND date('now','+2 day') ORDER BY Expiry_Date ASC;",
-    "Top locations by quantity": "SELECT Location, SUM(Quantity) AS total_qty FROM food_listings GROUP BY Location ORDER BY total_qty DESC LIMIT 10;",
-    "Receivers with most claims": "SELECT r.Receiver_ID, r.Name, COUNT(c.Claim_ID) AS num_claims FROM receivers r JOIN claims c ON r.Receiver_ID=c.Receiver_ID GROUP BY r.Receiver_ID ORDER BY num_claims DESC LIMIT 20;"
-}
 
 def analytics_page():
     st.header("Analytics Dashboard")
     st.markdown("View system statistics and insights to track food waste reduction")
-    
+
+    claim_states_panel()
+    claim_trends_panel()
+    demand_forecast_panel()
+    approximate = st.toggle("Approximate mode", help="Answer claim counts from sketches kept in memory instead of scanning claims")
+    if approximate:
+        approximate_panel()
     for title, q in ANALYTICS_QUERIES.items():
-        with st.expander(title):
-            df = run_query(q)
-            st.write(df)
-            if not df.empty and df.shape[1] >= 2:
-                col2 = df.columns[1]
-                if pd.api.types.is_numeric_dtype(df[col2]):
-                    try:
-                        chart_df = df.set_index(df.columns[0])[col2]
-                        st.bar_chart(chart_df)
-                    except Exception:
-                        pass
+        if not (approximate and title in APPROXIMATE_PANELS):
+            analytics_panel(title, q)
+    reports_panel()
+
+@page_fragment("Analytics", "reports")
+def reports_panel():
+    """Precomputed results of the notebook queries, by version"""
+    st.subheader("Reports")
+    titles = {r.title: r.name for r in reports.REPORTS.values()}
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        name = titles[st.selectbox("Report", list(titles))]
+    history = reports.versions(name)
+    with col2:
+        version = st.selectbox("Version", history["version"].tolist(), disabled=history.empty)
+    loaded = reports.load_result(name, version)
+    if loaded is None:
+        error = history["error"].iloc[0] if not history.empty else None
+        st.info(f"Last run failed: {error}" if error else "Not run yet.")
+    else:
+        df, created_at = loaded
+        st.dataframe(df, use_container_width=True)
+        st.caption(f"Computed {created_at}")
+        st.download_button("Download CSV", df.to_csv(index=False), file_name=f"{name}_v{version}.csv", mime="text/csv")
+    st.button("Run all reports now", on_click=reports.run_reports)
+
+# Panels answered from claim_sketches in approximate mode
+APPROXIMATE_PANELS = ("Receivers with most claims", "Claims per food item")
+
+@page_fragment("Analytics", "approximate")
+def approximate_panel():
+    """Distinct counts and top-N claim panels from HyperLogLog and Count-Min sketches"""
+    summary = claim_sketches.summary()
+    spread = 2 * summary["relative_error"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Claims counted", f"{summary['claims']:,}")
+    col2.metric("Distinct receivers", f"≈ {summary['distinct_receivers']:,.0f}",
+                help=f"± {summary['distinct_receivers'] * spread:,.0f} (95%)")
+    col3.metric("Distinct food items claimed", f"≈ {summary['distinct_foods']:,.0f}",
+                help=f"± {summary['distinct_foods'] * spread:,.0f} (95%)")
+
+    top, bound = claim_sketches.top_receivers(20)
+    names = _names("SELECT Receiver_ID AS id, Name FROM receivers WHERE Receiver_ID IN ({})", [k for k, _ in top])
+    with st.expander("Receivers with most claims (approximate)", expanded=True):
+        st.dataframe(pd.DataFrame({"Receiver_ID": [k for k, _ in top], "Name": [names.get(k) for k, _ in top],
+                                   "num_claims": [v for _, v in top]}), use_container_width=True)
+        st.caption(f"Counts may overstate by up to {bound:,.0f} claims ({1 - CMS_DELTA:.0%} confidence)")
+
+    top, bound = claim_sketches.top_foods(20)
+    names = _names("SELECT Food_ID AS id, Food_Name AS Name FROM food_listings WHERE Food_ID IN ({})", [k for k, _ in top])
+    with st.expander("Claims per food item (approximate)", expanded=True):
+        st.dataframe(pd.DataFrame({"Food_ID": [k for k, _ in top], "Food_Name": [names.get(k) for k, _ in top],
+                                   "claim_count": [v for _, v in top]}), use_container_width=True)
+        st.caption(f"Counts may overstate by up to {bound:,.0f} claims ({1 - CMS_DELTA:.0%} confidence)")
+
+    st.caption(f"Sketches built {summary['built_at']} and kept current from the change log, "
+               "including claims inserted by other workers.")
+    st.button("Rebuild sketches", on_click=claim_sketches.rebuild)
+
+def _names(query, ids):
+    """id -> Name for a handful of ids"""
+    if not ids:
+        return {}
+    df = run_query(query.format(",".join("?" * len(ids))), tuple(ids))
+    return dict(zip(df["id"].astype(int), df["Name"]))
+
+@page_fragment("Analytics", "trends")
+def claim_trends_panel():
+    """Claims over time from the daily rollups"""
+    st.subheader("Claim trends")
+    bounds = trends.day_range()
+    if bounds is None:
+        st.info("No claims recorded yet.")
+        return
+    first, last = bounds
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        picked = st.date_input("Date range", value=(max(first, last - pd.Timedelta(days=89)).date(), last.date()),
+                               min_value=first.date(), max_value=last.date())
+    with col2:
+        freq = st.radio("Granularity", list(trends.FREQUENCIES), horizontal=True)
+    with col3:
+        by = st.selectbox("Break down by", list(trends.DIMENSIONS))
+    if len(picked) != 2:
+        st.caption("Pick an end date.")
+        return
+    table = trends.claim_trend(pd.Timestamp(picked[0]), pd.Timestamp(picked[1]), by, freq)
+    if table.empty:
+        st.info("No claims in this range.")
+    else:
+        st.line_chart(table)
+
+@page_fragment("Analytics", "forecast")
+def demand_forecast_panel():
+    """Next-day claims per city, and where to send listings that expire soon"""
+    st.subheader("Demand forecast")
+    model = forecast.demand_forecaster
+    model.refresh()
+    col1, col2 = st.columns(2)
+    with col1:
+        meal = st.selectbox("Meal type", ["All"] + get_distinct_values("food_listings", "Meal_Type"), key="forecast_meal")
+    with col2:
+        food = st.selectbox("Food type", ["All"] + get_distinct_values("food_listings", "Food_Type"), key="forecast_food")
+    df, day = model.forecast(None if meal == "All" else meal, None if food == "All" else food)
+    if day is None:
+        st.info("No completed days of claims to learn from yet.")
+        return
+    by_city = df.groupby("Location")["Predicted_Claims"].sum().sort_values(ascending=False).head(10)
+    st.bar_chart(by_city)
+    st.caption(f"Predicted claims for {format_date(day)}, from claims up to {format_date(model.trained_through)}")
+
+    expiring = cached_query(
+        "SELECT Food_ID, Food_Name, Quantity, Expiry_Date, Location, Meal_Type, Food_Type FROM food_listings "
+        "WHERE Expiry_Date BETWEEN date('now') AND date('now','+2 day') ORDER BY Expiry_Date ASC"
+    )
+    with st.expander(f"Route expiring listings ({len(expiring)})"):
+        if expiring.empty:
+            st.write("No listings expire in the next 2 days.")
+        else:
+            expiring["Suggested_Cities"] = [", ".join(model.best_locations(m, f))
+                                            for m, f in zip(expiring["Meal_Type"], expiring["Food_Type"])]
+            st.dataframe(expiring, use_container_width=True)
+
+def claim_states_panel():
+    """Live claims per lifecycle state, from the trigger-maintained counters"""
+    cols = st.columns(len(workflow.CLAIM_STATES))
+    for col, (name, n) in zip(cols, workflow.counts().items()):
+        col.metric(f"{name} claims", f"{n:,}")
+
+@page_fragment("Analytics", "panel")
+def analytics_panel(title, q):
+    """One analytics expander; its Refresh button reruns only this panel and re-reads its query"""
+    with st.expander(title):
+        refresh = st.button("Refresh", key=f"refresh_{title}")
+        df = cached_query(q, replica=True, refresh=refresh)
+        st.write(df)
+        if not df.empty and df.shape[1] >= 2:
+            col2 = df.columns[1]
+            if pd.api.types.is_numeric_dtype(df[col2]):
+                try:
+                    chart_df = df.set_index(df.columns[0])[col2]
+                    st.bar_chart(chart_df)
+                except Exception:
+                    pass
+
+# ---------------- Admin Performance ----------------
+def performance_page():
+    st.header("Performance")
+    st.markdown("Query timings recorded by the profiler, grouped by page and statement")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        profiler.sample_rate = st.slider("Sampling rate", 0.0, 1.0, float(profiler.sample_rate), 0.05,
+                                         help="Fraction of statements timed. 0 turns profiling off.")
+    with col2:
+        profiler.slow_ms = st.number_input("Slow query threshold (ms)", min_value=0.0, value=float(profiler.slow_ms))
+    top_n = st.number_input("Show top N queries", min_value=1, max_value=100, value=10)
+
+    top = profiler.top_queries(int(top_n))
+    if top:
+        st.subheader("Top queries by total time")
+        st.dataframe(pd.DataFrame(top), use_container_width=True)
+    else:
+        st.info("No queries recorded yet. Raise the sampling rate and use the app.")
+
+    slow = profiler.recent_slow()
+    if slow:
+        st.subheader(f"Recent slow queries ({len(slow)})")
+        for entry in slow:
+            with st.expander(f"{entry['ms']} ms • {entry['page']} • {entry['rows']} rows"):
+                st.code(entry['sql'], language="sql")
+                st.text(entry['plan'])
+        st.caption(f"Slow queries are also written to {profiler.log_path}")
+
+    st.subheader("Rerun timings per page")
+    summary = render_metrics.page_summary()
+    if summary:
+        st.dataframe(pd.DataFrame(summary), use_container_width=True)
+        st.caption("setup = page config, CSS and sidebar • fetch = SQL • frame = DataFrame construction • render = widgets")
+    st.download_button("Download metrics (Prometheus text)", render_metrics.prometheus_text(),
+                       file_name="metrics.prom", mime="text/plain")
+
+    st.subheader("Shared cache")
+    cache_stats = shared_cache.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Entries", cache_stats["entries"])
+    col2.metric("Hits", cache_stats["hits"])
+    col3.metric("Misses", cache_stats["misses"])
+    col4.metric("Invalidations", cache_stats["invalidations"])
+    if cache_stats["generations"]:
+        st.caption("Table generations: " + ", ".join(f"{t}={g}" for t, g in sorted(cache_stats["generations"].items())))
+    if st.button("Clear shared cache"):
+        shared_cache.clear()
+
+    st.subheader("Claim archive")
+    days = st.number_input("Archive completed/cancelled claims older than (days)", min_value=0,
+                           value=archive.ARCHIVE_DAYS or 180)
+    if st.button("Archive now"):
+        moved = archive.archive_claims(int(days))
+        log_activity("Archive", "claims", "-", f"Archived {moved} claims older than {int(days)} days")
+        st.success(f"Archived {moved} claims.")
+    counts = archive.archive_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Live claims", int(counts["live_claims"]))
+    col2.metric("Archived claims", int(counts["archived_claims"]))
+    col3.metric("Monthly rollup rows", int(counts["rollup_rows"]))
+
+    st.subheader("Expiry sweeper")
+    if st.button("Sweep expired listings now"):
+        totals = sweeper.expiry_sweeper.run()
+        log_activity("Sweep", "food_listings", "-",
+                     f"Expired {totals['listings']} listings and cancelled {totals['claims']} pending claims")
+        st.success(f"Expired {totals['listings']} listings and cancelled {totals['claims']} pending claims.")
+    states = run_query("SELECT Listing_Status, COUNT(*) AS n FROM food_listings GROUP BY Listing_Status")
+    states = dict(zip(states["Listing_Status"].astype(str), states["n"]))
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Available listings", int(states.get("Available", 0)))
+    col2.metric("Expired listings", int(states.get("Expired", 0)))
+    col3.metric("Claims cancelled by sweeps", int(render_metrics.counter("food_sweeper_claims_cancelled_total")))
+    interval = f"every {sweeper.SWEEP_INTERVAL:g} s" if sweeper.SWEEP_INTERVAL > 0 else "on demand only"
+    st.caption(f"Runs {interval}; last run in this process: {sweeper.expiry_sweeper.last_run or 'never'}")
+
+    st.subheader("Change log")
+    if st.button("Prune change log"):
+        st.success(f"Pruned events up to #{max(cdc.prune(), 0)}.")
+    log = run_query("SELECT COUNT(*) AS retained, COALESCE(MAX(seq), 0) AS latest FROM change_events").iloc[0]
+    col1, col2 = st.columns(2)
+    col1.metric("Latest event", int(log["latest"]))
+    col2.metric("Retained events", int(log["retained"]))
+    readers = cdc.consumers()
+    if readers.empty:
+        st.caption("No named consumers; tail the log with `python cdc.py <name> --follow`.")
+    else:
+        st.dataframe(readers, use_container_width=True)
+
+    st.subheader("Cascading deletes")
+    col1, col2 = st.columns(2)
+    if col1.button("Finish pending deletes now"):
+        totals = cascade.compactor.run()
+        st.success(f"Compacted {totals['tombstones']} deletes: removed {totals['listings']} listings "
+                   f"and {totals['claims']} claims.")
+    if col2.button("Find orphaned rows"):
+        st.success(f"Found {cascade.find_orphans()} missing providers, receivers or listings; "
+                   "their rows are removed on the next compaction.")
+    waiting = cascade.pending()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Pending deletes", sum(waiting.values()))
+    col2.metric("Listings removed", int(render_metrics.counter("food_cascade_listings_deleted_total")))
+    col3.metric("Claims removed", int(render_metrics.counter("food_cascade_claims_deleted_total")))
+    every = (f"every {cascade.COMPACT_INTERVAL:g} s and after each delete" if cascade.COMPACT_INTERVAL > 0
+             else f"within each delete (up to {cascade.COMPACT_INLINE_BATCHES} batches) and on demand")
+    st.caption(f"Compaction runs {every}; last run in this process: {cascade.compactor.last_run or 'never'}")
+
+    st.subheader("Provider notifications")
+    if st.button("Send due notifications now"):
+        result = notifications.notification_worker.run_once()
+        st.success(f"Queued {result['queued']} claims; sent {result['sent']} digests, {result['failed']} failed.")
+    outbox = notifications.outbox_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Pending", int(outbox.get("pending", 0)))
+    col2.metric(f"Sent (last {notifications.SENT_RETENTION_DAYS} days)", int(outbox.get("sent", 0)))
+    col3.metric("Failed", int(outbox.get("failed", 0)))
+    col4.metric("Digests sent", int(render_metrics.counter("food_notification_digests_total")))
+    worker = notifications.notification_worker
+    every = f"every {worker.interval:g} s" if worker.interval > 0 else "on demand only"
+    st.caption(f"Sink: {notifications.NOTIFY_SINK}; dispatcher runs {every}, "
+               f"digests wait {notifications.DIGEST_SECONDS:g} s to collect further claims.")
+
+    st.subheader("Analytics replica")
+    if not replica.ENABLED:
+        st.caption("Analytics and report runs read the primary database; set FOOD_READ_REPLICA=1 to give them a snapshot.")
+    else:
+        if st.button("Refresh snapshot now"):
+            st.success(f"Snapshot refreshed in {replica.replica_refresher.run():.2f} s.")
+        source = replica.replica_backend
+        age = source.age_seconds()
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Snapshot age", "none yet" if age is None else f"{age:,.0f} s")
+        col2.metric("Last copy", "n/a" if source.last_seconds is None else f"{source.last_seconds:.2f} s")
+        col3.metric("Snapshots taken", int(render_metrics.counter("food_replica_refreshes_total")))
+        every = f"every {replica.REFRESH_INTERVAL:g} s" if replica.REFRESH_INTERVAL > 0 else "on demand only"
+        st.caption(f"{replica.REPLICA_PATH}, refreshed {every}; Analytics panels, claim trends and report runs read it.")
+
+    if st.button("Reset statistics"):
+        profiler.reset()
+        render_metrics.reset()
+        st.success("Profiler statistics cleared.")
+
+# ---------------- Theme ----------------
+THEME_CSS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "theme.css")
+
+@st.cache_resource
+def load_theme_css():
+    """Read and minify the theme once per process.
+
+    The result is byte-identical on every rerun, so Streamlit's message cache
+    sends it to each browser once and only a hash reference afterwards.
+    """
+    with open(THEME_CSS_PATH, encoding="utf-8") as f:
+        css = f.read()
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    return "<style>" + css.strip() + "</style>"
 
 # ---------------- Main App ----------------
+rerun = render_metrics.start_rerun()
+
 # Get current time and date first
 from datetime import datetime
 current_time = datetime.now().strftime("%H:%M:%S")
@@ -471,591 +950,38 @@ st.set_page_config(
     page_icon="🍽️"
 )
 
-# Custom CSS for dark theme with animations
-st.markdown("""
-<style>
-    /* Dark theme base styles */
-    .main .block-container {
-        background: #1a1a1a;
-        color: #ffffff;
-    }
-    
-    .stApp {
-        background: #1a1a1a;
-    }
-    
-         .main-header {
-         background: linear-gradient(135deg, #2d2d2d, #1a1a1a);
-         padding: 2rem;
-         border-radius: 12px;
-         border: 1px solid #404040;
-         margin-bottom: 2rem;
-         text-align: center;
-         box-shadow: 0 8px 32px rgba(0,0,0,0.3);
-         animation: slideInDown 0.6s ease-out;
-     }
-     
-     .notification-banner {
-         background: rgba(76, 175, 80, 0.1);
-         border: 1px solid rgba(76, 175, 80, 0.3);
-         border-radius: 8px;
-         padding: 0.75rem 1.5rem;
-         margin-top: 1rem;
-         display: inline-flex;
-         align-items: center;
-         gap: 0.5rem;
-         animation: fadeInUp 0.8s ease-out;
-     }
-     
-     .notification-icon {
-         font-size: 1.2rem;
-         animation: pulse 2s infinite;
-     }
-     
-     .notification-text {
-         color: #4CAF50;
-         font-size: 0.9rem;
-         font-weight: 500;
-     }
-    
-    .metric-card {
-        background: #2d2d2d;
-        padding: 1.5rem;
-        border-radius: 12px;
-        border: 1px solid #404040;
-        margin: 1rem 0;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.2);
-        transition: all 0.3s ease;
-        animation: fadeInUp 0.5s ease-out;
-    }
-    
-    .metric-card:hover {
-        transform: translateY(-5px);
-        box-shadow: 0 8px 30px rgba(0,0,0,0.4);
-        border-color: #666666;
-    }
-    
-    .info-box {
-        background: #2d2d2d;
-        border: 1px solid #404040;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin: 1rem 0;
-        transition: all 0.3s ease;
-        animation: fadeIn 0.6s ease-out;
-    }
-    
-    .info-box:hover {
-        border-color: #666666;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.3);
-    }
-    
-    .stButton > button {
-        background: linear-gradient(135deg, #4a90e2, #357abd);
-        color: white;
-        border: none;
-        border-radius: 8px;
-        padding: 0.75rem 2rem;
-        font-weight: 600;
-        transition: all 0.3s ease;
-        box-shadow: 0 4px 15px rgba(74, 144, 226, 0.3);
-        animation: pulse 2s infinite;
-    }
-    
-    .stButton > button:hover {
-        background: linear-gradient(135deg, #357abd, #2d5aa0);
-        transform: translateY(-3px);
-        box-shadow: 0 8px 25px rgba(74, 144, 226, 0.4);
-    }
-    
-    .stExpander {
-        border: 1px solid #404040;
-        border-radius: 12px;
-        margin: 1rem 0;
-        background: #2d2d2d;
-        transition: all 0.3s ease;
-        animation: slideInLeft 0.5s ease-out;
-    }
-    
-    .stExpander:hover {
-        border-color: #666666;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.3);
-    }
-    
-    .stExpander > div > div {
-        background: #2d2d2d;
-        border-radius: 12px;
-    }
-    
-    .stForm {
-        background: #2d2d2d;
-        padding: 2rem;
-        border-radius: 12px;
-        border: 1px solid #404040;
-        margin: 1rem 0;
-        box-shadow: 0 8px 32px rgba(0,0,0,0.3);
-        transition: all 0.3s ease;
-        animation: fadeInUp 0.6s ease-out;
-    }
-    
-    .stForm:hover {
-        border-color: #666666;
-        box-shadow: 0 12px 40px rgba(0,0,0,0.4);
-    }
-    
-    .stSelectbox > div > div {
-        border-radius: 8px;
-        border: 1px solid #404040;
-        background: #2d2d2d;
-        transition: all 0.3s ease;
-    }
-    
-    .stSelectbox > div > div:hover {
-        border-color: #4a90e2;
-        box-shadow: 0 0 0 2px rgba(74, 144, 226, 0.2);
-    }
-    
-    .stTextInput > div > div > input {
-        border-radius: 8px;
-        border: 1px solid #404040;
-        background: #2d2d2d;
-        color: #ffffff;
-        transition: all 0.3s ease;
-    }
-    
-    .stTextInput > div > div > input:focus {
-        border-color: #4a90e2;
-        box-shadow: 0 0 0 2px rgba(74, 144, 226, 0.2);
-    }
-    
-    .stNumberInput > div > div > input {
-        border-radius: 8px;
-        border: 1px solid #404040;
-        background: #2d2d2d;
-        color: #ffffff;
-        transition: all 0.3s ease;
-    }
-    
-    .stNumberInput > div > div > input:focus {
-        border-color: #4a90e2;
-        box-shadow: 0 0 0 2px rgba(74, 144, 226, 0.2);
-    }
-    
-    .stDateInput > div > div > input {
-        border-radius: 8px;
-        border: 1px solid #404040;
-        background: #2d2d2d;
-        color: #ffffff;
-        transition: all 0.3s ease;
-    }
-    
-    .stDateInput > div > div > input:focus {
-        border-color: #4a90e2;
-        box-shadow: 0 0 0 2px rgba(74, 144, 226, 0.2);
-    }
-    
-    .stTextArea > div > div > textarea {
-        border-radius: 8px;
-        border: 1px solid #404040;
-        background: #2d2d2d;
-        color: #ffffff;
-        transition: all 0.3s ease;
-    }
-    
-    .stTextArea > div > div > textarea:focus {
-        border-color: #4a90e2;
-        box-shadow: 0 0 0 2px rgba(74, 144, 226, 0.2);
-    }
-    
-    .stDataFrame {
-        border-radius: 12px;
-        overflow: hidden;
-        background: #2d2d2d;
-        border: 1px solid #404040;
-        animation: fadeIn 0.8s ease-out;
-    }
-    
-    .stDataFrame:hover {
-        border-color: #666666;
-        box-shadow: 0 4px 20px rgba(0,0,0,0.3);
-    }
-    
-    h1, h2, h3 {
-        color: #ffffff;
-        font-weight: 600;
-        text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-    }
-    
-    .stMarkdown {
-        color: #e0e0e0;
-    }
-    
-         /* Enhanced Sidebar styling */
-     .css-1d391kg {
-         background: #1a1a1a;
-     }
-     
-     .css-1lcbmhc {
-         background: linear-gradient(180deg, #2d2d2d 0%, #1a1a1a 100%);
-         border-right: 1px solid #404040;
-         padding: 1rem;
-     }
-     
-     /* Sidebar Header */
-     .sidebar-header {
-         text-align: center;
-         padding: 1.5rem 0;
-         border-bottom: 1px solid #404040;
-         margin-bottom: 1.5rem;
-         animation: fadeInDown 0.6s ease-out;
-     }
-     
-     .sidebar-header h2 {
-         color: #ffffff;
-         margin: 0;
-         font-size: 1.5rem;
-         font-weight: 700;
-         text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-     }
-     
-     .sidebar-subtitle {
-         color: #4a90e2;
-         font-size: 0.9rem;
-         margin-top: 0.5rem;
-         font-weight: 500;
-     }
-     
-     /* Sidebar Stats */
-     .sidebar-stats {
-         margin-bottom: 2rem;
-     }
-     
-     .stat-item {
-         display: flex;
-         align-items: center;
-         padding: 1rem;
-         margin-bottom: 0.75rem;
-         background: rgba(74, 144, 226, 0.1);
-         border: 1px solid rgba(74, 144, 226, 0.2);
-         border-radius: 10px;
-         transition: all 0.3s ease;
-         animation: slideInLeft 0.5s ease-out;
-     }
-     
-     .stat-item:hover {
-         background: rgba(74, 144, 226, 0.15);
-         border-color: rgba(74, 144, 226, 0.3);
-         transform: translateX(5px);
-     }
-     
-     .stat-icon {
-         font-size: 1.5rem;
-         margin-right: 1rem;
-         width: 40px;
-         text-align: center;
-     }
-     
-     .stat-content {
-         flex: 1;
-     }
-     
-     .stat-label {
-         color: #a0a0a0;
-         font-size: 0.8rem;
-         font-weight: 500;
-         margin-bottom: 0.25rem;
-     }
-     
-     .stat-value {
-         color: #ffffff;
-         font-size: 0.9rem;
-         font-weight: 600;
-     }
-     
-     /* Sidebar Sections */
-     .sidebar-section {
-         margin-bottom: 1.5rem;
-         padding-bottom: 1rem;
-         border-bottom: 1px solid #404040;
-     }
-     
-     .sidebar-section h4 {
-         color: #4a90e2;
-         font-size: 1rem;
-         margin-bottom: 1rem;
-         font-weight: 600;
-         text-transform: uppercase;
-         letter-spacing: 0.5px;
-     }
-     
-     .info-item {
-         display: flex;
-         justify-content: space-between;
-         align-items: center;
-         padding: 0.5rem 0;
-         margin-bottom: 0.5rem;
-     }
-     
-     .info-label {
-         color: #a0a0a0;
-         font-size: 0.85rem;
-     }
-     
-     .info-value {
-         color: #ffffff;
-         font-size: 0.85rem;
-         font-weight: 500;
-     }
-     
-     .status-active {
-         color: #4CAF50;
-         font-weight: 600;
-     }
-     
-     /* Sidebar Footer */
-     .sidebar-footer {
-         margin-top: auto;
-         padding-top: 1.5rem;
-         border-top: 1px solid #404040;
-         text-align: center;
-         animation: fadeInUp 0.6s ease-out;
-     }
-     
-     .creator-info {
-         margin-bottom: 1rem;
-     }
-     
-     .creator-name {
-         color: #ffffff;
-         font-size: 1rem;
-         font-weight: 600;
-         margin-bottom: 0.25rem;
-     }
-     
-     .creator-title {
-         color: #4a90e2;
-         font-size: 0.8rem;
-         font-weight: 500;
-     }
-     
-     .footer-divider {
-         height: 1px;
-         background: linear-gradient(90deg, transparent, #404040, transparent);
-         margin: 1rem 0;
-     }
-     
-     .footer-text {
-         color: #a0a0a0;
-         font-size: 0.75rem;
-         font-weight: 500;
-     }
-     
-     .time-display {
-         font-family: 'Courier New', monospace;
-         color: #4a90e2 !important;
-         font-weight: 600;
-     }
-     
-     /* Quick action buttons */
-     .quick-actions {
-         margin: 1rem 0;
-         padding: 1rem;
-         background: rgba(74, 144, 226, 0.05);
-         border: 1px solid rgba(74, 144, 226, 0.1);
-         border-radius: 10px;
-     }
-     
-     .quick-action-btn {
-         display: block;
-         width: 100%;
-         padding: 0.5rem;
-         margin: 0.25rem 0;
-         background: rgba(74, 144, 226, 0.1);
-         border: 1px solid rgba(74, 144, 226, 0.2);
-         border-radius: 6px;
-         color: #ffffff;
-         text-decoration: none;
-         text-align: center;
-         font-size: 0.85rem;
-         transition: all 0.3s ease;
-     }
-     
-     .quick-action-btn:hover {
-         background: rgba(74, 144, 226, 0.2);
-         border-color: rgba(74, 144, 226, 0.3);
-         transform: translateY(-1px);
-     }
-    
-    /* Animations */
-    @keyframes fadeIn {
-        from { opacity: 0; }
-        to { opacity: 1; }
-    }
-    
-    @keyframes fadeInUp {
-        from {
-            opacity: 0;
-            transform: translateY(30px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    @keyframes slideInDown {
-        from {
-            opacity: 0;
-            transform: translateY(-50px);
-        }
-        to {
-            opacity: 1;
-            transform: translateY(0);
-        }
-    }
-    
-    @keyframes slideInLeft {
-        from {
-            opacity: 0;
-            transform: translateX(-30px);
-        }
-        to {
-            opacity: 1;
-            transform: translateX(0);
-        }
-    }
-    
-    @keyframes pulse {
-        0% { transform: scale(1); }
-        50% { transform: scale(1.02); }
-        100% { transform: scale(1); }
-    }
-    
-    /* Success and error messages */
-    .stSuccess {
-        background: #1e3a1e;
-        border: 1px solid #4a7c59;
-        border-radius: 8px;
-        padding: 1rem;
-        margin: 1rem 0;
-        animation: slideInRight 0.5s ease-out;
-    }
-    
-    .stError {
-        background: #3a1e1e;
-        border: 1px solid #7c4a4a;
-        border-radius: 8px;
-        padding: 1rem;
-        margin: 1rem 0;
-        animation: slideInRight 0.5s ease-out;
-    }
-    
-    @keyframes slideInRight {
-        from {
-            opacity: 0;
-            transform: translateX(30px);
-        }
-        to {
-            opacity: 1;
-            transform: translateX(0);
-        }
-    }
-    
-    /* Loading animation */
-    .stSpinner {
-        animation: spin 1s linear infinite;
-    }
-    
-    @keyframes spin {
-        from { transform: rotate(0deg); }
-        to { transform: rotate(360deg); }
-    }
-    
-    /* Activity History Styling */
-    .activity-expander {
-        background: #2d2d2d;
-        border: 1px solid #404040;
-        border-radius: 12px;
-        margin: 0.5rem 0;
-        transition: all 0.3s ease;
-    }
-    
-    .activity-expander:hover {
-        border-color: #4a90e2;
-        box-shadow: 0 4px 20px rgba(74, 144, 226, 0.2);
-    }
-    
-    .activity-timestamp {
-        color: #4a90e2;
-        font-family: 'Courier New', monospace;
-        font-size: 0.85rem;
-        font-weight: 600;
-    }
-    
-    .activity-action {
-        display: inline-block;
-        padding: 0.25rem 0.75rem;
-        border-radius: 20px;
-        font-size: 0.8rem;
-        font-weight: 600;
-        text-transform: uppercase;
-        letter-spacing: 0.5px;
-    }
-    
-    .activity-action.add {
-        background: rgba(76, 175, 80, 0.2);
-        color: #4CAF50;
-        border: 1px solid rgba(76, 175, 80, 0.3);
-    }
-    
-    .activity-action.edit {
-        background: rgba(33, 150, 243, 0.2);
-        color: #2196F3;
-        border: 1px solid rgba(33, 150, 243, 0.3);
-    }
-    
-    .activity-action.delete {
-        background: rgba(244, 67, 54, 0.2);
-        color: #F44336;
-        border: 1px solid rgba(244, 67, 54, 0.3);
-    }
-    
-    .activity-details {
-        background: rgba(74, 144, 226, 0.05);
-        border: 1px solid rgba(74, 144, 226, 0.1);
-        border-radius: 8px;
-        padding: 1rem;
-        margin-top: 0.5rem;
-        font-family: 'Courier New', monospace;
-        font-size: 0.9rem;
-        color: #e0e0e0;
-    }
-    
-    .filter-section {
-        background: #2d2d2d;
-        border: 1px solid #404040;
-        border-radius: 12px;
-        padding: 1.5rem;
-        margin-bottom: 2rem;
-        animation: fadeInUp 0.6s ease-out;
-    }
-    
-    .export-section {
-        background: rgba(76, 175, 80, 0.1);
-        border: 1px solid rgba(76, 175, 80, 0.2);
-        border-radius: 10px;
-        padding: 1rem;
-        margin-top: 1rem;
-        text-align: center;
-    }
-</style>
-""", unsafe_allow_html=True)
+@st.cache_resource
+def init_db():
+    """Apply idempotent schema additions and start background jobs once per process"""
+    ensure_schema()
+    workflow.sync_states()
+    if trends.needs_backfill():
+        trends.rebuild_claim_trends()
+    if forecast.needs_backfill():
+        forecast.rebuild_demand()
+    if archive.ARCHIVE_DAYS:
+        archive.archive_claims()
+    cdc.prune()
+    reports.report_scheduler.start()
+    sweeper.expiry_sweeper.start()
+    notifications.notification_worker.start()
+    cascade.compactor.start()
+    replica.replica_refresher.start()
+
+init_db()
 
-# Main header with notifications
+# Custom CSS for dark theme with animations (assets/theme.css, read once per process)
+st.markdown(load_theme_css(), unsafe_allow_html=True)
+
+# Main header; static markup first so only the small status line changes between reruns
 st.markdown("""
 <div class="main-header">
     <h1>Local Food Wastage Management System</h1>
     <p>Connecting food providers with those in need • Reducing waste, one meal at a time</p>
+</div>
+""", unsafe_allow_html=True)
+st.markdown("""
+<div class="header-status">
     <div class="notification-banner">
         <span class="notification-icon">🔔</span>
         <span class="notification-text">System is running smoothly • Last updated: """ + current_time + """</span>
@@ -1071,6 +997,8 @@ PAGES = {
             <h3>Available Features:</h3>
             <ul>
                 <li><strong>Browse Listings:</strong> View and filter available food listings</li>
+                <li><strong>Provider Portal:</strong> Manage your listings and the claims on them</li>
+                <li><strong>Receiver Portal:</strong> Track and cancel your own claims</li>
                 <li><strong>Admin - Providers:</strong> Manage food providers</li>
                 <li><strong>Admin - Listings:</strong> Manage food listings</li>
                 <li><strong>Admin - Receivers:</strong> Manage food receivers</li>
@@ -1081,11 +1009,14 @@ PAGES = {
         </div>
     """, unsafe_allow_html=True),
     "Browse Listings": browse_listings,
+    "Provider Portal": provider_portal,
+    "Receiver Portal": receiver_portal,
     "Admin - Providers": admin_providers,
     "Admin - Listings": admin_food_listings,
     "Admin - Receivers": admin_receivers,
     "Analytics": analytics_page,
     "Activity History": activity_history_page,
+    "Admin - Performance": performance_page,
 }
 
 # Sidebar with enhanced styling
@@ -1145,7 +1076,7 @@ st.sidebar.markdown("""
 
 
 st.sidebar.markdown("""
-<div class="sidebar-section">
+<div class="sidebar-section sidebar-info">
     <h4>System Info</h4>
     <div class="info-item">
         <span class="info-label">Version:</span>
@@ -1155,6 +1086,11 @@ st.sidebar.markdown("""
         <span class="info-label">Status:</span>
         <span class="info-value status-active">Active</span>
     </div>
+</div>
+""", unsafe_allow_html=True)
+
+st.sidebar.markdown("""
+<div class="sidebar-clock">
     <div class="info-item">
         <span class="info-label">Date:</span>
         <span class="info-value">""" + current_date + """</span>
@@ -1177,5 +1113,10 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
-PAGES[choice]()
+rerun.lap("setup")
+profiler.set_page(choice)
+try:
+    PAGES[choice]()
+finally:
+    render_metrics.finish_rerun(choice)
 
@@ -0,0 +1,126 @@
+import os
+import time
+
+import pandas as pd
+
+from db import claim_day, run_many, run_query
+from shared_cache import shared_cache
+from storage import backend
+from workflow import ALL_RECEIVERS_TABLE
+
+# ---------------- Settings ----------------
+# Completed/cancelled claims older than this many days are archived at startup (0 = only from the Performance page).
+ARCHIVE_DAYS = int(os.environ.get("FOOD_ARCHIVE_DAYS", "0"))
+# Claims archived per transaction; each batch holds the write lock only briefly
+ARCHIVE_BATCH = int(os.environ.get("FOOD_ARCHIVE_BATCH", "500"))
+# Seconds to yield between batches so claim submissions get the lock
+BATCH_PAUSE = 0.01
+
+# Claim_Day is the claim's day whichever format its Timestamp was stored in; claims
+# without a readable one, or without a Claim_ID to re-check the delete by, stay live
+CANDIDATES_QUERY = f"""
+  SELECT c.{backend.row_key} AS Row_Key, c.Claim_ID, c.Food_ID, c.Receiver_ID, c.Status,
+         c.Timestamp AS Raw_Timestamp, {claim_day("c.Timestamp")} AS Claim_Day,
+         f.Provider_ID, f.Meal_Type, f.Quantity
+  FROM claims c
+  LEFT JOIN food_listings f ON c.Food_ID = f.Food_ID
+  WHERE c.Status IN ('Completed', 'Cancelled') AND {claim_day("c.Timestamp")} < ?
+    AND c.Claim_ID IS NOT NULL
+  LIMIT ?
+"""
+# A row key can point at another row by the time of the delete (ctids move on
+# UPDATE, VACUUM renumbers rowids), so the claim is matched again as it was read
+CLAIM_DELETE = f"DELETE FROM claims WHERE {backend.row_key_match} AND Claim_ID = ? AND Status = ?"
+ARCHIVE_INSERT = """
+  INSERT INTO claims_archive (Claim_ID, Food_ID, Receiver_ID, Status, Timestamp, claim_month)
+  VALUES (?, ?, ?, ?, ?, ?)
+"""
+ROLLUP_UPSERT = """
+  INSERT INTO claim_rollups (claim_month, status, provider_id, meal_type, claim_count)
+  VALUES (?, ?, ?, ?, ?)
+  ON CONFLICT (claim_month, status, provider_id, meal_type) DO UPDATE SET
+      claim_count = claim_rollups.claim_count + excluded.claim_count
+"""
+RECEIVER_ROLLUP_UPSERT = """
+  INSERT INTO receiver_claim_rollups (claim_month, status, receiver_id, claim_count, listed_count, quantity)
+  VALUES (?, ?, ?, ?, ?, ?)
+  ON CONFLICT (claim_month, status, receiver_id) DO UPDATE SET
+      claim_count = receiver_claim_rollups.claim_count + excluded.claim_count,
+      listed_count = receiver_claim_rollups.listed_count + excluded.listed_count,
+      quantity = receiver_claim_rollups.quantity + excluded.quantity
+"""
+
+
+def archive_claims(days=ARCHIVE_DAYS, now=None, batch=ARCHIVE_BATCH):
+    """Move completed/cancelled claims older than `days` into claims_archive.
+
+    Each archived claim is also added to the monthly rollups, so
+    analytics over the full history stay the same while the live claims
+    table only holds the working set. Works in batches of `batch` claims,
+    one short transaction each. Returns the number of claims moved.
+    """
+    cutoff = ((now or pd.Timestamp.now()) - pd.Timedelta(days=days)).strftime("%Y-%m-%d")
+    moved = 0
+    while True:
+        old = run_query(CANDIDATES_QUERY, (cutoff, batch)).drop_duplicates("Row_Key")
+        if old.empty:
+            break
+        deleted = _archive_batch(old)
+        moved += deleted
+        if deleted == 0:
+            # Every claim in the batch changed under us; the next run will see the new state
+            break
+        time.sleep(BATCH_PAUSE)
+    if moved:
+        shared_cache.invalidate(ALL_RECEIVERS_TABLE)
+    return moved
+
+
+def _archive_batch(old):
+    """Archive, roll up and delete one batch of candidate rows; returns the claims deleted"""
+    month = old["Claim_Day"].str.slice(0, 7)
+    archived = zip(_values(old["Claim_ID"]), _values(old["Food_ID"]), _values(old["Receiver_ID"]),
+                   _values(old["Status"]), _values(old["Raw_Timestamp"]), month)
+
+    claims = pd.DataFrame({
+        "claim_month": month,
+        "status": old["Status"].astype(str),
+        "provider_id": old["Provider_ID"],
+        "receiver_id": old["Receiver_ID"],
+        "meal_type": old["Meal_Type"].astype(object),
+        "quantity": old["Quantity"],
+    })
+    by_provider = claims.groupby(["claim_month", "status", "provider_id", "meal_type"], dropna=False).agg(
+        claim_count=("status", "size"),
+    )
+    by_receiver = claims.groupby(["claim_month", "status", "receiver_id"], dropna=False).agg(
+        claim_count=("status", "size"),
+        listed_count=("quantity", "count"),
+        quantity=("quantity", "sum"),
+    )
+
+    return run_many([
+        (ARCHIVE_INSERT, list(archived)),
+        (ROLLUP_UPSERT, _rows(by_provider)),
+        (RECEIVER_ROLLUP_UPSERT, _rows(by_receiver)),
+        (CLAIM_DELETE, list(zip(old["Row_Key"].tolist(), _values(old["Claim_ID"]), _values(old["Status"])))),
+    ])[3]
+
+
+def archive_stats():
+    """Row counts of the live and archived claims and the rollups"""
+    return run_query("""
+      SELECT (SELECT COUNT(*) FROM claims) AS live_claims,
+             (SELECT COUNT(*) FROM claims_archive) AS archived_claims,
+             (SELECT COUNT(*) FROM claim_rollups) + (SELECT COUNT(*) FROM receiver_claim_rollups) AS rollup_rows
+    """).iloc[0].to_dict()
+
+
+def _rows(totals):
+    totals = totals.reset_index()
+    return list(zip(*(_values(totals[col]) for col in totals.columns)))
+
+
+def _values(series):
+    """Plain Python values with None for missing, as the database drivers expect"""
+    return [None if pd.isna(v) else v.item() if hasattr(v, "item") else v for v in series.astype(object)]
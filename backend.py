@@ -11,11 +11,15 @@ Original file is located at
 
 # 🧰 Step 1: Import the tools we'll use
 # pandas  -> reading CSVs + data wrangling
-# sqlite3 -> create a lightweight SQL database (.db file)
+# storage -> the app's database backend (SQLite file by default, PostgreSQL via FOOD_DB_BACKEND)
 # os      -> build file paths safely
+# (run this from a checkout of the project so storage.py and db.py are importable)
 import pandas as pd
-import sqlite3
 import os
+from storage import backend
+from db import run_query, run_commit, ensure_schema
+import workflow, trends, forecast   # counters the claim reports read
+from reports import REPORTS   # SQL of queries 1-15; reports.py also runs them on a schedule
 print("✅ Libraries imported")
 
 """# Step 2 — Mount Google Drive + verify files"""
@@ -49,15 +53,22 @@ display(food_df.head(3))
 print(" Claims:")
 display(claims_df.head(3))
 
-#  Step 3B: Create a local SQLite database file and push the tables into it
-conn = sqlite3.connect("food_wastage.db")   # this creates food_wastage.db in your Colab working dir
-providers_df.to_sql("providers", conn, if_exists="replace", index=False)
-receivers_df.to_sql("receivers", conn, if_exists="replace", index=False)
-food_df.to_sql("food_listings", conn, if_exists="replace", index=False)
-claims_df.to_sql("claims", conn, if_exists="replace", index=False)
-print("✅ Tables created in SQLite: providers, receivers, food_listings, claims")
-
-#  Step 3C: ONE sample SQL query
+#  Step 3B: Push the tables into the configured database (food_wastage.db unless FOOD_DB_BACKEND says otherwise)
+backend.load_table(providers_df, "providers")
+backend.load_table(receivers_df, "receivers")
+backend.load_table(food_df, "food_listings")
+backend.load_table(claims_df, "claims")
+print(f"✅ Tables created in {backend.name}: providers, receivers, food_listings, claims")
+
+#  Step 3C: Rebuild what the app derives from these tables (as reports.py does before a run)
+# The reloaded claims replace the old ones, so the counters are recomputed rather than left as they were
+ensure_schema()
+workflow.sync_states(recount=True)
+trends.rebuild_claim_trends()
+forecast.rebuild_demand()
+print("✅ Claim states and daily counters rebuilt")
+
+#  Step 3D: ONE sample SQL query
 # Question: "How many providers are there in each city?"
 query = """
 SELECT City, COUNT(*) AS Num_Providers
@@ -65,39 +76,34 @@ FROM providers
 GROUP BY City
 ORDER BY Num_Providers DESC, City ASC;
 """
-result = pd.read_sql_query(query, conn)
+result = run_query(query)
 print("📍 Providers per city:")
 display(result)
 
-# (Optional) keep the connection open for next steps; we'll reuse it.
+# run_query / run_commit open pooled connections, so nothing needs to stay open.
 
 """# Step 4 — CRUD Operations Example"""
 
-# 🛠️ Step 4: CRUD Operations in SQLite
-
-cursor = conn.cursor()
+# 🛠️ Step 4: CRUD Operations
 
 # 1️⃣ CREATE — Add a new food listing
-cursor.execute("""
+run_commit("""
 INSERT INTO food_listings (Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, Location, Food_Type, Meal_Type)
 VALUES (999, 'Bread Pack', 10, '2025-08-20', 1, 'Restaurant', 'Dubai', 'Vegetarian', 'Breakfast')
 """)
-conn.commit()
 print("✅ New food listing added!")
 
 # 2️⃣ READ — Fetch all vegetarian food
-veg_food = pd.read_sql_query("SELECT * FROM food_listings WHERE Food_Type='Vegetarian'", conn)
+veg_food = run_query("SELECT * FROM food_listings WHERE Food_Type='Vegetarian'")
 print("\n Vegetarian food available:")
 display(veg_food)
 
 # 3️⃣ UPDATE — Change quantity of the new item
-cursor.execute("UPDATE food_listings SET Quantity = 15 WHERE Food_ID = 999")
-conn.commit()
+run_commit("UPDATE food_listings SET Quantity = 15 WHERE Food_ID = 999")
 print("✅ Quantity updated!")
 
 # 4️⃣ DELETE — Remove the new item
-cursor.execute("DELETE FROM food_listings WHERE Food_ID = 999")
-conn.commit()
+run_commit("DELETE FROM food_listings WHERE Food_ID = 999")
 print(" Food listing deleted!")
 
 """# Step 5 — First 3 SQL Queries"""
@@ -107,40 +113,22 @@ print(" Food listing deleted!")
 # -----------------------------------------
 
 # 1️⃣ Query 1: How many food providers and receivers are there in each city?
-query1 = """
-SELECT p.City,
-       COUNT(DISTINCT p.Provider_ID) AS Total_Providers,
-       COUNT(DISTINCT r.Receiver_ID) AS Total_Receivers
-FROM providers p
-LEFT JOIN receivers r ON p.City = r.City
-GROUP BY p.City
-ORDER BY p.City;
-"""
-result1 = pd.read_sql_query(query1, conn)
+query1 = REPORTS["query1"].sql
+result1 = run_query(query1)
 print("🏙️ Providers and Receivers per City:")
 display(result1)
 
 # 2️⃣ Query 2: Which type of food provider contributes the most food?
 # Uses Provider_Type from food_listings table
-query2 = """
-SELECT Provider_Type,
-       SUM(Quantity) AS Total_Quantity_Donated
-FROM food_listings
-GROUP BY Provider_Type
-ORDER BY Total_Quantity_Donated DESC;
-"""
-result2 = pd.read_sql_query(query2, conn)
+query2 = REPORTS["query2"].sql
+result2 = run_query(query2)
 print(" Provider Type by Total Quantity Donated:")
 display(result2)
 
 # 3️⃣ Query 3: Contact information of food providers in a specific city (example: 'Dubai')
 # Uses 'Type' column from providers table
-query3 = """
-SELECT Name, Type, Contact
-FROM providers
-WHERE City = 'Dubai';
-"""
-result3 = pd.read_sql_query(query3, conn)
+query3 = REPORTS["query3"].sql
+result3 = run_query(query3)
 print(" Contact Info of Providers in Dubai:")
 display(result3)
 
@@ -152,38 +140,22 @@ display(result3)
 
 # 4️⃣ Query 4: Which receivers have claimed the most food?
 # We count the number of claims per receiver
-query4 = """
-SELECT r.Name AS Receiver_Name,
-       COUNT(c.Claim_ID) AS Total_Claims
-FROM claims c
-JOIN receivers r ON c.Receiver_ID = r.Receiver_ID
-GROUP BY r.Name
-ORDER BY Total_Claims DESC;
-"""
-result4 = pd.read_sql_query(query4, conn)
+query4 = REPORTS["query4"].sql
+result4 = run_query(query4)
 print(" Receivers with the Most Claims:")
 display(result4)
 
 # 5️⃣ Query 5: What is the total quantity of food available from all providers?
 # Simple sum of Quantity from food_listings
-query5 = """
-SELECT SUM(Quantity) AS Total_Food_Quantity
-FROM food_listings;
-"""
-result5 = pd.read_sql_query(query5, conn)
+query5 = REPORTS["query5"].sql
+result5 = run_query(query5)
 print(" Total Quantity of Food Available:")
 display(result5)
 
 # 6️⃣ Query 6: Which city has the highest number of food listings?
 # We count food listings per city and rank
-query6 = """
-SELECT Location AS City,
-       COUNT(Food_ID) AS Total_Listings
-FROM food_listings
-GROUP BY Location
-ORDER BY Total_Listings DESC;
-"""
-result6 = pd.read_sql_query(query6, conn)
+query6 = REPORTS["query6"].sql
+result6 = run_query(query6)
 print("Cities with Most Food Listings:")
 display(result6)
 
@@ -195,44 +167,22 @@ display(result6)
 
 # 7️⃣ Query 7: What are the most commonly available food types?
 # Group by Food_Type and count how many items belong to each
-query7 = """
-SELECT Food_Type,
-       COUNT(*) AS Total_Items
-FROM food_listings
-GROUP BY Food_Type
-ORDER BY Total_Items DESC;
-"""
-result7 = pd.read_sql_query(query7, conn)
+query7 = REPORTS["query7"].sql
+result7 = run_query(query7)
 print(" Most Commonly Available Food Types:")
 display(result7)
 
 # 8️⃣ Query 8: How many food claims have been made for each food item?
 # Join food_listings with claims to count claims per Food_ID
-query8 = """
-SELECT f.Food_Name,
-       COUNT(c.Claim_ID) AS Total_Claims
-FROM claims c
-JOIN food_listings f ON c.Food_ID = f.Food_ID
-GROUP BY f.Food_Name
-ORDER BY Total_Claims DESC;
-"""
-result8 = pd.read_sql_query(query8, conn)
+query8 = REPORTS["query8"].sql
+result8 = run_query(query8)
 print(" Claims per Food Item:")
 display(result8)
 
 # 9️⃣ Query 9: Which provider has had the highest number of successful food claims?
 # Status='Completed' means successful claim
-query9 = """
-SELECT p.Name AS Provider_Name,
-       COUNT(c.Claim_ID) AS Successful_Claims
-FROM claims c
-JOIN food_listings f ON c.Food_ID = f.Food_ID
-JOIN providers p ON f.Provider_ID = p.Provider_ID
-WHERE c.Status = 'Completed'
-GROUP BY p.Name
-ORDER BY Successful_Claims DESC;
-"""
-result9 = pd.read_sql_query(query9, conn)
+query9 = REPORTS["query9"].sql
+result9 = run_query(query9)
 print(" Providers with Most Successful Claims:")
 display(result9)
 
@@ -244,43 +194,22 @@ display(result9)
 
 # 🔟 Query 10: What percentage of food claims are Completed vs Pending vs Cancelled?
 # We count each status and calculate percentage from total
-query10 = """
-SELECT Status,
-       COUNT(*) AS Count,
-       ROUND((COUNT(*) * 100.0 / (SELECT COUNT(*) FROM claims)), 2) AS Percentage
-FROM claims
-GROUP BY Status;
-"""
-result10 = pd.read_sql_query(query10, conn)
+query10 = REPORTS["query10"].sql
+result10 = run_query(query10)
 print("Claim Status Percentages:")
 display(result10)
 
 # 1️⃣1️⃣ Query 11: What is the average quantity of food claimed per receiver?
 # Join claims -> food_listings to get Quantity and then average per receiver
-query11 = """
-SELECT r.Name AS Receiver_Name,
-       ROUND(AVG(f.Quantity), 2) AS Avg_Quantity_Claimed
-FROM claims c
-JOIN receivers r ON c.Receiver_ID = r.Receiver_ID
-JOIN food_listings f ON c.Food_ID = f.Food_ID
-GROUP BY r.Name
-ORDER BY Avg_Quantity_Claimed DESC;
-"""
-result11 = pd.read_sql_query(query11, conn)
+query11 = REPORTS["query11"].sql
+result11 = run_query(query11)
 print(" Average Quantity Claimed per Receiver:")
 display(result11)
 
 # 1️⃣2️⃣ Query 12: Which meal type is claimed the most?
 # Group by Meal_Type and count claims
-query12 = """
-SELECT Meal_Type,
-       COUNT(c.Claim_ID) AS Total_Claims
-FROM claims c
-JOIN food_listings f ON c.Food_ID = f.Food_ID
-GROUP BY Meal_Type
-ORDER BY Total_Claims DESC;
-"""
-result12 = pd.read_sql_query(query12, conn)
+query12 = REPORTS["query12"].sql
+result12 = run_query(query12)
 print(" Most Claimed Meal Types:")
 display(result12)
 
@@ -293,40 +222,20 @@ display(result12)
 # -----------------------------------------
 
 # 1️⃣3️⃣ Query 13: Total quantity of food donated by each provider
-query13 = """
-SELECT p.Name AS Provider_Name,
-       SUM(f.Quantity) AS Total_Quantity_Donated
-FROM food_listings f
-JOIN providers p ON f.Provider_ID = p.Provider_ID
-GROUP BY p.Name
-ORDER BY Total_Quantity_Donated DESC;
-"""
-result13 = pd.read_sql_query(query13, conn)
+query13 = REPORTS["query13"].sql
+result13 = run_query(query13)
 print("📦 Total Quantity Donated by Each Provider:")
 display(result13)
 
-# 1️⃣4️⃣ Query 14: Top 5 locations with the highest demand (most claims)
-query14 = """
-SELECT f.Location,
-       COUNT(c.Claim_ID) AS Total_Claims
-FROM claims c
-JOIN food_listings f ON c.Food_ID = f.Food_ID
-GROUP BY f.Location
-ORDER BY Total_Claims DESC
-LIMIT 5;
-"""
-result14 = pd.read_sql_query(query14, conn)
-print("📍 Top 5 Locations with Highest Demand:")
+# 1️⃣4️⃣ Query 14: Top 5 listing locations by claims ever made (archived and deleted claims included)
+query14 = REPORTS["query14"].sql
+result14 = run_query(query14)
+print("📍 Top 5 Locations by Claims Ever Made:")
 display(result14)
 
 # 1️⃣5️⃣ Query 15: Food items nearing expiry (less than or equal to 3 days from today)
 # This helps in reducing wastage by prioritizing quick distribution
-query15 = """
-SELECT Food_Name, Quantity, Expiry_Date, Location
-FROM food_listings
-WHERE julianday(Expiry_Date) - julianday('now') <= 3
-ORDER BY Expiry_Date ASC;
-"""
-result15 = pd.read_sql_query(query15, conn)
+query15 = REPORTS["query15"].sql
+result15 = run_query(query15)
 print("⏳ Food Items Nearing Expiry:")
 display(result15)
\ No newline at end of file
@@ -0,0 +1,131 @@
+"""Time the Browse and Analytics workloads under SQLite storage profiles.
+
+    python benchmark_storage.py                       # 1,000,000 listings and claims
+    python benchmark_storage.py --rows 2000000 --repeat 5 --page-size 8192
+
+Grows a temporary copy of FOOD_DB_PATH (index_advisor.build_synthetic) with the
+app's schema and indexes, then runs six Browse filter combinations and every
+Analytics query under each profile: SQLite's defaults, the defaults plus only
+a 32 MiB page cache or only mmap, and the configured STORAGE_PROFILE. Each round
+opens a new connection, as the per-call connections did, and runs the
+workload twice: "cold" is the first pass on the fresh connection, "warm" the
+second. Times are medians over the rounds.
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+
+def workloads(conn):
+    """{"browse": [(sql, params)], "analytics": [(sql, ())]} with filter values from the data"""
+    from queries import ANALYTICS_QUERIES, browse_query
+
+    def top(sql):
+        return [row[0] for row in conn.execute(sql).fetchall()]
+
+    cities = top("SELECT Location FROM food_listings GROUP BY Location ORDER BY COUNT(*) DESC LIMIT 3")
+    providers = top("SELECT p.Name FROM providers p JOIN food_listings f ON f.Provider_ID = p.Provider_ID "
+                    "GROUP BY p.Name ORDER BY COUNT(*) DESC LIMIT 1")
+    food_types = top("SELECT DISTINCT Food_Type FROM food_listings")
+    meals = top("SELECT DISTINCT Meal_Type FROM food_listings LIMIT 1")
+    # Browse returns every match, so a few representative filter combinations
+    browse = [
+        browse_query(),
+        browse_query(cities[0]),
+        browse_query(cities, None, food_types[:1]),
+        browse_query(None, providers[0]),
+        browse_query(cities[0], None, None, meals[0]),
+        browse_query(None, None, food_types, meals[0]),
+    ]
+    return {"browse": browse, "analytics": [(sql, ()) for sql in ANALYTICS_QUERIES.values()]}
+
+
+def run_pass(conn, statements):
+    start = time.perf_counter()
+    for sql, params in statements:
+        conn.execute(sql, params).fetchall()
+    return time.perf_counter() - start
+
+
+def measure(backend, work, repeat):
+    """{(workload, "cold"|"warm"): median seconds}"""
+    times = {}
+    for _ in range(repeat):
+        for name, statements in work.items():
+            conn = backend.connect()
+            try:
+                times.setdefault((name, "cold"), []).append(run_pass(conn, statements))
+                times.setdefault((name, "warm"), []).append(run_pass(conn, statements))
+            finally:
+                conn.close()
+    return {key: statistics.median(values) for key, values in times.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="listings and claims in the synthetic copy")
+    parser.add_argument("--repeat", type=int, default=3, help="rounds per profile")
+    parser.add_argument("--page-size", type=int, help="also time the profile on a copy rewritten with this page size")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "bench.db")
+    source = os.environ.get("FOOD_DB_PATH", "food_wastage.db")
+    # Set before storage/db are imported, so ensure_schema builds the copy
+    os.environ["FOOD_DB_PATH"] = path
+    import storage
+    from db import ensure_schema
+    from index_advisor import build_synthetic
+
+    if storage.BACKEND != "sqlite":
+        sys.exit("benchmark_storage.py measures SQLite; unset FOOD_DB_BACKEND")
+    try:
+        start = time.perf_counter()
+        build_synthetic(source, path, args.rows)
+        ensure_schema()
+        conn = storage.SQLiteBackend(path).connect()
+        conn.execute("ANALYZE")
+        conn.commit()
+        work = workloads(conn)
+        conn.close()
+        print(f"built {args.rows:,} listings and claims ({os.path.getsize(path) / 2**20:,.0f} MiB) "
+              f"in {time.perf_counter() - start:.0f} s")
+
+        defaults, profile = storage.SQLITE_DEFAULTS, storage.STORAGE_PROFILE
+        profiles = {
+            "sqlite defaults": defaults,
+            "+ 32 MiB cache": dict(defaults, cache_size=-32768),
+            "+ mmap_size": dict(defaults, mmap_size=profile["mmap_size"]),
+            "profile": profile,
+        }
+        results = {}
+        for name, settings in profiles.items():
+            results[name] = measure(storage.SQLiteBackend(path, settings), work, args.repeat)
+        for page_size in {profile["page_size"], args.page_size} - {None, defaults["page_size"]}:
+            copy = os.path.join(workdir, f"bench_{page_size}.db")
+            shutil.copy(path, copy)
+            settings = dict(profile, page_size=page_size)
+            storage.SQLiteBackend(copy, settings).vacuum()
+            results[f"profile, {page_size}-byte pages"] = measure(storage.SQLiteBackend(copy, settings), work, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    table = pd.DataFrame(results).T * 1000.0
+    table.columns = [f"{workload} {state} ms" for workload, state in table.columns]
+    base = table.iloc[0]
+    for column in list(table.columns):
+        table[column.replace(" ms", " x")] = base[column] / table[column]
+    print(f"{len(work['browse'])} Browse and {len(work['analytics'])} Analytics statements per pass, "
+          f"median of {args.repeat} rounds; x = speed-up over SQLite defaults")
+    with pd.option_context("display.width", 250, "display.float_format", "{:,.2f}".format):
+        print(table.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Build the synthetic sample gazetteer that Nearby Search uses with the bundled data.
+
+    python build_gazetteer.py                      # rewrite assets/gazetteer_synthetic.csv from FOOD_DB_PATH
+    python build_gazetteer.py --out /tmp/gaz.csv --seed 7
+
+The sample providers, receivers and listings were generated with Faker, so
+their city names are fictional and no real gazetteer knows them. This script
+gives each one made-up coordinates: a city named in a provider address
+("City, ST 12345") is placed within about 1-1.5 degrees of its state's real
+centre, and any other city at a random point in the continental US. Points
+are derived from the seed and the city name alone, so a rebuild only moves
+cities that were added or whose state changed. Distances between sample
+cities are therefore meaningless beyond "same state or not"; for real data,
+point FOOD_GAZETTEER at a real gazetteer with the same columns.
+"""
+import argparse
+import hashlib
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from geo import normalize, parse_address
+
+DEFAULT_OUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gazetteer_synthetic.csv")
+
+# Geographic centres of the US states and DC (real coordinates)
+STATE_CENTRES = {
+    "AK": (61.3707, -152.4044), "AL": (32.8067, -86.7911), "AR": (34.9697, -92.3731),
+    "AZ": (33.7298, -111.4312), "CA": (36.1162, -119.6816), "CO": (39.0598, -105.3111),
+    "CT": (41.5978, -72.7554), "DC": (38.8974, -77.0268), "DE": (39.3185, -75.5071),
+    "FL": (27.7663, -81.6868), "GA": (33.0406, -83.6431), "HI": (21.0943, -157.4983),
+    "IA": (42.0115, -93.2105), "ID": (44.2405, -114.4788), "IL": (40.3495, -88.9861),
+    "IN": (39.8494, -86.2583), "KS": (38.5266, -96.7265), "KY": (37.6681, -84.6701),
+    "LA": (31.1695, -91.8678), "MA": (42.2302, -71.5301), "MD": (39.0639, -76.8021),
+    "ME": (44.6939, -69.3819), "MI": (43.3266, -84.5361), "MN": (45.6945, -93.9002),
+    "MO": (38.4561, -92.2884), "MS": (32.7416, -89.6787), "MT": (46.9219, -110.4544),
+    "NC": (35.6301, -79.8064), "ND": (47.5289, -99.7840), "NE": (41.1254, -98.2681),
+    "NH": (43.4525, -71.5639), "NJ": (40.2989, -74.5210), "NM": (34.8405, -106.2485),
+    "NV": (38.3135, -117.0554), "NY": (42.1657, -74.9481), "OH": (40.3888, -82.7649),
+    "OK": (35.5653, -96.9289), "OR": (44.5720, -122.0709), "PA": (40.5908, -77.2098),
+    "RI": (41.6809, -71.5118), "SC": (33.8569, -80.9450), "SD": (44.2998, -99.4388),
+    "TN": (35.7478, -86.6923), "TX": (31.0545, -97.5635), "UT": (40.1500, -111.8624),
+    "VA": (37.7693, -78.1700), "VT": (44.0459, -72.7107), "WA": (47.4009, -121.4905),
+    "WI": (44.2685, -89.6165), "WV": (38.4912, -80.9545), "WY": (42.7560, -107.3025),
+}
+# Degrees a city may sit from its state's centre
+STATE_SPREAD = (1.0, 1.5)
+# Latitude and longitude ranges for cities with no known state
+CONTINENTAL_US = ((25.5, 48.5), (-124.0, -67.0))
+
+CITY_QUERIES = (
+    "SELECT City AS name FROM providers",
+    "SELECT City AS name FROM receivers",
+    "SELECT Location AS name FROM food_listings",
+)
+
+
+def _rng(seed, key):
+    digest = hashlib.sha256(f"{seed}:{key}".encode()).digest()
+    return np.random.default_rng(int.from_bytes(digest[:8], "big"))
+
+
+def build(names, addresses, seed=0):
+    """DataFrame of name, kind, latitude, longitude for the states and every city in `names`/`addresses`"""
+    spellings = {}
+    states = {}
+    for address in addresses:
+        city, state = parse_address(address)
+        if city is not None:
+            spellings.setdefault(normalize(city), set()).add(city)
+            if state in STATE_CENTRES:
+                states.setdefault(normalize(city), Counter())[state] += 1
+    for name in names:
+        if normalize(name):
+            spellings.setdefault(normalize(name), set()).add(str(name))
+
+    rows = [(state, "state", lat, lon) for state, (lat, lon) in sorted(STATE_CENTRES.items())]
+    for key in sorted(spellings):
+        rng = _rng(seed, key)
+        if key in states:
+            # The state the city is most often addressed in; ties go to the first alphabetically
+            state = min(states[key].items(), key=lambda item: (-item[1], item[0]))[0]
+            lat, lon = STATE_CENTRES[state]
+            lat += rng.uniform(-STATE_SPREAD[0], STATE_SPREAD[0])
+            lon += rng.uniform(-STATE_SPREAD[1], STATE_SPREAD[1])
+        else:
+            lat, lon = rng.uniform(*CONTINENTAL_US[0]), rng.uniform(*CONTINENTAL_US[1])
+        rows.append((min(spellings[key]), "city", round(lat, 4), round(lon, 4)))
+    return pd.DataFrame(rows, columns=["name", "kind", "latitude", "longitude"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", default=DEFAULT_OUT, help="CSV to write")
+    parser.add_argument("--seed", type=int, default=0, help="changes every synthetic point")
+    args = parser.parse_args()
+
+    from db import run_query
+
+    names = [name for sql in CITY_QUERIES for name in run_query(sql)["name"].dropna().tolist()]
+    addresses = run_query("SELECT Address FROM providers")["Address"].dropna().tolist()
+    df = build(names, addresses, args.seed)
+    df.to_csv(args.out, index=False, float_format="%.4f")
+    print(f"wrote {args.out}: {int((df['kind'] == 'state').sum())} states, {int((df['kind'] == 'city').sum())} cities")
+
+
+if __name__ == "__main__":
+    main()
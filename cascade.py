@@ -0,0 +1,260 @@
+"""Deletes that cascade to dependent rows, finished in the background.
+
+    python cascade.py            # finish pending cascades
+    python cascade.py --orphans  # also clean up rows whose parent is already gone
+
+Deleting a provider, receiver or listing removes that one row and records a
+tombstone in the same transaction. Its dependents (the provider's listings,
+and the claims on listings that no longer exist) are then deleted in short
+batches: by the background compactor when FOOD_COMPACT_INTERVAL is set,
+otherwise right after the delete, up to FOOD_COMPACT_INLINE_BATCHES batches.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from db import run_many, run_query
+from metrics import render_metrics
+from shared_cache import shared_cache
+from storage import backend
+from workflow import ALL_RECEIVERS_TABLE
+
+# ---------------- Settings ----------------
+# Seconds between compaction rounds (0 = only from the Performance page or `python cascade.py`)
+COMPACT_INTERVAL = float(os.environ.get("FOOD_COMPACT_INTERVAL", "0"))
+# Rows deleted per transaction
+COMPACT_BATCH = int(os.environ.get("FOOD_COMPACT_BATCH", "500"))
+# Batches a delete compacts itself when no compactor thread runs; larger cascades finish in the next compaction
+COMPACT_INLINE_BATCHES = int(os.environ.get("FOOD_COMPACT_INLINE_BATCHES", "20"))
+# Seconds to yield between batches so interactive writes get the lock
+BATCH_PAUSE = 0.01
+
+logger = logging.getLogger("food_wastage.cascade")
+
+KEYS = {"providers": "Provider_ID", "receivers": "Receiver_ID", "food_listings": "Food_ID"}
+
+TOMBSTONE_INSERT = """
+  INSERT INTO tombstones (table_name, record_id, deleted_at) VALUES (?, ?, ?)
+  ON CONFLICT (table_name, record_id) DO NOTHING
+"""
+PROVIDER_LISTINGS_QUERY = f"""
+  SELECT {backend.row_key} AS Row_Key, Food_ID FROM food_listings WHERE Provider_ID = ? LIMIT ?
+"""
+# Row keys can point at another row by the time of the delete (ctids move on UPDATE,
+# VACUUM renumbers rowids), so the deletes re-check the parent
+LISTING_DELETE = f"DELETE FROM food_listings WHERE {backend.row_key_match} AND Provider_ID = ?"
+# Food_ID is not unique, so claims stay while any listing with their Food_ID does
+LISTING_CLAIMS_DELETE = """
+  DELETE FROM claims
+  WHERE Food_ID = ? AND NOT EXISTS (SELECT 1 FROM food_listings f WHERE f.Food_ID = claims.Food_ID)
+"""
+RECEIVER_CLAIMS_QUERY = f"SELECT {backend.row_key} AS Row_Key FROM claims WHERE Receiver_ID = ? LIMIT ?"
+CLAIM_DELETE = f"DELETE FROM claims WHERE {backend.row_key_match} AND Receiver_ID = ?"
+# Rows already orphaned (imported that way, or deleted before tombstones) become tombstones too
+# Dependents still left once a cascade ran out of batches
+REMAINING = {
+    "providers": "SELECT 1 AS present FROM food_listings WHERE Provider_ID = ? LIMIT 1",
+    "receivers": "SELECT 1 AS present FROM claims WHERE Receiver_ID = ? LIMIT 1",
+}
+ORPHAN_TOMBSTONES = [
+    """INSERT INTO tombstones (table_name, record_id, deleted_at)
+       SELECT DISTINCT 'providers', f.Provider_ID, ? FROM food_listings f
+       WHERE f.Provider_ID IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM providers p WHERE p.Provider_ID = f.Provider_ID)
+       ON CONFLICT (table_name, record_id) DO NOTHING""",
+    """INSERT INTO tombstones (table_name, record_id, deleted_at)
+       SELECT DISTINCT 'receivers', c.Receiver_ID, ? FROM claims c
+       WHERE c.Receiver_ID IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM receivers r WHERE r.Receiver_ID = c.Receiver_ID)
+       ON CONFLICT (table_name, record_id) DO NOTHING""",
+    """INSERT INTO tombstones (table_name, record_id, deleted_at)
+       SELECT DISTINCT 'food_listings', c.Food_ID, ? FROM claims c
+       WHERE c.Food_ID IS NOT NULL
+         AND NOT EXISTS (SELECT 1 FROM food_listings f WHERE f.Food_ID = c.Food_ID)
+       ON CONFLICT (table_name, record_id) DO NOTHING""",
+]
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def delete(table, record_id):
+    """Delete the provider, receiver or listing `record_id` and then its dependents.
+
+    The compactor thread deletes the dependents when it runs; otherwise up
+    to COMPACT_INLINE_BATCHES batches are deleted before returning. Returns
+    the number of rows removed from `table`.
+    """
+    key = KEYS[table]
+    removed, _ = run_many([
+        (f"DELETE FROM {table} WHERE {key} = ?", [(record_id,)]),
+        (TOMBSTONE_INSERT, [(table, record_id, _now())]),
+    ])
+    if compactor.running:
+        compactor.wake()
+    else:
+        compact_record(table, record_id, rounds=COMPACT_INLINE_BATCHES)
+    return removed
+
+
+def pending():
+    """Tombstones not yet compacted, per table"""
+    df = run_query("SELECT table_name, COUNT(*) AS n FROM tombstones GROUP BY table_name")
+    return dict(zip(df["table_name"], df["n"].astype(int)))
+
+
+def find_orphans():
+    """Record tombstones for parents that are missing; returns how many were new"""
+    now = _now()
+    return sum(run_many([(stmt, [(now,)]) for stmt in ORPHAN_TOMBSTONES]))
+
+
+# ---------------- Compaction ----------------
+def _batches(query, record_id, batch, rounds=None):
+    """Row batches of `query` until it comes back empty or `rounds` ran, pausing between them"""
+    done = 0
+    while rounds is None or done < rounds:
+        df = run_query(query, (record_id, batch))
+        if df.empty:
+            return
+        yield df
+        done += 1
+        time.sleep(BATCH_PAUSE)
+
+
+def _compact_provider(provider_id, batch, rounds=None):
+    listings = claims = 0
+    for df in _batches(PROVIDER_LISTINGS_QUERY, provider_id, batch, rounds):
+        food_ids = sorted(set(df["Food_ID"].dropna().astype(int).tolist()))
+        n_listings, n_claims, _ = run_many([
+            (LISTING_DELETE, [(key, provider_id) for key in df["Row_Key"].tolist()]),
+            (LISTING_CLAIMS_DELETE, [(food_id,) for food_id in food_ids]),
+            ("DELETE FROM notification_outbox WHERE provider_id = ? AND status = 'pending'", [(provider_id,)]),
+        ])
+        listings += n_listings
+        claims += n_claims
+        if n_listings == 0:
+            break
+    return listings, claims
+
+
+def _compact_receiver(receiver_id, batch, rounds=None):
+    claims = 0
+    for df in _batches(RECEIVER_CLAIMS_QUERY, receiver_id, batch, rounds):
+        n = run_many([(CLAIM_DELETE, [(key, receiver_id) for key in df["Row_Key"].tolist()])])[0]
+        claims += n
+        if n == 0:
+            break
+    return 0, claims
+
+
+def _compact_listing(food_id, batch, rounds=None):
+    return 0, run_many([(LISTING_CLAIMS_DELETE, [(food_id,)])])[0]
+
+
+COMPACTORS = {"providers": _compact_provider, "receivers": _compact_receiver, "food_listings": _compact_listing}
+
+
+def compact(batch=COMPACT_BATCH):
+    """Delete the dependents of every tombstoned row, oldest first.
+
+    Returns {"tombstones": n, "listings": n, "claims": n}.
+    """
+    totals = {"tombstones": 0, "listings": 0, "claims": 0}
+    stones = run_query("SELECT table_name, record_id FROM tombstones ORDER BY deleted_at, table_name, record_id")
+    for table, record_id in stones.itertuples(index=False):
+        listings, claims, finished = compact_record(table, int(record_id), batch)
+        totals["listings"] += listings
+        totals["claims"] += claims
+        totals["tombstones"] += finished
+    return totals
+
+
+def compact_record(table, record_id, batch=COMPACT_BATCH, rounds=None):
+    """Delete the dependents of one tombstoned row, in at most `rounds` batches.
+
+    The tombstone is removed once nothing is left. Returns (listings,
+    claims, finished).
+    """
+    key = KEYS[table]
+    listings = claims = 0
+    # Re-added under the same ID since: its rows belong to the new record
+    if run_query(f"SELECT 1 AS present FROM {table} WHERE {key} = ? LIMIT 1", (record_id,)).empty:
+        listings, claims = COMPACTORS[table](record_id, batch, rounds)
+        render_metrics.inc("food_cascade_listings_deleted_total", listings, "Listings deleted with their provider.")
+        render_metrics.inc("food_cascade_claims_deleted_total", claims, "Claims deleted with their listing or receiver.")
+        if claims:
+            shared_cache.invalidate(ALL_RECEIVERS_TABLE)
+        if table in REMAINING and not run_query(REMAINING[table], (record_id,)).empty:
+            return listings, claims, False
+    run_many([("DELETE FROM tombstones WHERE table_name = ? AND record_id = ?", [(table, record_id)])])
+    return listings, claims, True
+
+
+class Compactor:
+    """Background thread that runs compact() every `interval` seconds, or sooner after a delete"""
+
+    def __init__(self, interval=COMPACT_INTERVAL):
+        self.interval = interval
+        self.last_run = None
+        self.last_totals = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="cascade-compactor", daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                logger.exception("cascade compaction failed")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def run(self):
+        with self._lock:
+            totals = compact()
+            self.last_run, self.last_totals = time.strftime("%Y-%m-%d %H:%M:%S"), totals
+            return totals
+
+
+compactor = Compactor()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orphans", action="store_true", help="first tombstone parents that are already missing")
+    args = parser.parse_args()
+
+    from db import ensure_schema
+    ensure_schema()
+    if args.orphans:
+        print(f"found {find_orphans()} missing parents")
+    totals = compact()
+    print(f"compacted {totals['tombstones']} deletes: {totals['listings']} listings, {totals['claims']} claims")
+
+
+if __name__ == "__main__":
+    main()
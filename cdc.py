@@ -0,0 +1,191 @@
+"""Tail the change_events log of inserts, updates and deletes on the four tables.
+
+    python cdc.py my-consumer --tables claims --follow    # JSON lines on stdout
+
+Each named consumer resumes from the offset it last committed (cdc_offsets).
+Delivery is at-least-once: a consumer that stops between handling a batch and
+committing it sees that batch again.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+from db import run_commit, run_query
+
+# ---------------- Settings ----------------
+CDC_BATCH = int(os.environ.get("FOOD_CDC_BATCH", "1000"))
+# Newest events always kept; older ones go once every named consumer has committed past them
+CDC_RETENTION = int(os.environ.get("FOOD_CDC_RETENTION", "100000"))
+# Seconds between the prunes consumers trigger when they commit
+PRUNE_INTERVAL = 60.0
+
+
+class ChangeEvent:
+    """One row change; `old` and `new` are the row as dicts (None for insert/delete)"""
+
+    __slots__ = ("seq", "table", "op", "row_id", "old", "new", "created_at")
+
+    def __init__(self, seq, table, op, row_id, old, new, created_at):
+        self.seq = seq
+        self.table = table
+        self.op = op
+        self.row_id = row_id
+        self.old = old
+        self.new = new
+        self.created_at = created_at
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+# ---------------- Reading ----------------
+def latest_seq():
+    return int(run_query("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_events")["seq"].iloc[0])
+
+
+def oldest_seq():
+    """The first retained seq, or 0 when the log is empty"""
+    return int(run_query("SELECT COALESCE(MIN(seq), 0) AS seq FROM change_events")["seq"].iloc[0])
+
+
+def read_events(after=0, upto=None, limit=CDC_BATCH, tables=None):
+    """Events with after < seq <= upto, oldest first, optionally only for `tables`"""
+    where, params = ["seq > ?"], [after]
+    if upto is not None:
+        where.append("seq <= ?"); params.append(upto)
+    if tables:
+        where.append("table_name IN (" + ",".join("?" * len(tables)) + ")"); params.extend(tables)
+    df = run_query(
+        "SELECT seq, table_name, op, row_id, old_row, new_row, created_at FROM change_events "
+        f"WHERE {' AND '.join(where)} ORDER BY seq LIMIT ?",
+        tuple(params) + (limit,),
+    )
+    return [
+        ChangeEvent(int(seq), table, op, None if pd.isna(row_id) else int(row_id),
+                    None if pd.isna(old) else json.loads(old), None if pd.isna(new) else json.loads(new), created_at)
+        for seq, table, op, row_id, old, new, created_at in df.itertuples(index=False)
+    ]
+
+
+# ---------------- Consumers ----------------
+class ChangeConsumer:
+    """A named reader whose position survives restarts.
+
+        events = consumer.poll()
+        ...handle them...
+        consumer.commit()
+
+    A new consumer starts at the oldest retained event, or at the current
+    end of the log with start="latest". Events are not pruned until every
+    named consumer has committed past them; drop_consumer() releases one
+    that is no longer used.
+    """
+
+    def __init__(self, name, tables=None, start="earliest"):
+        self.name = name
+        self.tables = tuple(tables or ())
+        self._start = start
+        self._position = None
+        self._upto = None
+        self._last_prune = 0.0
+
+    @property
+    def position(self):
+        if self._position is None:
+            df = run_query("SELECT position FROM cdc_offsets WHERE consumer = ?", (self.name,))
+            if df.empty:
+                self._save(latest_seq() if self._start == "latest" else 0)
+            else:
+                self._position = int(df["position"].iloc[0])
+        return self._position
+
+    def poll(self, limit=CDC_BATCH):
+        """The next events after the committed position (possibly none)"""
+        position = self.position
+        # Reading up to a seq fixed beforehand means a filtered empty read can still move on
+        upto = latest_seq()
+        events = read_events(position, upto, limit, self.tables)
+        self._upto = events[-1].seq if len(events) == limit else upto
+        return events
+
+    def commit(self):
+        """Record everything returned by the last poll as processed"""
+        if self._upto is not None and self._upto > self.position:
+            self._save(self._upto)
+        now = time.monotonic()
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            prune()
+
+    def run(self, handler, interval=1.0, stop=None):
+        """Call handler(events) for each new batch until `stop` is set"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            events = self.poll()
+            if events:
+                handler(events)
+            self.commit()
+            if not events:
+                stop.wait(interval)
+
+    def _save(self, position):
+        run_commit(
+            "INSERT INTO cdc_offsets (consumer, position, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (consumer) DO UPDATE SET position = excluded.position, updated_at = excluded.updated_at",
+            (self.name, position, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+        )
+        self._position = position
+
+
+def consumers():
+    """Named consumers with their position and how many events they are behind"""
+    df = run_query("SELECT consumer, position, updated_at FROM cdc_offsets ORDER BY consumer")
+    df["lag"] = latest_seq() - df["position"]
+    return df
+
+
+def drop_consumer(name):
+    run_commit("DELETE FROM cdc_offsets WHERE consumer = ?", (name,))
+
+
+def prune(keep=CDC_RETENTION):
+    """Delete events every named consumer has committed, keeping the newest `keep`; returns the cutoff seq"""
+    cutoff = latest_seq() - keep
+    slowest = run_query("SELECT MIN(position) AS position FROM cdc_offsets")["position"].iloc[0]
+    if not pd.isna(slowest):
+        cutoff = min(cutoff, int(slowest))
+    if cutoff > 0:
+        run_commit("DELETE FROM change_events WHERE seq <= ?", (cutoff,))
+    return cutoff
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("consumer", help="name under which the offset is saved")
+    parser.add_argument("--tables", help="comma-separated tables to include (default: all four)")
+    parser.add_argument("--start", choices=["earliest", "latest"], default="earliest",
+                        help="where a new consumer begins")
+    parser.add_argument("--follow", action="store_true", help="keep waiting for new events")
+    args = parser.parse_args()
+
+    from db import ensure_schema
+    ensure_schema()
+    consumer = ChangeConsumer(args.consumer, args.tables.split(",") if args.tables else None, args.start)
+    while True:
+        events = consumer.poll()
+        for event in events:
+            print(json.dumps(event.as_dict()), flush=True)
+        consumer.commit()
+        if not events:
+            if not args.follow:
+                break
+            time.sleep(1.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+
+from shared_cache import shared_cache
+
+# ---------------- Settings ----------------
+# FOOD_MULTI_WORKER=1 is for running several app processes on one database file.
+ENABLED = os.environ.get("FOOD_MULTI_WORKER", "0") == "1"
+TRACKED_TABLES = ("providers", "receivers", "food_listings", "claims")
+# Backends without a cheap data_version are polled at most this often
+POLL_INTERVAL = 0.5
+
+
+class ChangeWatcher:
+    """Notices commits made by other worker processes and invalidates local caches.
+
+    PRAGMA data_version on a long-lived connection changes only when some other
+    connection has committed, so the common no-change case costs one pragma.
+    When it moves, the per-table counters maintained by triggers in
+    table_versions tell which shared-cache tables are stale. PostgreSQL has no
+    data_version, so there the counters are read every POLL_INTERVAL instead.
+    """
+
+    def __init__(self):
+        self._conn = None
+        self._data_version = None
+        self._versions = None
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
+
+    def poll(self, backend):
+        with self._lock:
+            if self._conn is None:
+                self._conn = backend.connect(shared=True)
+            data_version = backend.data_version(self._conn)
+            if data_version is None:
+                now = time.monotonic()
+                if now - self._last_poll < POLL_INTERVAL:
+                    return ()
+                self._last_poll = now
+            elif data_version == self._data_version:
+                return ()
+            self._data_version = data_version
+            versions = dict(self._conn.execute("SELECT table_name, version FROM table_versions").fetchall())
+            previous, self._versions = self._versions, versions
+        if previous is None:
+            return ()
+        changed = [t for t, v in versions.items() if previous.get(t) != v]
+        shared_cache.invalidate(*changed)
+        return changed
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+change_watcher = ChangeWatcher()
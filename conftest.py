@@ -0,0 +1,70 @@
+"""pytest setup: every test module works on a copy of food_wastage.db.
+
+FOOD_DB_PATH is read when storage.py is imported, so the copy is made here,
+before any test module imports the app modules.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_TMP = tempfile.mkdtemp(prefix="food-tests-")
+shutil.copy(os.path.join(_HERE, "food_wastage.db"), os.path.join(_TMP, "food_wastage.db"))
+os.environ["FOOD_DB_PATH"] = os.path.join(_TMP, "food_wastage.db")
+os.environ["FOOD_METRICS_FILE"] = os.path.join(_TMP, "metrics.prom")
+os.environ["FOOD_SLOW_LOG"] = os.path.join(_TMP, "slow_queries.log")
+
+# Scripts that open food_wastage.db itself when imported; run them directly instead
+collect_ignore = ["test.py", "test_db_operations.py"]
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_TMP, ignore_errors=True)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    """The schema additions and claim states, as app startup applies them"""
+    import workflow
+    from db import ensure_schema
+
+    ensure_schema()
+    workflow.sync_states()
+
+
+@pytest.fixture
+def new_listing():
+    """Factory for a listing with a Food_ID no other row uses; returns the Food_ID"""
+    from db import run_commit, run_query
+
+    def make(expiry="2030-01-01", provider_id=1, location="Testville", food_type="Vegan", meal="Lunch"):
+        food_id = int(run_query("SELECT COALESCE(MAX(Food_ID), 0) + 1 AS id FROM food_listings")["id"].iloc[0])
+        run_commit(
+            "INSERT INTO food_listings (Food_ID, Food_Name, Quantity, Expiry_Date, Provider_ID, Provider_Type, "
+            "Location, Food_Type, Meal_Type) VALUES (?, 'Test meal', 10, ?, ?, 'Restaurant', ?, ?, ?)",
+            (food_id, expiry, provider_id, location, food_type, meal),
+        )
+        return food_id
+
+    return make
+
+
+@pytest.fixture
+def new_claim():
+    """Factory for a claim in a given state with its own Claim_ID; returns the Claim_ID"""
+    from db import CLAIM_STATES, run_commit, run_query
+
+    def make(food_id, receiver_id=1, state=0, timestamp="2030-01-01 10:00:00"):
+        claim_id = int(run_query(
+            "SELECT MAX(id) + 1 AS id FROM (SELECT COALESCE(MAX(Claim_ID), 0) AS id FROM claims "
+            "UNION ALL SELECT COALESCE(MAX(Claim_ID), 0) FROM claims_archive) ids"
+        )["id"].iloc[0])
+        run_commit(
+            "INSERT INTO claims (Claim_ID, Food_ID, Receiver_ID, Status, State, Timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+            (claim_id, food_id, receiver_id, CLAIM_STATES[state], state, timestamp),
+        )
+        return claim_id
+
+    return make
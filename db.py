@@ -0,0 +1,564 @@
+import time
+
+import pandas as pd
+
+import coherence
+from metrics import render_metrics
+from profiling import profiler
+from replica import CACHE_TABLE as REPLICA_TABLE, ENABLED as REPLICA_ENABLED, replica_backend
+from schema import apply_types
+from shared_cache import shared_cache, tables_in, written_table
+from storage import backend
+
+# Cached results of queries using the current date expire after this many seconds
+NOW_QUERY_TTL = 60
+
+# ---------------- DB Connection ----------------
+# Queries are written in the SQLite dialect; backend.translate adapts them.
+def get_conn(shared=False):
+    return backend.connect(shared)
+
+def run_query(query, params=None, replica=False):
+    """Rows of a SELECT as a DataFrame; replica=True reads the analytics snapshot when it is enabled"""
+    source = _read_source(replica)
+    start = time.perf_counter()
+    conn = source.acquire()
+    try:
+        cur = conn.cursor()
+        cur.execute(backend.translate(query), tuple(params or ()))
+        rows = cur.fetchall()
+        columns = [d[0] for d in cur.description or ()]
+        fetched = time.perf_counter()
+        if profiler.sampled():
+            profiler.record(query, params, fetched - start, len(rows),
+                            lambda: source.explain(conn, query, params))
+        cur.close()
+    finally:
+        source.release(conn)
+    # Plain tuples straight into columns; no per-row dicts
+    df = apply_types(pd.DataFrame.from_records(rows, columns=columns))
+    render_metrics.add_data_time(fetched - start, time.perf_counter() - fetched)
+    return df
+
+def _read_source(replica):
+    return replica_backend if replica and REPLICA_ENABLED else backend
+
+def run_commit(query, params=None):
+    start = time.perf_counter()
+    conn = backend.acquire()
+    try:
+        cur = conn.cursor()
+        cur.execute(backend.translate(query), tuple(params or ()))
+        conn.commit()
+        elapsed = time.perf_counter() - start
+        if profiler.sampled():
+            profiler.record(query, params, elapsed, max(cur.rowcount, 0),
+                            lambda: backend.explain(conn, query, params))
+        lastrow = backend.lastrowid(cur)
+        cur.close()
+    finally:
+        backend.release(conn)
+    shared_cache.invalidate(written_table(query))
+    render_metrics.add_data_time(elapsed, 0.0)
+    return lastrow
+
+def run_many(statements):
+    """Run (query, rows) pairs with executemany in a single transaction.
+
+    Returns the number of rows each statement changed.
+    """
+    start = time.perf_counter()
+    counts = []
+    conn = backend.acquire()
+    try:
+        cur = conn.cursor()
+        for query, rows in statements:
+            if rows:
+                cur.executemany(backend.translate(query), [tuple(row) for row in rows])
+            counts.append(max(cur.rowcount, 0) if rows else 0)
+        conn.commit()
+        cur.close()
+    finally:
+        backend.release(conn)
+    shared_cache.invalidate(*(written_table(query) for query, _ in statements))
+    render_metrics.add_data_time(time.perf_counter() - start, 0.0)
+    return counts
+
+def update_row(table, key_column, key, version, changes):
+    """Write only the `changes` columns, and only if Row_Version is still `version`.
+
+    A single conditional UPDATE that also bumps the version, so no lock is
+    held between reading the row and saving it. Returns False when another
+    writer changed or deleted the row first.
+    """
+    if not changes:
+        return True
+    sets = ", ".join(f"{column} = ?" for column in changes)
+    query = f"UPDATE {table} SET {sets}, Row_Version = Row_Version + 1 WHERE {key_column} = ? AND Row_Version = ?"
+    return run_many([(query, [tuple(changes.values()) + (key, version)])])[0] > 0
+
+def cached_query(query, params=None, replica=False, refresh=False):
+    """run_query through the process-wide cache, for reference data and aggregates.
+
+    The result is shared with other sessions; treat it as read-only. Replica
+    results are kept until the next snapshot rather than the next write.
+    `refresh` runs the query again and replaces the cached result.
+    """
+    if coherence.ENABLED:
+        coherence.change_watcher.poll(backend)
+    ttl = NOW_QUERY_TTL if "'now'" in query else None
+    if _read_source(replica) is backend:
+        key, tables = (query, tuple(params or ())), tables_in(query)
+    else:
+        key, tables = (query, tuple(params or ()), REPLICA_TABLE), (REPLICA_TABLE,)
+    df = shared_cache.get(key, tables, lambda: run_query(query, params, replica), ttl, refresh)
+    return df.copy(deep=False)
+
+# ---------------- Schema ----------------
+# Idempotent DDL applied on top of the tables created by backend.py.
+SCHEMA = [
+    # Change counter for food_listings and the provider columns joined into it;
+    # the in-memory listing snapshot replays these rows to refresh incrementally.
+    """CREATE TABLE IF NOT EXISTS listing_changes (
+           seq INTEGER PRIMARY KEY AUTOINCREMENT,
+           table_name TEXT NOT NULL,
+           row_id INTEGER
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_ins AFTER INSERT ON food_listings
+       BEGIN INSERT INTO listing_changes (table_name, row_id) VALUES ('food_listings', NEW.rowid); END""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_upd AFTER UPDATE ON food_listings
+       BEGIN INSERT INTO listing_changes (table_name, row_id) VALUES ('food_listings', NEW.rowid); END""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_del AFTER DELETE ON food_listings
+       BEGIN INSERT INTO listing_changes (table_name, row_id) VALUES ('food_listings', OLD.rowid); END""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_prov_ins AFTER INSERT ON providers
+       BEGIN INSERT INTO listing_changes (table_name, row_id) VALUES ('providers', NEW.Provider_ID); END""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_prov_upd AFTER UPDATE ON providers
+       BEGIN
+           INSERT INTO listing_changes (table_name, row_id) VALUES ('providers', OLD.Provider_ID);
+           INSERT INTO listing_changes (table_name, row_id) VALUES ('providers', NEW.Provider_ID);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS listing_changes_prov_del AFTER DELETE ON providers
+       BEGIN INSERT INTO listing_changes (table_name, row_id) VALUES ('providers', OLD.Provider_ID); END""",
+    # Per-table write counters; other worker processes compare them to find stale caches.
+    """CREATE TABLE IF NOT EXISTS table_versions (
+           table_name TEXT PRIMARY KEY,
+           version INTEGER NOT NULL DEFAULT 0
+       )""",
+]
+for _table in coherence.TRACKED_TABLES:
+    SCHEMA.append(f"INSERT OR IGNORE INTO table_versions (table_name, version) VALUES ('{_table}', 0)")
+    for _op in ("INSERT", "UPDATE", "DELETE"):
+        SCHEMA.append(
+            f"""CREATE TRIGGER IF NOT EXISTS {_table}_version_{_op.lower()} AFTER {_op} ON {_table}
+                BEGIN UPDATE table_versions SET version = version + 1 WHERE table_name = '{_table}'; END"""
+        )
+
+# Daily claim counts kept current by triggers on claims; trends.rebuild_claim_trends()
+# backfills claims that existed before the triggers.
+def _sqlite_day(ts):
+    """YYYY-MM-DD of an ISO or imported M/D/YYYY timestamp, else NULL"""
+    rest = f"substr({ts}, instr({ts}, '/') + 1)"
+    return (f"COALESCE(date({ts}), CASE WHEN {ts} LIKE '%/%/%' THEN printf('%04d-%02d-%02d', "
+            f"CAST(substr({rest}, instr({rest}, '/') + 1) AS INTEGER), CAST({ts} AS INTEGER), CAST({rest} AS INTEGER)) END)")
+
+def claim_day(ts):
+    """SQL for the YYYY-MM-DD day of claim timestamp column `ts` on the active backend"""
+    if backend.name == "sqlite":
+        return _sqlite_day(ts)
+    return f"to_char({ts}::timestamp, 'YYYY-MM-DD')"
+
+def _claim_bucket(row):
+    listing = f"FROM food_listings WHERE Food_ID = {row}.Food_ID LIMIT 1"
+    return (_sqlite_day(f"{row}.Timestamp"), f"COALESCE((SELECT Location {listing}), '')",
+            f"COALESCE((SELECT Provider_Type {listing}), '')", f"COALESCE({row}.Status, '')")
+
+_NEW_DAY, _NEW_CITY, _NEW_TYPE, _NEW_STATUS = _claim_bucket("NEW")
+_OLD_DAY, _OLD_CITY, _OLD_TYPE, _OLD_STATUS = _claim_bucket("OLD")
+_CLAIM_DAILY_ADD = f"""INSERT INTO claim_daily (day, city, provider_type, status, claim_count)
+           VALUES ({_NEW_DAY}, {_NEW_CITY}, {_NEW_TYPE}, {_NEW_STATUS}, 1)
+           ON CONFLICT (day, city, provider_type, status) DO UPDATE SET claim_count = claim_count + 1;"""
+SCHEMA += [
+    f"""CREATE TRIGGER IF NOT EXISTS claim_daily_ins AFTER INSERT ON claims
+        WHEN {_NEW_DAY} IS NOT NULL
+        BEGIN {_CLAIM_DAILY_ADD} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS claim_daily_upd AFTER UPDATE OF Status ON claims
+        WHEN OLD.Status IS NOT NEW.Status AND {_NEW_DAY} IS NOT NULL
+        BEGIN
+            UPDATE claim_daily SET claim_count = claim_count - 1
+            WHERE day = {_OLD_DAY} AND city = {_OLD_CITY} AND provider_type = {_OLD_TYPE} AND status = {_OLD_STATUS};
+            {_CLAIM_DAILY_ADD}
+        END""",
+]
+# Daily claims per listing location, meal type and food type, for demand forecasting
+_NEW_LISTING = "FROM food_listings WHERE Food_ID = NEW.Food_ID LIMIT 1"
+SCHEMA.append(
+    f"""CREATE TRIGGER IF NOT EXISTS demand_daily_ins AFTER INSERT ON claims
+        WHEN {_NEW_DAY} IS NOT NULL
+        BEGIN
+            INSERT INTO demand_daily (day, location, meal_type, food_type, claim_count)
+            VALUES ({_NEW_DAY}, COALESCE((SELECT Location {_NEW_LISTING}), ''),
+                    COALESCE((SELECT Meal_Type {_NEW_LISTING}), ''), COALESCE((SELECT Food_Type {_NEW_LISTING}), ''), 1)
+            ON CONFLICT (day, location, meal_type, food_type) DO UPDATE SET claim_count = claim_count + 1;
+        END"""
+)
+# Per-state claim counts and the transition history
+_STATE_COUNT = "UPDATE claim_states SET claim_count = claim_count {} 1 WHERE state = {}.State;"
+SCHEMA += [
+    f"""CREATE TRIGGER IF NOT EXISTS claim_state_ins AFTER INSERT ON claims
+        WHEN NEW.State IS NOT NULL
+        BEGIN {_STATE_COUNT.format("+", "NEW")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS claim_state_del AFTER DELETE ON claims
+        WHEN OLD.State IS NOT NULL
+        BEGIN {_STATE_COUNT.format("-", "OLD")} END""",
+    f"""CREATE TRIGGER IF NOT EXISTS claim_state_upd AFTER UPDATE OF State ON claims
+        WHEN OLD.State IS NOT NEW.State
+        BEGIN
+            {_STATE_COUNT.format("-", "OLD")}
+            {_STATE_COUNT.format("+", "NEW")}
+            INSERT INTO claim_transitions (claim_id, from_state, to_state, changed_at)
+            SELECT NEW.Claim_ID, OLD.State, NEW.State, datetime('now') WHERE OLD.State IS NOT NULL AND NEW.State IS NOT NULL;
+        END""",
+    # A claim's history goes with it when it is archived or deleted
+    """CREATE TRIGGER IF NOT EXISTS claim_transitions_del AFTER DELETE ON claims
+        BEGIN DELETE FROM claim_transitions WHERE claim_id = OLD.Claim_ID; END""",
+]
+shared_cache.derived["claims"] = ("claim_daily", "demand_daily", "claim_states", "claim_transitions")
+
+# Change data capture: every insert, update and delete on the four tables is
+# appended to change_events as JSON rows; cdc.py reads the log. Key column first.
+CDC_TABLES = {
+    "providers": ("Provider_ID", "Name", "Type", "Address", "City", "Contact", "Row_Version"),
+    "receivers": ("Receiver_ID", "Name", "Type", "City", "Contact", "Row_Version"),
+    "food_listings": ("Food_ID", "Food_Name", "Quantity", "Expiry_Date", "Provider_ID", "Provider_Type",
+                      "Location", "Food_Type", "Meal_Type", "Listing_Status", "Row_Version"),
+    "claims": ("Claim_ID", "Food_ID", "Receiver_ID", "Status", "State", "Timestamp"),
+}
+SCHEMA.append(
+    """CREATE TABLE IF NOT EXISTS change_events (
+           seq INTEGER PRIMARY KEY AUTOINCREMENT,
+           table_name TEXT NOT NULL,
+           op TEXT NOT NULL,
+           row_id INTEGER,
+           old_row TEXT,
+           new_row TEXT,
+           created_at TEXT NOT NULL DEFAULT (datetime('now'))
+       )"""
+)
+
+def _json_row(row, columns):
+    return "json_object(" + ", ".join(f"'{c}', {row}.{c}" for c in columns) + ")"
+
+for _table, _columns in CDC_TABLES.items():
+    for _op, _old, _new in (("insert", None, "NEW"), ("update", "OLD", "NEW"), ("delete", "OLD", None)):
+        _old_row = _json_row("OLD", _columns) if _old else "NULL"
+        _new_row = _json_row("NEW", _columns) if _new else "NULL"
+        # Recreated on every start so the JSON picks up columns added later
+        SCHEMA += [
+            f"DROP TRIGGER IF EXISTS {_table}_cdc_{_op}",
+            f"""CREATE TRIGGER {_table}_cdc_{_op} AFTER {_op.upper()} ON {_table}
+                BEGIN
+                    INSERT INTO change_events (table_name, op, row_id, old_row, new_row)
+                    VALUES ('{_table}', '{_op}', {_new or _old}.{_columns[0]}, {_old_row}, {_new_row});
+                END""",
+        ]
+
+# Columns added to the tables backend.py loads: (table, column, definition)
+ADDED_COLUMNS = [
+    # 'Available' or 'Expired'; the expiry sweeper retires listings past Expiry_Date
+    ("food_listings", "Listing_Status", "TEXT NOT NULL DEFAULT 'Available'"),
+    # Bumped by every edit; update_row only writes if it still matches what the editor loaded
+    ("food_listings", "Row_Version", "INTEGER NOT NULL DEFAULT 0"),
+    ("providers", "Row_Version", "INTEGER NOT NULL DEFAULT 0"),
+    ("receivers", "Row_Version", "INTEGER NOT NULL DEFAULT 0"),
+    # Index into CLAIM_STATES, kept beside the Status text; NULL until workflow.sync_states() sets it
+    ("claims", "State", "INTEGER"),
+]
+
+# Claim lifecycle states by State value; workflow.py moves claims between them
+CLAIM_STATES = ("Pending", "Approved", "Completed", "Cancelled")
+
+# Tables written the same way on both backends; applied through backend.translate.
+PORTABLE_SCHEMA = [
+    # The sweeper walks available listings in Expiry_Date order and cancels their claims by Food_ID
+    "CREATE INDEX IF NOT EXISTS food_listings_expiry ON food_listings (Listing_Status, Expiry_Date)",
+    "CREATE INDEX IF NOT EXISTS claims_food ON claims (Food_ID)",
+    "CREATE INDEX IF NOT EXISTS food_listings_food ON food_listings (Food_ID)",
+    # cascade.py finds a deleted provider's listings and a deleted receiver's claims;
+    # the Receiver Portal pages through a receiver's claims in Claim_ID order
+    "CREATE INDEX IF NOT EXISTS food_listings_provider ON food_listings (Provider_ID)",
+    "CREATE INDEX IF NOT EXISTS claims_receiver_claim ON claims (Receiver_ID, Claim_ID)",
+    "DROP INDEX IF EXISTS claims_receiver",
+    # Found missing by index_advisor.py: the Browse join and provider filter, the
+    # portal and admin lookups, near-expiry analytics and the per-city reports
+    "CREATE INDEX IF NOT EXISTS providers_provider_id ON providers (Provider_ID)",
+    "CREATE INDEX IF NOT EXISTS providers_name ON providers (Name)",
+    "CREATE INDEX IF NOT EXISTS providers_city ON providers (City)",
+    "CREATE INDEX IF NOT EXISTS receivers_receiver_id ON receivers (Receiver_ID)",
+    "CREATE INDEX IF NOT EXISTS receivers_city ON receivers (City)",
+    "CREATE INDEX IF NOT EXISTS food_listings_expiry_date ON food_listings (Expiry_Date)",
+    # workflow.py moves claims by Claim_ID and State; new claims take MAX(Claim_ID) + 1,
+    # and the unique index turns two submits racing for the same number into a retry
+    "CREATE UNIQUE INDEX IF NOT EXISTS claims_claim_id_unique ON claims (Claim_ID)",
+    "DROP INDEX IF EXISTS claims_claim_id",
+    "CREATE INDEX IF NOT EXISTS claims_state ON claims (State)",
+    # Live claims per state, kept current by triggers on claims so dashboards read one row each
+    """CREATE TABLE IF NOT EXISTS claim_states (
+           state INTEGER PRIMARY KEY,
+           name TEXT NOT NULL,
+           claim_count INTEGER NOT NULL DEFAULT 0
+       )""",
+    "INSERT INTO claim_states (state, name) VALUES "
+    + ", ".join(f"({i}, '{name}')" for i, name in enumerate(CLAIM_STATES))
+    + " ON CONFLICT (state) DO NOTHING",
+    # Every state change of a claim, written by the same triggers
+    """CREATE TABLE IF NOT EXISTS claim_transitions (
+           claim_id INTEGER,
+           from_state INTEGER NOT NULL,
+           to_state INTEGER NOT NULL,
+           changed_at TEXT NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS claim_transitions_claim ON claim_transitions (claim_id, changed_at)",
+    # Completed/cancelled claims past the archive horizon, keyed by claim month
+    """CREATE TABLE IF NOT EXISTS claims_archive (
+           Claim_ID INTEGER,
+           Food_ID INTEGER,
+           Receiver_ID INTEGER,
+           Status TEXT,
+           Timestamp TEXT,
+           claim_month TEXT NOT NULL
+       )""",
+    "CREATE INDEX IF NOT EXISTS claims_archive_month ON claims_archive (claim_month)",
+    # Archived claims keep their Claim_ID, so new ones are numbered past them too
+    "CREATE INDEX IF NOT EXISTS claims_archive_claim_id ON claims_archive (Claim_ID)",
+    # Monthly totals of archived claims; historical analytics add these to the live claims
+    """CREATE TABLE IF NOT EXISTS claim_rollups (
+           claim_month TEXT NOT NULL,
+           status TEXT NOT NULL,
+           provider_id INTEGER,
+           meal_type TEXT,
+           claim_count INTEGER NOT NULL,
+           UNIQUE (claim_month, status, provider_id, meal_type)
+       )""",
+    # listed_count/quantity only cover claims whose listing still existed when archived
+    """CREATE TABLE IF NOT EXISTS receiver_claim_rollups (
+           claim_month TEXT NOT NULL,
+           status TEXT NOT NULL,
+           receiver_id INTEGER,
+           claim_count INTEGER NOT NULL,
+           listed_count INTEGER NOT NULL,
+           quantity INTEGER NOT NULL,
+           UNIQUE (claim_month, status, receiver_id)
+       )""",
+    "CREATE INDEX IF NOT EXISTS receiver_claim_rollups_receiver ON receiver_claim_rollups (receiver_id)",
+    # One row per day, listing city, provider type and status; counts claims ever made,
+    # so archiving does not change it
+    """CREATE TABLE IF NOT EXISTS claim_daily (
+           day TEXT NOT NULL,
+           city TEXT NOT NULL,
+           provider_type TEXT NOT NULL,
+           status TEXT NOT NULL,
+           claim_count INTEGER NOT NULL,
+           UNIQUE (day, city, provider_type, status)
+       )""",
+    """CREATE TABLE IF NOT EXISTS demand_daily (
+           day TEXT NOT NULL,
+           location TEXT NOT NULL,
+           meal_type TEXT NOT NULL,
+           food_type TEXT NOT NULL,
+           claim_count INTEGER NOT NULL,
+           UNIQUE (day, location, meal_type, food_type)
+       )""",
+    # Last change_events seq each named cdc.py consumer has processed
+    """CREATE TABLE IF NOT EXISTS cdc_offsets (
+           consumer TEXT PRIMARY KEY,
+           position INTEGER NOT NULL,
+           updated_at TEXT NOT NULL
+       )""",
+    # Providers, receivers and listings deleted whose dependent rows cascade.py has yet to remove
+    """CREATE TABLE IF NOT EXISTS tombstones (
+           table_name TEXT NOT NULL,
+           record_id INTEGER NOT NULL,
+           deleted_at TEXT NOT NULL,
+           UNIQUE (table_name, record_id)
+       )""",
+    # Claims waiting to be sent to their provider by notifications.py, keyed by change_events seq
+    """CREATE TABLE IF NOT EXISTS notification_outbox (
+           event_seq INTEGER PRIMARY KEY,
+           provider_id INTEGER NOT NULL,
+           food_id INTEGER,
+           food_name TEXT,
+           receiver_id INTEGER,
+           claimed_at TEXT,
+           status TEXT NOT NULL,
+           attempts INTEGER NOT NULL,
+           next_attempt_at TEXT NOT NULL,
+           lease_owner TEXT,
+           sent_at TEXT,
+           last_error TEXT
+       )""",
+    "CREATE INDEX IF NOT EXISTS notification_outbox_due ON notification_outbox (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS notification_outbox_provider ON notification_outbox (provider_id, status)",
+    # Versioned results of the reports.py catalog; payload is the DataFrame as split JSON
+    """CREATE TABLE IF NOT EXISTS report_results (
+           report TEXT NOT NULL,
+           version INTEGER NOT NULL,
+           created_at TEXT NOT NULL,
+           elapsed_ms REAL NOT NULL,
+           row_count INTEGER NOT NULL,
+           payload TEXT,
+           error TEXT,
+           UNIQUE (report, version)
+       )""",
+]
+
+# PostgreSQL has no rowid, so the listing change log is SQLite-only; the write
+# counters and claim_daily triggers are kept on both.
+POSTGRES_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS table_versions (
+           table_name TEXT PRIMARY KEY,
+           version INTEGER NOT NULL DEFAULT 0
+       )""",
+    """CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+       BEGIN
+           UPDATE table_versions SET version = version + 1 WHERE table_name = TG_TABLE_NAME;
+           RETURN NULL;
+       END $$ LANGUAGE plpgsql""",
+]
+POSTGRES_SCHEMA += [
+    """CREATE OR REPLACE FUNCTION claim_daily_bump() RETURNS trigger AS $$
+       DECLARE
+           bucket_day TEXT;
+           bucket_city TEXT;
+           bucket_type TEXT;
+       BEGIN
+           BEGIN
+               bucket_day := to_char(NEW."Timestamp"::timestamp, 'YYYY-MM-DD');
+           EXCEPTION WHEN others THEN
+               RETURN NULL;
+           END;
+           SELECT f."Location", f."Provider_Type" INTO bucket_city, bucket_type
+             FROM food_listings f WHERE f."Food_ID" = NEW."Food_ID" LIMIT 1;
+           bucket_city := COALESCE(bucket_city, '');
+           bucket_type := COALESCE(bucket_type, '');
+           IF TG_OP = 'UPDATE' THEN
+               UPDATE claim_daily SET claim_count = claim_count - 1
+                WHERE day = bucket_day AND city = bucket_city AND provider_type = bucket_type
+                  AND status = COALESCE(OLD."Status", '');
+           END IF;
+           INSERT INTO claim_daily (day, city, provider_type, status, claim_count)
+           VALUES (bucket_day, bucket_city, bucket_type, COALESCE(NEW."Status", ''), 1)
+           ON CONFLICT (day, city, provider_type, status) DO UPDATE SET claim_count = claim_daily.claim_count + 1;
+           RETURN NULL;
+       END $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE TRIGGER claim_daily_ins AFTER INSERT ON claims
+       FOR EACH ROW EXECUTE FUNCTION claim_daily_bump()""",
+    """CREATE OR REPLACE TRIGGER claim_daily_upd AFTER UPDATE OF "Status" ON claims
+       FOR EACH ROW WHEN (OLD."Status" IS DISTINCT FROM NEW."Status") EXECUTE FUNCTION claim_daily_bump()""",
+    """CREATE OR REPLACE FUNCTION demand_daily_bump() RETURNS trigger AS $$
+       DECLARE
+           bucket_day TEXT;
+           listing RECORD;
+       BEGIN
+           BEGIN
+               bucket_day := to_char(NEW."Timestamp"::timestamp, 'YYYY-MM-DD');
+           EXCEPTION WHEN others THEN
+               RETURN NULL;
+           END;
+           SELECT f."Location", f."Meal_Type", f."Food_Type" INTO listing
+             FROM food_listings f WHERE f."Food_ID" = NEW."Food_ID" LIMIT 1;
+           INSERT INTO demand_daily (day, location, meal_type, food_type, claim_count)
+           VALUES (bucket_day, COALESCE(listing."Location", ''), COALESCE(listing."Meal_Type", ''),
+                   COALESCE(listing."Food_Type", ''), 1)
+           ON CONFLICT (day, location, meal_type, food_type) DO UPDATE SET claim_count = demand_daily.claim_count + 1;
+           RETURN NULL;
+       END $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE TRIGGER demand_daily_ins AFTER INSERT ON claims
+       FOR EACH ROW EXECUTE FUNCTION demand_daily_bump()""",
+    """CREATE OR REPLACE FUNCTION claim_state_bump() RETURNS trigger AS $$
+       BEGIN
+           IF TG_OP <> 'INSERT' AND OLD."State" IS NOT NULL THEN
+               UPDATE claim_states SET claim_count = claim_count - 1 WHERE state = OLD."State";
+           END IF;
+           IF TG_OP <> 'DELETE' AND NEW."State" IS NOT NULL THEN
+               UPDATE claim_states SET claim_count = claim_count + 1 WHERE state = NEW."State";
+           END IF;
+           IF TG_OP = 'UPDATE' AND OLD."State" IS NOT NULL AND NEW."State" IS NOT NULL THEN
+               INSERT INTO claim_transitions (claim_id, from_state, to_state, changed_at)
+               VALUES (NEW."Claim_ID", OLD."State", NEW."State", to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS'));
+           END IF;
+           IF TG_OP = 'DELETE' THEN
+               DELETE FROM claim_transitions WHERE claim_id = OLD."Claim_ID";
+           END IF;
+           RETURN NULL;
+       END $$ LANGUAGE plpgsql""",
+    """CREATE OR REPLACE TRIGGER claim_state_count AFTER INSERT OR DELETE ON claims
+       FOR EACH ROW EXECUTE FUNCTION claim_state_bump()""",
+    """CREATE OR REPLACE TRIGGER claim_state_upd AFTER UPDATE OF "State" ON claims
+       FOR EACH ROW WHEN (OLD."State" IS DISTINCT FROM NEW."State") EXECUTE FUNCTION claim_state_bump()""",
+]
+POSTGRES_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS change_events (
+           seq BIGSERIAL PRIMARY KEY,
+           table_name TEXT NOT NULL,
+           op TEXT NOT NULL,
+           row_id BIGINT,
+           old_row TEXT,
+           new_row TEXT,
+           created_at TEXT NOT NULL DEFAULT to_char(timezone('UTC', now()), 'YYYY-MM-DD HH24:MI:SS')
+       )""",
+    # Sequence values are handed out before commit, so concurrent writers could
+    # commit out of seq order and a consumer past the later one would skip the
+    # earlier. The advisory lock makes appends commit in seq order.
+    """CREATE OR REPLACE FUNCTION record_change() RETURNS trigger AS $$
+       BEGIN
+           PERFORM pg_advisory_xact_lock(hashtext('change_events'));
+           IF TG_OP = 'INSERT' THEN
+               INSERT INTO change_events (table_name, op, row_id, new_row)
+               VALUES (TG_TABLE_NAME, 'insert', (to_jsonb(NEW) ->> TG_ARGV[0])::numeric::bigint, to_jsonb(NEW)::text);
+           ELSIF TG_OP = 'UPDATE' THEN
+               INSERT INTO change_events (table_name, op, row_id, old_row, new_row)
+               VALUES (TG_TABLE_NAME, 'update', (to_jsonb(NEW) ->> TG_ARGV[0])::numeric::bigint,
+                       to_jsonb(OLD)::text, to_jsonb(NEW)::text);
+           ELSE
+               INSERT INTO change_events (table_name, op, row_id, old_row)
+               VALUES (TG_TABLE_NAME, 'delete', (to_jsonb(OLD) ->> TG_ARGV[0])::numeric::bigint, to_jsonb(OLD)::text);
+           END IF;
+           RETURN NULL;
+       END $$ LANGUAGE plpgsql""",
+]
+for _table, _columns in CDC_TABLES.items():
+    POSTGRES_SCHEMA.append(
+        f"""CREATE OR REPLACE TRIGGER {_table}_cdc AFTER INSERT OR UPDATE OR DELETE ON {_table}
+            FOR EACH ROW EXECUTE FUNCTION record_change('{_columns[0]}')"""
+    )
+for _table in coherence.TRACKED_TABLES:
+    POSTGRES_SCHEMA += [
+        f"INSERT INTO table_versions (table_name, version) VALUES ('{_table}', 0) ON CONFLICT DO NOTHING",
+        f"""CREATE OR REPLACE TRIGGER {_table}_version AFTER INSERT OR UPDATE OR DELETE ON {_table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()""",
+    ]
+
+def ensure_schema():
+    conn = get_conn()
+    try:
+        if backend.name == "postgres":
+            statements = POSTGRES_SCHEMA
+        else:
+            statements = SCHEMA
+            if coherence.ENABLED or REPLICA_ENABLED:
+                # Readers in one worker, or the replica snapshot, no longer block the writer
+                conn.execute("PRAGMA journal_mode=WAL")
+        for table, column, definition in ADDED_COLUMNS:
+            if column not in _columns(conn, table):
+                conn.execute(backend.translate(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+        for stmt in PORTABLE_SCHEMA:
+            conn.execute(backend.translate(stmt))
+        for stmt in statements:
+            conn.execute(stmt)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _columns(conn, table):
+    cur = conn.execute(f"SELECT * FROM {table} LIMIT 0")
+    return {d[0] for d in cur.description}
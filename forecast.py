@@ -0,0 +1,132 @@
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db import run_many, run_query
+
+# ---------------- Settings ----------------
+# Half-lives, in days, of the overall level and of each weekday's level
+LEVEL_HALF_LIFE = 7
+SEASON_HALF_LIFE = 28
+# Weight of the weekday level in the forecast; the rest is the overall level
+SEASON_WEIGHT = 0.5
+SEGMENT = ["location", "meal_type", "food_type"]
+
+BACKFILL_QUERY = """
+  SELECT c.Timestamp, f.Location, f.Meal_Type, f.Food_Type
+  FROM claims c LEFT JOIN food_listings f ON c.Food_ID = f.Food_ID
+  UNION ALL
+  SELECT a.Timestamp, f.Location, f.Meal_Type, f.Food_Type
+  FROM claims_archive a LEFT JOIN food_listings f ON a.Food_ID = f.Food_ID
+"""
+
+
+def needs_backfill():
+    """True until demand_daily has been filled once"""
+    return run_query("SELECT 1 AS present FROM demand_daily LIMIT 1").empty
+
+
+def rebuild_demand():
+    """Recompute demand_daily from the live and archived claims; returns the rows written"""
+    df = run_query(BACKFILL_QUERY)
+    df = df[df["Timestamp"].notna()]
+    daily = pd.DataFrame({
+        "day": df["Timestamp"].dt.strftime("%Y-%m-%d"),
+        "location": df["Location"].astype(object).fillna(""),
+        "meal_type": df["Meal_Type"].astype(object).fillna(""),
+        "food_type": df["Food_Type"].astype(object).fillna(""),
+    }).groupby(["day"] + SEGMENT).size().reset_index()
+    rows = [(day, loc, meal, food, int(n)) for day, loc, meal, food, n in daily.itertuples(index=False)]
+    run_many([
+        ("DELETE FROM demand_daily", [()]),
+        ("INSERT INTO demand_daily (day, location, meal_type, food_type, claim_count) VALUES (?, ?, ?, ?, ?)", rows),
+    ])
+    return len(rows)
+
+
+class DemandForecaster:
+    """Next-day claims per location, meal type and food type.
+
+    Each segment keeps an exponentially weighted daily level and one per
+    weekday; the forecast blends the two. Training folds in only the days
+    after the last one seen, one vectorised step per day across all
+    segments, so retraining costs the new days rather than the history.
+    Only complete days (before today) are used.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.segments = pd.MultiIndex.from_arrays([[], [], []], names=SEGMENT)
+        self.level = np.zeros(0)
+        self.season = np.zeros((0, 7))
+        self.trained_through = None
+
+    def refresh(self, today=None):
+        """Fold in completed days not seen yet; returns how many were added"""
+        today = today or date.today()
+        with self._lock:
+            since = self.trained_through.isoformat() if self.trained_through else ""
+            # One row per day and segment already (all key columns are NOT NULL)
+            df = run_query(
+                "SELECT day, location, meal_type, food_type, claim_count AS claims FROM demand_daily "
+                "WHERE day > ? AND day < ?",
+                (since, today.isoformat()),
+            )
+            if df.empty:
+                return 0
+            days = pd.to_datetime(df["day"])
+            first = pd.Timestamp(self.trained_through + timedelta(days=1)) if self.trained_through else days.min()
+            keys = pd.MultiIndex.from_frame(df[SEGMENT])
+            self._grow(keys)
+
+            # Dense day x segment matrix; days without claims stay zero
+            n_days = (days.max() - first).days + 1
+            counts = np.zeros((n_days, len(self.segments)))
+            np.add.at(counts, ((days - first).dt.days.to_numpy(), self.segments.get_indexer(keys)),
+                      df["claims"].to_numpy(dtype=float))
+
+            a = 1 - 0.5 ** (1 / LEVEL_HALF_LIFE)
+            # A weekday comes round once a week, so its half-life is counted in weeks
+            b = 1 - 0.5 ** (7 / SEASON_HALF_LIFE)
+            for i in range(n_days):
+                x = counts[i]
+                self.level += a * (x - self.level)
+                dow = (first + timedelta(days=i)).weekday()
+                self.season[:, dow] += b * (x - self.season[:, dow])
+            self.trained_through = (first + timedelta(days=n_days - 1)).date()
+            return n_days
+
+    def _grow(self, keys):
+        new = keys.unique().difference(self.segments)
+        if len(new):
+            self.segments = self.segments.append(new)
+            self.level = np.concatenate([self.level, np.zeros(len(new))])
+            self.season = np.vstack([self.season, np.zeros((len(new), 7))])
+
+    def forecast(self, meal_type=None, food_type=None):
+        """DataFrame of predicted claims for the day after trained_through, largest first"""
+        with self._lock:
+            if self.trained_through is None:
+                return pd.DataFrame(columns=["Location", "Meal_Type", "Food_Type", "Predicted_Claims"]), None
+            day = self.trained_through + timedelta(days=1)
+            predicted = (1 - SEASON_WEIGHT) * self.level + SEASON_WEIGHT * self.season[:, day.weekday()]
+            keys = self.segments
+        df = keys.to_frame(index=False)
+        df.columns = ["Location", "Meal_Type", "Food_Type"]
+        df["Predicted_Claims"] = predicted
+        if meal_type:
+            df = df[df["Meal_Type"] == meal_type]
+        if food_type:
+            df = df[df["Food_Type"] == food_type]
+        df = df[df["Location"] != ""]
+        return df.sort_values("Predicted_Claims", ascending=False, kind="stable").reset_index(drop=True), day
+
+    def best_locations(self, meal_type, food_type, n=3):
+        """Locations expected to claim the most of this meal and food type"""
+        df, _ = self.forecast(meal_type, food_type)
+        return df.head(n)["Location"].tolist()
+
+
+demand_forecaster = DemandForecaster()
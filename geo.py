@@ -0,0 +1,168 @@
+import math
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ---------------- Settings ----------------
+# CSV of name, kind (city or state), latitude, longitude; looked up offline, never over the network.
+# The bundled one is synthetic, made for the fictional sample cities by build_gazetteer.py.
+GAZETTEER_PATH = os.environ.get(
+    "FOOD_GAZETTEER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gazetteer_synthetic.csv")
+)
+# Side of a grid cell; searches scan the cells overlapping the circle's bounding box
+GRID_CELL_KM = float(os.environ.get("FOOD_GEO_CELL_KM", "50"))
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Last address line: "City, ST 12345"
+_ADDRESS_TAIL = re.compile(r"^(?P<city>.+?),\s*(?P<state>[A-Za-z]{2})\s+\d{5}(?:-\d{4})?$")
+
+
+def normalize(name):
+    """Matching key for a free-text place name: case, spacing and punctuation folded"""
+    if name is None or pd.isna(name):
+        return ""
+    return " ".join(re.sub(r"[.,']", " ", str(name)).casefold().split())
+
+
+def parse_address(address):
+    """(city, state) from the last line of a multi-line address, or (None, None)"""
+    if address is None or pd.isna(address):
+        return None, None
+    lines = [line.strip() for line in str(address).splitlines() if line.strip()]
+    match = _ADDRESS_TAIL.match(lines[-1]) if lines else None
+    if not match:
+        return None, None
+    return match.group("city"), match.group("state").upper()
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distance from one point to arrays of points"""
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class Gazetteer:
+    """Offline name -> coordinates lookup over the bundled CSV"""
+
+    def __init__(self, path=GAZETTEER_PATH):
+        df = pd.read_csv(path, dtype={"name": str, "kind": str}, keep_default_na=False)
+        self._points = {
+            (kind, normalize(name)): (float(lat), float(lon))
+            for name, kind, lat, lon in df[["name", "kind", "latitude", "longitude"]].itertuples(index=False)
+        }
+
+    def city(self, name):
+        """(lat, lon) of a city name, or None"""
+        return self._points.get(("city", normalize(name)))
+
+    def address(self, address):
+        """(lat, lon, precision) for a free-text address, or None.
+
+        The city on the last line is tried first, then the centre of its state.
+        """
+        city, state = parse_address(address)
+        if city is not None:
+            point = self.city(city)
+            if point is not None:
+                return point + ("city",)
+            point = self._points.get(("state", normalize(state)))
+            if point is not None:
+                return point + ("state",)
+        return None
+
+
+class GridIndex:
+    """Points bucketed into square lat/lon cells for radius queries.
+
+    Points are sorted by cell, and each occupied cell maps to a slice of the
+    sorted arrays, so a query touches only the cells under the circle's
+    bounding box and checks exact distances on those points with NumPy.
+    """
+
+    def __init__(self, keys, lats, lons, cell_km=GRID_CELL_KM):
+        self.cell = cell_km / KM_PER_DEGREE
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        rows, cols = self._cells(lats, lons)
+        order = np.lexsort((cols, rows))
+        self.keys = np.asarray(keys, dtype=object)[order]
+        self.lats, self.lons = lats[order], lons[order]
+        rows, cols = rows[order], cols[order]
+        starts = np.flatnonzero(np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])])
+        ends = np.r_[starts[1:], len(order)]
+        self._slices = {(int(rows[s]), int(cols[s])): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _cells(self, lats, lons):
+        return np.floor(lats / self.cell).astype(np.int64), np.floor(lons / self.cell).astype(np.int64)
+
+    def within(self, lat, lon, km):
+        """DataFrame of key and distance_km for points within `km`, nearest first"""
+        dlat = km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles; near them scan every column
+        shrink = math.cos(math.radians(min(abs(lat) + dlat, 90.0)))
+        dlon = 180.0 if shrink < 1e-6 else min(dlat / shrink, 180.0)
+        (r0, r1), (c0, c1) = self._cells(np.array([lat - dlat, lat + dlat]), np.array([lon - dlon, lon + dlon]))
+        picked = [
+            np.arange(*self._slices[(r, c)])
+            for r in range(int(r0), int(r1) + 1) for c in range(int(c0), int(c1) + 1)
+            if (r, c) in self._slices
+        ]
+        if not picked:
+            return pd.DataFrame({"key": [], "distance_km": []})
+        picked = np.concatenate(picked)
+        distance = haversine_km(lat, lon, self.lats[picked], self.lons[picked])
+        keep = distance <= km
+        df = pd.DataFrame({"key": self.keys[picked][keep], "distance_km": distance[keep]})
+        return df.sort_values(["distance_km", "key"], kind="stable").reset_index(drop=True)
+
+
+class CityLocator:
+    """Coordinates of the cities listings are posted in, and radius search over them.
+
+    The grid is built lazily and rebuilt when new city names show up, so
+    listings added in a new city become searchable without a restart.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._gazetteer = None
+        self._index = None
+        self._names = frozenset()
+
+    @property
+    def gazetteer(self):
+        if self._gazetteer is None:
+            self._gazetteer = Gazetteer()
+        return self._gazetteer
+
+    def locate(self, names):
+        """DataFrame of name, latitude, longitude for the names the gazetteer knows"""
+        found = [(n,) + p for n in names for p in [self.gazetteer.city(n)] if p is not None]
+        return pd.DataFrame(found, columns=["name", "latitude", "longitude"])
+
+    def index(self, names):
+        names = frozenset(n for n in names if n)
+        with self._lock:
+            if self._index is None or not names <= self._names:
+                points = self.locate(sorted(names | self._names))
+                self._index = GridIndex(points["name"], points["latitude"], points["longitude"])
+                self._names = names | self._names
+            return self._index
+
+    def nearby(self, origin, km, names):
+        """Names within `km` of the city `origin`, with distances; None if origin is unknown"""
+        point = self.gazetteer.city(origin)
+        if point is None:
+            return None
+        return self.index(names).within(point[0], point[1], km).rename(columns={"key": "name"})
+
+
+city_locator = CityLocator()
@@ -0,0 +1,354 @@
+"""Plan every query shape the app issues and recommend the indexes it is missing.
+
+    python index_advisor.py                      # report on FOOD_DB_PATH
+    python index_advisor.py --apply              # ...and create the recommended indexes
+    python index_advisor.py --synthetic 200000 --check   # CI: exit 1 on a new missing index
+
+Shapes are the Browse filter combinations, the admin and portal lookups, the
+Analytics and report queries, and the background jobs' statements. Each is
+run through EXPLAIN QUERY PLAN. A filtered table read by a full scan, a
+table scanned inside a join loop, or one read through an automatic index is
+tried against candidate indexes on a schema-only copy of the database, and
+the first one that turns the scan into an index search is recommended.
+SQLite only: PostgreSQL plans depend on its own statistics.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+# Lookups app.py runs with literal SQL (Browse and Analytics come from queries.py)
+APP_LOOKUPS = {
+    "listing by Food_ID": "SELECT * FROM food_listings WHERE Food_ID = ?",
+    "provider by Provider_ID": "SELECT * FROM providers WHERE Provider_ID = ?",
+    "receiver by Receiver_ID": "SELECT * FROM receivers WHERE Receiver_ID = ?",
+    "provider login": "SELECT * FROM providers WHERE Provider_ID = ? AND Contact = ?",
+    "provider's listings": "SELECT * FROM food_listings WHERE Provider_ID = ?",
+    "listing edit list": "SELECT Food_ID, Food_Name FROM food_listings ORDER BY Food_ID DESC",
+    "listing state counts": "SELECT Listing_Status, COUNT(*) AS n FROM food_listings GROUP BY Listing_Status",
+}
+# Full scans kept on purpose: (shape, table) -> why
+ACCEPTED_SCANS = {
+    ("job: archive candidates", "claims"): "completed and cancelled claims are most of the table",
+    ("report: Providers with most successful claims", "claims"): "Status has three values",
+    ("analytics: Provider with most completed claims", "claims"): "Status has three values",
+    ("analytics: Provider with most completed claims", "claim_rollups"): "one row per month, status and provider",
+    ("analytics: Most claimed meal type", "claim_rollups"): "one row per month, status and provider",
+    ("analytics: Claim status percent", "claim_states"): "one row per claim state",
+    ("analytics: Claim status percent", "receiver_claim_rollups"): "one row per month, status and receiver",
+    ("report: Providers with most successful claims", "claim_rollups"): "one row per month, status and provider",
+    ("report: Most claimed meal types", "claim_rollups"): "one row per month, status and provider",
+    ("report: Claim status percentages", "claim_states"): "one row per claim state",
+    ("report: Claim status percentages", "receiver_claim_rollups"): "one row per month, status and receiver",
+    ("report: Top 5 locations by claims ever made", "claim_daily"): "one row per day, city, provider type and status",
+    ("workflow: sync states", "claims"): "runs once at startup",
+}
+
+# "SCAN f", "SCAN f USING INDEX x", "SEARCH p USING AUTOMATIC COVERING INDEX (Provider_ID=?)"
+_ACCESS = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(?: USING (.*))?$")
+_FROM = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:WHERE|ON|JOIN|LEFT|INNER|CROSS|GROUP|ORDER|LIMIT|SET|USING|UNION|HAVING|VALUES)\b)(\w+))?", re.I)
+_OPERATOR = r"(?:=|<|>|\bIN\b|\bBETWEEN\b|\bLIKE\b|\bIS\b)"
+
+
+# ---------------- Shapes ----------------
+def shapes():
+    """(name, sql) for every statement shape the app issues"""
+    import archive
+    import cascade
+    import notifications
+    import reports
+    import snapshot
+    import sweeper
+    import workflow
+    from queries import ANALYTICS_QUERIES, browse_query
+
+    cities = {"all": None, "one": "C", "nearby": ["A", "B", "C"]}
+    food_types = {"any": None, "1": ["V"], "2": ["V", "W"], "3": ["V", "W", "X"]}
+    for (c, city), provider, (f, food), meal in product(cities.items(), (None, "P"), food_types.items(), (None, "M")):
+        name = f"browse: city={c} provider={'one' if provider else 'all'} food_type={f} meal={'one' if meal else 'all'}"
+        yield name, browse_query(city, provider, food, meal)[0]
+    for title, sql in APP_LOOKUPS.items():
+        yield f"lookup: {title}", sql
+    for title, sql in ANALYTICS_QUERIES.items():
+        yield f"analytics: {title}", sql
+    for report in reports.REPORTS.values():
+        yield f"report: {report.title}", report.sql
+    yield "job: browse snapshot", snapshot.SNAPSHOT_QUERY
+    yield "job: sweeper expired listings", sweeper.EXPIRED_QUERY
+    yield "job: sweeper cancel claims", sweeper.CANCEL_UPDATE
+    yield "job: archive candidates", archive.CANDIDATES_QUERY
+    yield "job: cascade provider listings", cascade.PROVIDER_LISTINGS_QUERY
+    yield "job: cascade receiver claims", cascade.RECEIVER_CLAIMS_QUERY
+    yield "job: cascade listing claims", cascade.LISTING_CLAIMS_DELETE
+    yield "job: notifications due", notifications.DUE_PROVIDERS_QUERY
+    yield "job: notifications lease", notifications.LEASE_UPDATE
+    yield "job: notifications leased rows", notifications.LEASED_QUERY.format(providers="?")
+    yield "workflow: submit claim", workflow.SUBMIT_INSERT
+    yield "workflow: sync states", workflow.SYNC_UPDATE
+    yield "workflow: provider claims", workflow.PROVIDER_CLAIMS_QUERY
+    yield "workflow: claim history", workflow.HISTORY_QUERY
+    yield "workflow: receiver claims, first page", workflow.RECEIVER_CLAIMS_QUERY.format(after="")
+    yield "workflow: receiver claims, next page", workflow.RECEIVER_CLAIMS_QUERY.format(after=" AND c.Claim_ID < ?")
+    yield "workflow: receiver summary", workflow.RECEIVER_SUMMARY_QUERY
+    yield "workflow: receiver archived claims", workflow.RECEIVER_ARCHIVED_QUERY
+    yield "workflow: receivers of moved claims", "SELECT DISTINCT Receiver_ID FROM claims WHERE Claim_ID IN (?)"
+    for n in (1, 500):
+        claims = ",".join("?" * n)
+        yield (f"workflow: move {n} claims",
+               f"UPDATE claims SET State = ?, Status = ? WHERE Claim_ID IN ({claims}) AND State IN (?, ?) "
+               "AND Food_ID IN (SELECT Food_ID FROM food_listings WHERE Provider_ID = ?)")
+
+
+# ---------------- Plans ----------------
+def plan(conn, sql):
+    """EXPLAIN QUERY PLAN rows (id, parent, detail), with every parameter bound to NULL"""
+    sql = sql.strip().rstrip(";")
+    return [(row[0], row[1], row[3]) for row in conn.execute("EXPLAIN QUERY PLAN " + sql, (None,) * sql.count("?"))]
+
+
+def _aliases(sql, tables):
+    """alias -> table for the real tables a statement reads"""
+    found = {}
+    for table, alias in _FROM.findall(sql):
+        if table in tables:
+            found[table] = table
+            if alias:
+                found[alias] = table
+    return found
+
+
+def _predicate_columns(sql, alias, table, columns):
+    """(filter columns, join columns) of `table` in the statement, each in order of appearance.
+
+    A join column is compared with another table's column; a filter column
+    with a parameter, a literal or an expression.
+    """
+    ref_prefix = rf"\b{alias}\." if alias != table else r"(?<![\w.])(?:\b" + table + r"\.)?"
+    filters, joins = [], []
+    for column in columns:
+        ref = ref_prefix + re.escape(column) + r"\b"
+        join = re.search(ref + r"\s*=\s*\w+\.\w+|\w+\.\w+\s*=\s*" + ref, sql)
+        match = re.search(ref + r"\s*" + _OPERATOR, sql, re.I) or re.search(r"(?:=|<|>)\s*" + ref, sql)
+        if join:
+            joins.append((join.start(), column))
+        elif match:
+            filters.append((match.start(), column))
+    return [c for _, c in sorted(filters)], [c for _, c in sorted(joins)]
+
+
+def problems(conn, sql, schema):
+    """(alias, table, kind, candidate columns) for tables read without a usable index.
+
+    A full scan is a problem when the table is filtered, or when it is not
+    the outer loop of its join, so it is read again for every outer row.
+    """
+    aliases = _aliases(sql, schema)
+    found = []
+    outer = set()
+    for _, parent, detail in plan(conn, sql):
+        match = _ACCESS.match(detail)
+        if not match:
+            continue
+        verb, name, alias, using = match.groups()
+        is_outer = parent not in outer
+        outer.add(parent)
+        alias = alias or name
+        table = aliases.get(alias) or aliases.get(name)
+        if table is None:
+            continue
+        filters, joins = _predicate_columns(sql, alias, table, schema[table])
+        if using and "AUTOMATIC" in using:
+            kind, columns = "automatic index", filters + joins
+        elif verb == "SCAN" and not using and not is_outer:
+            kind, columns = "nested scan", filters + joins
+        elif verb == "SCAN" and not using:
+            kind, columns = "full scan", filters
+        else:
+            continue
+        found.append((alias, table, kind, columns))
+    return found
+
+
+class WhatIf:
+    """Schema-only copy of the database (with its statistics) to try candidate indexes on"""
+
+    def __init__(self, source):
+        self.path = tempfile.mktemp(suffix=".db")
+        conn = sqlite3.connect(self.path)
+        for (sql,) in source.execute(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND type IN ('table', 'index') "
+            "AND name NOT LIKE 'sqlite_%' ORDER BY type = 'index'"
+        ):
+            conn.execute(sql)
+        has_stats = source.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        if has_stats:
+            conn.execute("ANALYZE")
+            conn.execute("DELETE FROM sqlite_stat1")
+            conn.executemany("INSERT INTO sqlite_stat1 VALUES (?, ?, ?)", source.execute("SELECT * FROM sqlite_stat1"))
+        conn.commit()
+        conn.close()
+        # The planner reads sqlite_stat1 when the database is opened
+        self.conn = sqlite3.connect(self.path)
+
+    def fixes(self, sql, alias, table, columns):
+        """True if an index on `columns` of `table` stops the statement scanning it"""
+        self.conn.execute(f"CREATE INDEX advisor_candidate ON {table} ({', '.join(columns)})")
+        try:
+            schema = {table: []}
+            return not any(a == alias and t == table for a, t, _, _ in problems(self.conn, sql, schema))
+        finally:
+            self.conn.execute("DROP INDEX advisor_candidate")
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def _candidates(columns):
+    """Each column alone, then all of them together, then each shorter prefix"""
+    seen = [[column] for column in columns]
+    for n in range(len(columns), 1, -1):
+        seen.append(columns[:n])
+    return seen
+
+
+def index_name(table, columns):
+    return f"{table}_{'_'.join(c.lower() for c in columns)}"
+
+
+def advise(conn):
+    """Plan every shape; returns (report rows, {index sql: [shapes it fixes]})"""
+    schema = {
+        table: [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+    }
+    whatif = WhatIf(conn)
+    rows, recommended = [], {}
+    try:
+        for name, sql in shapes():
+            try:
+                found = problems(conn, sql, schema)
+            except sqlite3.Error as e:
+                rows.append({"shape": name, "table": None, "access": f"error: {e}", "index": None})
+                continue
+            if not found:
+                rows.append({"shape": name, "table": None, "access": "indexed", "index": None})
+            for alias, table, kind, columns in found:
+                row = {"shape": name, "table": table, "access": kind, "index": None}
+                if not columns:
+                    row["access"] = kind + " (no filter)"
+                elif (name, table) in ACCEPTED_SCANS:
+                    row["access"] = kind + " (accepted: " + ACCEPTED_SCANS[(name, table)] + ")"
+                else:
+                    for candidate in _candidates(columns):
+                        if whatif.fixes(sql, alias, table, candidate):
+                            row["index"] = (f"CREATE INDEX IF NOT EXISTS {index_name(table, candidate)} "
+                                            f"ON {table} ({', '.join(candidate)})")
+                            recommended.setdefault(row["index"], []).append(name)
+                            break
+                rows.append(row)
+    finally:
+        whatif.close()
+    return pd.DataFrame(rows), recommended
+
+
+# ---------------- Synthetic data ----------------
+def build_synthetic(source, path, listings, seed=0):
+    """A copy of `source` grown to `listings` listings and as many claims, with matching parents"""
+    rng = np.random.default_rng(seed)
+    src = sqlite3.connect(source)
+    tables = {t: pd.read_sql_query(f"SELECT * FROM {t}", src) for t in ("providers", "receivers", "food_listings", "claims")}
+    src.close()
+
+    def grow(df, n, key):
+        out = df.sample(n, replace=True, random_state=seed).reset_index(drop=True)
+        out[key] = np.arange(1, n + 1)
+        return out
+
+    n_parents = max(listings // 50, len(tables["providers"]))
+    providers = grow(tables["providers"], n_parents, "Provider_ID")
+    receivers = grow(tables["receivers"], n_parents, "Receiver_ID")
+    food = grow(tables["food_listings"], listings, "Food_ID")
+    food["Provider_ID"] = rng.integers(1, n_parents + 1, listings)
+    days = rng.integers(-60, 60, listings)
+    food["Expiry_Date"] = (pd.Timestamp.today().normalize() + pd.to_timedelta(days, unit="D")).strftime("%Y-%m-%d")
+    claims = grow(tables["claims"], listings, "Claim_ID")
+    claims["Food_ID"] = rng.integers(1, listings + 1, listings)
+    claims["Receiver_ID"] = rng.integers(1, n_parents + 1, listings)
+    ago = rng.integers(0, 365 * 24 * 3600, listings)
+    claims["Timestamp"] = (pd.Timestamp.now().floor("s") - pd.to_timedelta(ago, unit="s")).strftime("%Y-%m-%d %H:%M:%S")
+
+    from storage import SQLiteBackend
+
+    target = SQLiteBackend(path)
+    for name, df in (("providers", providers), ("receivers", receivers), ("food_listings", food), ("claims", claims)):
+        target.load_table(df, name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--synthetic", type=int, metavar="N",
+                        help="plan against a temporary copy grown to N listings and N claims")
+    parser.add_argument("--apply", action="store_true", help="create the recommended indexes")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any index is recommended")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="list every shape, not only problems")
+    args = parser.parse_args()
+
+    workdir = None
+    if args.synthetic:
+        workdir = tempfile.mkdtemp()
+        path = os.path.join(workdir, "synthetic.db")
+        source = os.environ.get("FOOD_DB_PATH", "food_wastage.db")
+        os.environ["FOOD_DB_PATH"] = path
+        build_synthetic(source, path, args.synthetic)
+    # Imported late so the database chosen above is the one the modules open
+    import storage
+    from db import ensure_schema
+
+    if storage.BACKEND != "sqlite":
+        sys.exit("index_advisor.py reads SQLite query plans; unset FOOD_DB_BACKEND")
+    try:
+        ensure_schema()
+        conn = sqlite3.connect(storage.DB_PATH)
+        if args.synthetic:
+            # Grown claims only carry Status, as CSV imports do; give them a State as app startup would
+            import workflow
+            workflow.sync_states()
+            conn.execute("ANALYZE")
+            conn.commit()
+        report, recommended = advise(conn)
+        if args.apply:
+            for sql in recommended:
+                conn.execute(sql)
+            conn.commit()
+        conn.close()
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    shown = report if args.verbose else report[report["access"] != "indexed"]
+    with pd.option_context("display.max_rows", None, "display.max_colwidth", 90, "display.width", 250):
+        print(shown.fillna("").to_string(index=False))
+    print(f"\n{report['shape'].nunique()} shapes, {int(report['access'].str.startswith('full scan').sum())} full scans, "
+          f"{int(report['access'].str.startswith('nested scan').sum())} nested scans, "
+          f"{int(report['access'].str.startswith('automatic').sum())} automatic indexes")
+    for sql, fixed in recommended.items():
+        print(f"{'created' if args.apply else 'recommend'}: {sql};  -- {len(fixed)} shapes, e.g. {fixed[0]}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"shapes": report.to_dict("records"), "recommended": recommended}, f, indent=2)
+    if args.check and recommended and not args.apply:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+
+# ---------------- Settings ----------------
+METRICS_FILE = os.environ.get("FOOD_METRICS_FILE", "metrics.prom")
+# Minimum seconds between metrics file rewrites; 0 disables the file export.
+METRICS_INTERVAL = float(os.environ.get("FOOD_METRICS_INTERVAL", "10"))
+
+PHASES = ("setup", "fetch", "frame", "render")
+RERUN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger("food_wastage.metrics")
+
+
+class Rerun:
+    """Stopwatch for one script run, split into PHASES"""
+
+    __slots__ = ("started", "last_lap", "phases", "_data_since_lap")
+
+    def __init__(self):
+        self.started = self.last_lap = time.perf_counter()
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self._data_since_lap = 0.0
+
+    def add_data(self, fetch_seconds, frame_seconds):
+        self.phases["fetch"] += fetch_seconds
+        self.phases["frame"] += frame_seconds
+        self._data_since_lap += fetch_seconds + frame_seconds
+
+    def lap(self, phase):
+        """Charge the time since the previous lap, minus data access, to `phase`"""
+        now = time.perf_counter()
+        self.phases[phase] += max(now - self.last_lap - self._data_since_lap, 0.0)
+        self.last_lap = now
+        self._data_since_lap = 0.0
+
+
+class RenderMetrics:
+    """Process-wide rerun timings per page, exported as Prometheus text"""
+
+    def __init__(self, path=METRICS_FILE, interval=METRICS_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._phase_totals = {}   # (page, phase) -> seconds
+        self._reruns = {}         # page -> [count, seconds, bucket counts]
+        self._counters = {}       # name -> [help, value]
+        self._last_export = 0.0
+
+    # ---- per-rerun hooks ----
+    def start_rerun(self):
+        rerun = self._local.rerun = Rerun()
+        return rerun
+
+    def in_rerun(self):
+        return getattr(self._local, "rerun", None) is not None
+
+    def add_data_time(self, fetch_seconds, frame_seconds):
+        """Called by the data layer; a no-op outside a Streamlit rerun"""
+        rerun = getattr(self._local, "rerun", None)
+        if rerun is not None:
+            rerun.add_data(fetch_seconds, frame_seconds)
+
+    def finish_rerun(self, page):
+        rerun = self._local.rerun
+        self._local.rerun = None
+        # Whatever the page did besides fetching and framing data is widget render time
+        rerun.lap("render")
+        total = rerun.last_lap - rerun.started
+        with self._lock:
+            for phase, seconds in rerun.phases.items():
+                key = (page, phase)
+                self._phase_totals[key] = self._phase_totals.get(key, 0.0) + seconds
+            entry = self._reruns.setdefault(page, [0, 0.0, [0] * len(RERUN_BUCKETS)])
+            entry[0] += 1
+            entry[1] += total
+            for i, bound in enumerate(RERUN_BUCKETS):
+                if total <= bound:
+                    entry[2][i] += 1
+        self.maybe_export()
+        return rerun
+
+    # ---- background jobs ----
+    def inc(self, name, amount=1, help=""):
+        """Add to a process-wide counter exported as `name`"""
+        with self._lock:
+            entry = self._counters.setdefault(name, [help, 0])
+            entry[1] += amount
+
+    def counter(self, name):
+        with self._lock:
+            return self._counters.get(name, ["", 0])[1]
+
+    # ---- reporting ----
+    def page_summary(self):
+        """Rows of page, reruns, average seconds per phase"""
+        with self._lock:
+            rows = []
+            for page, (count, total, _) in sorted(self._reruns.items()):
+                row = {"Page": page, "Reruns": count, "Avg_total_ms": round(total / count * 1000, 2)}
+                for phase in PHASES:
+                    row[f"Avg_{phase}_ms"] = round(self._phase_totals.get((page, phase), 0.0) / count * 1000, 2)
+                rows.append(row)
+            return rows
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP food_rerun_phase_seconds_total Time spent per rerun phase.",
+            "# TYPE food_rerun_phase_seconds_total counter",
+        ]
+        with self._lock:
+            for (page, phase), seconds in sorted(self._phase_totals.items()):
+                lines.append(f'food_rerun_phase_seconds_total{{page="{_escape(page)}",phase="{phase}"}} {seconds:.6f}')
+            lines.append("# HELP food_rerun_seconds Wall time of a full script rerun.")
+            lines.append("# TYPE food_rerun_seconds histogram")
+            for page, (count, total, buckets) in sorted(self._reruns.items()):
+                label = f'page="{_escape(page)}"'
+                for bound, hits in zip(RERUN_BUCKETS, buckets):
+                    lines.append(f'food_rerun_seconds_bucket{{{label},le="{bound}"}} {hits}')
+                lines.append(f'food_rerun_seconds_bucket{{{label},le="+Inf"}} {count}')
+                lines.append(f"food_rerun_seconds_sum{{{label}}} {total:.6f}")
+                lines.append(f"food_rerun_seconds_count{{{label}}} {count}")
+            for name, (help, value) in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def maybe_export(self, force=False):
+        if self.interval <= 0 and not force:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_export < self.interval:
+                return
+            self._last_export = now
+        # A temp file per writer, as sessions and worker processes export concurrently;
+        # a failed export is logged rather than failing the rerun that triggered it
+        tmp = None
+        try:
+            with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(self.path) or ".",
+                                             prefix=".metrics-", delete=False) as f:
+                tmp = f.name
+                f.write(self.prometheus_text())
+            # NamedTemporaryFile is owner-only; scrapers read the file as another user
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, self.path)
+        except OSError:
+            logger.exception("metrics export to %s failed", self.path)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
+    def reset(self):
+        with self._lock:
+            self._phase_totals.clear()
+            self._reruns.clear()
+            self._counters.clear()
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+render_metrics = RenderMetrics()
@@ -0,0 +1,325 @@
+"""Provider notifications for new claims, sent in the background as digests.
+
+Claim inserts are read from the change_events log into notification_outbox,
+then each provider's pending claims go out together through a sink:
+
+    FOOD_NOTIFY_SINK=file                  # JSON lines in FOOD_NOTIFY_FILE (default)
+    FOOD_NOTIFY_SINK=smtp                  # e.g. python -m aiosmtpd -n -l localhost:1025
+    FOOD_NOTIFY_SINK=mypackage.sinks:Slack # any callable returning an object with send(digest)
+
+The dispatcher runs in the background only when FOOD_NOTIFY_INTERVAL is set;
+otherwise run a round from the Performance page or from cron:
+
+    python notifications.py                # one round
+    python notifications.py --follow 30    # a round every 30 s
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+
+import pandas as pd
+
+import cdc
+from db import run_commit, run_many, run_query
+from metrics import render_metrics
+
+# ---------------- Settings ----------------
+# Seconds between dispatcher rounds (0 = no background worker; send from the Performance page)
+NOTIFY_INTERVAL = float(os.environ.get("FOOD_NOTIFY_INTERVAL", "0"))
+NOTIFY_SINK = os.environ.get("FOOD_NOTIFY_SINK", "file")
+NOTIFY_FILE = os.environ.get("FOOD_NOTIFY_FILE", "notifications.log")
+# A provider's digest waits this long after its first pending claim so later claims join it
+DIGEST_SECONDS = float(os.environ.get("FOOD_NOTIFY_DIGEST_SECONDS", "60"))
+# Digests sent per minute at most, across all providers
+NOTIFY_RATE = float(os.environ.get("FOOD_NOTIFY_RATE", "60"))
+SMTP_HOST = os.environ.get("FOOD_NOTIFY_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("FOOD_NOTIFY_SMTP_PORT", "1025"))
+SMTP_TO = os.environ.get("FOOD_NOTIFY_SMTP_TO", "providers@localhost")
+MAX_ATTEMPTS = 5
+# Retry n waits RETRY_BASE * 2**(n-1) seconds, up to RETRY_MAX
+RETRY_BASE = 30
+RETRY_MAX = 3600
+# Rows claimed by a dispatcher that dies become due again after this long
+LEASE_SECONDS = 120
+SENT_RETENTION_DAYS = 7
+
+logger = logging.getLogger("food_wastage.notifications")
+
+OUTBOX_INSERT = """
+  INSERT INTO notification_outbox (event_seq, provider_id, food_id, food_name, receiver_id, claimed_at,
+                                   status, attempts, next_attempt_at)
+  VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?)
+  ON CONFLICT (event_seq) DO NOTHING
+"""
+DUE_PROVIDERS_QUERY = """
+  SELECT provider_id FROM notification_outbox
+  WHERE status = 'pending' AND next_attempt_at <= ?
+  GROUP BY provider_id ORDER BY MIN(next_attempt_at) LIMIT ?
+"""
+# New rows of a due provider join its digest early; retries wait for their backoff
+LEASE_UPDATE = """
+  UPDATE notification_outbox SET lease_owner = ?, next_attempt_at = ?
+  WHERE status = 'pending' AND provider_id = ?
+    AND (next_attempt_at <= ? OR (attempts = 0 AND lease_owner IS NULL))
+"""
+LEASED_QUERY = """
+  SELECT o.event_seq, o.provider_id, o.food_id, o.food_name, o.receiver_id, o.claimed_at, o.attempts,
+         p.Name AS Provider_Name, p.Contact AS Provider_Contact, r.Name AS Receiver_Name
+  FROM notification_outbox o
+  LEFT JOIN providers p ON p.Provider_ID = o.provider_id
+  LEFT JOIN receivers r ON r.Receiver_ID = o.receiver_id
+  WHERE o.provider_id IN ({providers}) AND o.lease_owner = ? AND o.status = 'pending'
+  ORDER BY o.provider_id, o.event_seq
+"""
+SENT_UPDATE = """
+  UPDATE notification_outbox SET status = 'sent', sent_at = ?, lease_owner = NULL
+  WHERE lease_owner = ? AND provider_id = ?
+"""
+FAILED_UPDATE = """
+  UPDATE notification_outbox
+  SET status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+      attempts = attempts + 1, next_attempt_at = ?, last_error = ?, lease_owner = NULL
+  WHERE lease_owner = ? AND provider_id = ?
+"""
+
+
+def _stamp(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# ---------------- Digests and sinks ----------------
+class Digest:
+    """All pending claims for one provider, sent as one message"""
+
+    __slots__ = ("provider_id", "provider_name", "contact", "claims")
+
+    def __init__(self, provider_id, provider_name, contact, claims):
+        self.provider_id = provider_id
+        self.provider_name = provider_name
+        self.contact = contact
+        self.claims = claims
+
+    @property
+    def subject(self):
+        n = len(self.claims)
+        return f"{n} new claim{'s' if n != 1 else ''} on your food listings"
+
+    def body(self):
+        lines = [f"Hello {self.provider_name or 'provider'},", "", "These listings were claimed:"]
+        for c in self.claims:
+            who = c["receiver_name"] or f"receiver {c['receiver_id']}"
+            lines.append(f"  - {c['food_name'] or 'Food ' + str(c['food_id'])} (Food ID {c['food_id']}) by {who} at {c['claimed_at']}")
+        return "\n".join(lines) + "\n"
+
+    def as_dict(self):
+        return {"provider_id": self.provider_id, "provider_name": self.provider_name, "contact": self.contact,
+                "subject": self.subject, "claims": self.claims}
+
+
+class FileSink:
+    """Appends each digest as one JSON line; for local testing"""
+
+    def __init__(self, path=NOTIFY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send(self, digest):
+        record = dict(digest.as_dict(), sent_at=_stamp(_utcnow()))
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+class SmtpSink:
+    """Plain SMTP without auth, e.g. a local debugging server"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, to=SMTP_TO, sender="noreply@localhost"):
+        self.host, self.port, self.to, self.sender = host, port, to, sender
+
+    def send(self, digest):
+        msg = EmailMessage()
+        msg["From"] = self.sender
+        # Providers only have phone contacts; the debug sink collects everything in one mailbox
+        msg["To"] = digest.contact if digest.contact and "@" in digest.contact else self.to
+        msg["Subject"] = f"[{digest.provider_name}] {digest.subject}"
+        msg.set_content(digest.body())
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.send_message(msg)
+
+
+SINKS = {"file": FileSink, "smtp": SmtpSink}
+
+
+def make_sink(spec=NOTIFY_SINK):
+    """A sink by name ("file", "smtp") or "module:callable" path"""
+    if spec in SINKS:
+        return SINKS[spec]()
+    module, _, name = spec.partition(":")
+    return getattr(importlib.import_module(module), name)()
+
+
+# ---------------- Outbox ----------------
+def enqueue(consumer, now=None):
+    """Copy new claim inserts from the change log into the outbox; returns rows queued"""
+    events = [e for e in consumer.poll() if e.op == "insert" and e.new]
+    queued = 0
+    if events:
+        food_ids = sorted({e.new["Food_ID"] for e in events if e.new.get("Food_ID") is not None})
+        listings = {}
+        if food_ids:
+            df = run_query(
+                f"SELECT Food_ID, Provider_ID, Food_Name FROM food_listings WHERE Food_ID IN ({','.join('?' * len(food_ids))})",
+                tuple(food_ids),
+            )
+            for food_id, provider_id, name in df.itertuples(index=False):
+                listings.setdefault(int(food_id), (None if pd.isna(provider_id) else int(provider_id), name))
+        due = _stamp((now or _utcnow()) + timedelta(seconds=DIGEST_SECONDS))
+        rows = []
+        for e in events:
+            provider_id, name = listings.get(e.new.get("Food_ID"), (None, None))
+            if provider_id is None:
+                render_metrics.inc("food_notifications_unroutable_total", 1, "Claims whose listing has no provider to notify.")
+                continue
+            rows.append((e.seq, provider_id, e.new["Food_ID"], name, e.new.get("Receiver_ID"), e.new.get("Timestamp"), due))
+        # The event seq is the outbox key, so a batch seen twice is queued once
+        queued = run_many([(OUTBOX_INSERT, rows)])[0]
+    consumer.commit()
+    return queued
+
+
+def dispatch(sink, now=None, limit=None):
+    """Send due digests, at most `limit`; returns (sent digests, failed digests)"""
+    now = now or _utcnow()
+    providers = run_query(DUE_PROVIDERS_QUERY, (_stamp(now), int(limit if limit is not None else 1000)))
+    if providers.empty:
+        return 0, 0
+    owner = uuid.uuid4().hex
+    lease = _stamp(now + timedelta(seconds=LEASE_SECONDS))
+    ids = [int(p) for p in providers["provider_id"]]
+    run_many([(LEASE_UPDATE, [(owner, lease, p, _stamp(now)) for p in ids])])
+    rows = run_query(LEASED_QUERY.format(providers=",".join("?" * len(ids))), tuple(ids) + (owner,))
+
+    sent = failed = 0
+    for provider_id, group in rows.groupby("provider_id", sort=False):
+        first = group.iloc[0]
+        digest = Digest(int(provider_id), first["Provider_Name"], first["Provider_Contact"], [
+            {"food_id": int(r.food_id), "food_name": r.food_name, "receiver_id": None if pd.isna(r.receiver_id) else int(r.receiver_id),
+             "receiver_name": None if pd.isna(r.Receiver_Name) else r.Receiver_Name, "claimed_at": r.claimed_at}
+            for r in group.itertuples(index=False)
+        ])
+        try:
+            sink.send(digest)
+        except Exception as e:
+            attempts = int(group["attempts"].max()) + 1
+            retry = now + timedelta(seconds=min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX))
+            run_commit(FAILED_UPDATE, (MAX_ATTEMPTS, _stamp(retry), str(e)[:500], owner, int(provider_id)))
+            logger.warning("notification to provider %s failed (attempt %d): %s", provider_id, attempts, e)
+            failed += 1
+            render_metrics.inc("food_notification_failures_total", 1, "Digest sends that raised and will be retried or given up.")
+            continue
+        run_commit(SENT_UPDATE, (_stamp(now), owner, int(provider_id)))
+        sent += 1
+        render_metrics.inc("food_notification_digests_total", 1, "Provider digests sent.")
+        render_metrics.inc("food_notification_claims_total", len(group), "Claims included in sent digests.")
+    return sent, failed
+
+
+def outbox_stats():
+    """Outbox rows per status"""
+    df = run_query("SELECT status, COUNT(*) AS n FROM notification_outbox GROUP BY status")
+    return dict(zip(df["status"], df["n"].astype(int)))
+
+
+# ---------------- Worker ----------------
+class NotificationWorker:
+    """Background thread that queues new claims and sends due digests.
+
+    Sends are spaced by a token bucket refilled at NOTIFY_RATE per minute,
+    so a burst of claims turns into a steady trickle rather than tripping
+    the mail server's limits. The claim request itself never waits on it.
+    """
+
+    def __init__(self, interval=NOTIFY_INTERVAL, sink=None, rate=NOTIFY_RATE):
+        self.interval = interval
+        self.rate = rate
+        self._sink = sink
+        self._consumer = cdc.ChangeConsumer("notifications", tables=["claims"], start="latest")
+        self._tokens = rate
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def sink(self):
+        if self._sink is None:
+            self._sink = make_sink()
+        return self._sink
+
+    def start(self):
+        # Register even without a background thread so claims made before the
+        # first round (from the Performance page or cron) are not skipped
+        self._consumer.position
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="notification-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("notification round failed")
+            self._stop.wait(self.interval)
+
+    def run_once(self, now=None):
+        """One round: queue new claims, then send what the rate allows"""
+        with self._lock:
+            queued = enqueue(self._consumer, now)
+            current = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (current - self._refilled) * self.rate / 60.0)
+            self._refilled = current
+            sent = failed = 0
+            if self._tokens >= 1:
+                sent, failed = dispatch(self.sink, now, int(self._tokens))
+                self._tokens -= sent + failed
+            run_commit("DELETE FROM notification_outbox WHERE status = 'sent' AND sent_at < ?",
+                       (_stamp((now or _utcnow()) - timedelta(days=SENT_RETENTION_DAYS)),))
+            return {"queued": queued, "sent": sent, "failed": failed}
+
+
+notification_worker = NotificationWorker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--follow", type=float, metavar="SECONDS", help="keep running a round every SECONDS")
+    args = parser.parse_args()
+
+    from db import ensure_schema
+    ensure_schema()
+    while True:
+        result = notification_worker.run_once()
+        print(f"queued {result['queued']}, sent {result['sent']}, failed {result['failed']}", flush=True)
+        if not args.follow:
+            break
+        time.sleep(args.follow)
+
+
+if __name__ == "__main__":
+    main()
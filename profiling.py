@@ -0,0 +1,135 @@
+import logging
+import logging.handlers
+import os
+import random
+import re
+import threading
+import time
+
+# ---------------- Settings ----------------
+# FOOD_PROFILE_SAMPLE is the fraction of statements to time (0 = off, 1 = all).
+SAMPLE_RATE = float(os.environ.get("FOOD_PROFILE_SAMPLE", "0"))
+SLOW_QUERY_MS = float(os.environ.get("FOOD_SLOW_QUERY_MS", "200"))
+SLOW_LOG_PATH = os.environ.get("FOOD_SLOW_LOG", "slow_queries.log")
+SLOW_LOG_MAX_BYTES = 1024 * 1024
+SLOW_LOG_BACKUPS = 3
+RECENT_SLOW_LIMIT = 50
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    """Collapse whitespace so the same statement always maps to one key"""
+    return _WHITESPACE.sub(" ", query).strip().rstrip(";")
+
+
+class QueryStat:
+    __slots__ = ("page", "sql", "calls", "total_ms", "max_ms", "rows")
+
+    def __init__(self, page, sql):
+        self.page = page
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+
+
+class QueryProfiler:
+    """Process-wide statement timings, grouped by page and normalized SQL"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, slow_ms=SLOW_QUERY_MS, log_path=SLOW_LOG_PATH):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self._stats = {}
+        self._recent_slow = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._logger = None
+
+    # Page tagging: Streamlit runs each session on its own script thread
+    def set_page(self, page):
+        self._local.page = page
+
+    def current_page(self):
+        return getattr(self._local, "page", None) or "-"
+
+    def sampled(self):
+        rate = self.sample_rate
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def record(self, query, params, elapsed, rows, plan=None):
+        elapsed_ms = elapsed * 1000.0
+        sql = normalize_sql(query)
+        page = self.current_page()
+        with self._lock:
+            stat = self._stats.get((page, sql))
+            if stat is None:
+                stat = self._stats[(page, sql)] = QueryStat(page, sql)
+            stat.calls += 1
+            stat.total_ms += elapsed_ms
+            stat.max_ms = max(stat.max_ms, elapsed_ms)
+            stat.rows += rows
+        if elapsed_ms >= self.slow_ms:
+            self._record_slow(sql, params, elapsed_ms, rows, page, plan)
+
+    def _record_slow(self, sql, params, elapsed_ms, rows, page, plan):
+        # plan is a callable so the EXPLAIN only runs for slow statements
+        plan = plan() if plan is not None else ""
+        entry = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "page": page,
+            "ms": round(elapsed_ms, 2),
+            "rows": rows,
+            "sql": sql,
+            "plan": plan,
+        }
+        with self._lock:
+            self._recent_slow.append(entry)
+            del self._recent_slow[:-RECENT_SLOW_LIMIT]
+        self._get_logger().warning(
+            "%.2fms | page=%s | rows=%d | %s | params=%r\n%s",
+            elapsed_ms, page, rows, sql, tuple(params or ()), plan,
+        )
+
+    def _get_logger(self):
+        if self._logger is None:
+            logger = logging.getLogger("food_wastage.slow_queries")
+            logger.propagate = False
+            if not logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(
+                    self.log_path, maxBytes=SLOW_LOG_MAX_BYTES, backupCount=SLOW_LOG_BACKUPS
+                )
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                logger.addHandler(handler)
+            self._logger = logger
+        return self._logger
+
+    def top_queries(self, n=10):
+        with self._lock:
+            stats = sorted(self._stats.values(), key=lambda s: s.total_ms, reverse=True)[:n]
+            return [
+                {
+                    "Page": s.page,
+                    "Calls": s.calls,
+                    "Total_ms": round(s.total_ms, 2),
+                    "Avg_ms": round(s.total_ms / s.calls, 3),
+                    "Max_ms": round(s.max_ms, 2),
+                    "Rows": s.rows,
+                    "SQL": s.sql,
+                }
+                for s in stats
+            ]
+
+    def recent_slow(self):
+        with self._lock:
+            return list(reversed(self._recent_slow))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._recent_slow.clear()
+
+
+profiler = QueryProfiler()
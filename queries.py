@@ -0,0 +1,84 @@
+# ---------------- Query shapes ----------------
+# SQL the pages issue, kept outside app.py so index_advisor.py can plan the same
+# statements without running the Streamlit script.
+
+BROWSE_QUERY = """
+  SELECT f.Food_ID, f.Food_Name, f.Quantity, f.Expiry_Date, f.Meal_Type, f.Food_Type, f.Location,
+         p.Provider_ID, p.Name as Provider_Name, p.Contact as Provider_Contact, p.Address as Provider_Address
+  FROM food_listings f
+  JOIN providers p ON f.Provider_ID = p.Provider_ID
+"""
+
+
+def in_list(column, values):
+    """`column IN (...)` with the list padded to a power of two by repeating the last value.
+
+    Any n values give one of log2(n) statement strings, so the statement caches
+    on both backends keep reusing the same few prepared statements.
+    """
+    values = list(values)
+    size = 1 << (len(values) - 1).bit_length()
+    values += values[-1:] * (size - len(values))
+    return f"{column} IN ({','.join('?' * size)})", values
+
+
+def browse_query(city=None, provider=None, food_type=None, meal=None):
+    """(sql, params) for Browse; `city` is one name or a list of names"""
+    # Listings past their expiry date are retired by the expiry sweeper
+    where = ["f.Listing_Status = 'Available'"]
+    params = []
+    if isinstance(city, list):
+        clause, values = in_list("f.Location", city)
+        where.append(clause); params.extend(values)
+    elif city and city != "All":
+        where.append("f.Location = ?"); params.append(city)
+    if provider and provider != "All":
+        where.append("p.Name = ?"); params.append(provider)
+    if food_type:
+        clause, values = in_list("f.Food_Type", food_type)
+        where.append(clause); params.extend(values)
+    if meal and meal != "All":
+        where.append("f.Meal_Type = ?"); params.append(meal)
+    return BROWSE_QUERY + " WHERE " + " AND ".join(where) + " ORDER BY f.Expiry_Date ASC;", tuple(params)
+
+
+# Claim queries add the monthly rollups of archived claims (archive.py) to the live table;
+# claims per food item only looks at live claims, as archived ones belong to past listings.
+# Live claims per status come from the claim_states counters (workflow.py).
+ANALYTICS_QUERIES = {
+    "Provider count per city": "SELECT City, COUNT(*) AS provider_count FROM providers GROUP BY City ORDER BY provider_count DESC;",
+    "Receiver count per city": "SELECT City, COUNT(*) AS receiver_count FROM receivers GROUP BY City;",
+    "Most contributing provider type": """SELECT p.Type AS provider_type, SUM(f.Quantity) AS total_qty
+                                         FROM providers p JOIN food_listings f ON p.Provider_ID=f.Provider_ID
+                                         GROUP BY p.Type ORDER BY total_qty DESC LIMIT 10;""",
+    "Total available food quantity": "SELECT SUM(Quantity) AS total_available FROM food_listings;",
+    "City with most listings": "SELECT Location AS city, COUNT(*) AS listings FROM food_listings GROUP BY Location ORDER BY listings DESC LIMIT 10;",
+    "Most common food types": "SELECT Food_Type, COUNT(*) AS freq FROM food_listings GROUP BY Food_Type ORDER BY freq DESC LIMIT 10;",
+    "Claims per food item": "SELECT f.Food_ID, f.Food_Name, COUNT(c.Claim_ID) AS claim_count FROM food_listings f LEFT JOIN claims c ON f.Food_ID=c.Food_ID GROUP BY f.Food_ID, f.Food_Name ORDER BY claim_count DESC LIMIT 20;",
+    "Provider with most completed claims": """WITH completed AS (
+                                                  SELECT f.Provider_ID AS provider_id, COUNT(c.Claim_ID) AS n FROM food_listings f JOIN claims c ON f.Food_ID=c.Food_ID WHERE c.Status='Completed' GROUP BY f.Provider_ID
+                                                  UNION ALL SELECT provider_id, SUM(claim_count) FROM claim_rollups WHERE status='Completed' GROUP BY provider_id)
+                                              SELECT p.Provider_ID, p.Name, SUM(cp.n) AS completed_claims FROM providers p JOIN completed cp ON p.Provider_ID=cp.provider_id
+                                              GROUP BY p.Provider_ID, p.Name ORDER BY completed_claims DESC LIMIT 10;""",
+    "Claim status percent": """WITH per_status AS (
+                                   SELECT name AS status, claim_count AS n FROM claim_states WHERE claim_count > 0
+                                   UNION ALL SELECT status, SUM(claim_count) FROM receiver_claim_rollups GROUP BY status)
+                               SELECT status AS Status, SUM(n)*100.0/(SELECT SUM(n) FROM per_status) AS percent FROM per_status GROUP BY status;""",
+    "Avg quantity claimed per receiver": """WITH per_receiver AS (
+                                                SELECT c.Receiver_ID AS receiver_id, SUM(f.Quantity) AS quantity, COUNT(f.Quantity) AS n FROM claims c JOIN food_listings f ON c.Food_ID=f.Food_ID GROUP BY c.Receiver_ID
+                                                UNION ALL SELECT receiver_id, SUM(quantity), SUM(listed_count) FROM receiver_claim_rollups GROUP BY receiver_id)
+                                            SELECT r.Receiver_ID, r.Name, SUM(pr.quantity)*1.0/SUM(pr.n) AS avg_quantity FROM receivers r JOIN per_receiver pr ON r.Receiver_ID=pr.receiver_id
+                                            GROUP BY r.Receiver_ID, r.Name HAVING SUM(pr.n) > 0 ORDER BY avg_quantity DESC LIMIT 20;""",
+    "Most claimed meal type": """WITH per_meal AS (
+                                     SELECT f.Meal_Type AS meal_type, COUNT(c.Claim_ID) AS n FROM food_listings f JOIN claims c ON f.Food_ID=c.Food_ID GROUP BY f.Meal_Type
+                                     UNION ALL SELECT meal_type, SUM(claim_count) FROM claim_rollups WHERE meal_type IS NOT NULL GROUP BY meal_type)
+                                 SELECT meal_type AS Meal_Type, SUM(n) AS times_claimed FROM per_meal GROUP BY meal_type ORDER BY times_claimed DESC;""",
+    "Total quantity donated by provider": "SELECT p.Provider_ID, p.Name, SUM(f.Quantity) AS total_donated FROM providers p JOIN food_listings f ON p.Provider_ID=f.Provider_ID GROUP BY p.Provider_ID, p.Name ORDER BY total_donated DESC LIMIT 20;",
+    "Listings near expiry (next 2 days)": "SELECT * FROM food_listings WHERE Expiry_Date BETWEEN date('now') AND date('now','+2 day') ORDER BY Expiry_Date ASC;",
+    "Top locations by quantity": "SELECT Location, SUM(Quantity) AS total_qty FROM food_listings GROUP BY Location ORDER BY total_qty DESC LIMIT 10;",
+    "Receivers with most claims": """WITH per_receiver AS (
+                                         SELECT Receiver_ID AS receiver_id, COUNT(Claim_ID) AS n FROM claims GROUP BY Receiver_ID
+                                         UNION ALL SELECT receiver_id, SUM(claim_count) FROM receiver_claim_rollups GROUP BY receiver_id)
+                                     SELECT r.Receiver_ID, r.Name, SUM(pr.n) AS num_claims FROM receivers r JOIN per_receiver pr ON r.Receiver_ID=pr.receiver_id
+                                     GROUP BY r.Receiver_ID, r.Name ORDER BY num_claims DESC LIMIT 20;"""
+}
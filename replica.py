@@ -0,0 +1,138 @@
+"""Read-only snapshot of the SQLite database for Analytics and report exports.
+
+With FOOD_READ_REPLICA=1 a background thread copies the primary database
+into FOOD_REPLICA_PATH every FOOD_REPLICA_INTERVAL seconds with VACUUM INTO,
+and run_query/cached_query calls made with replica=True read the copy. The
+primary is switched to WAL in this mode, so the copy is one read
+transaction that never blocks claim and admin writes; long scans then run
+against a separate file and page cache.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import render_metrics
+from shared_cache import shared_cache
+from storage import DB_PATH, SQLiteBackend, backend
+
+# ---------------- Settings ----------------
+# Only the SQLite backend has a file to copy; PostgreSQL reads always go to FOOD_DB_URL
+ENABLED = os.environ.get("FOOD_READ_REPLICA", "0") == "1" and backend.name == "sqlite"
+REPLICA_PATH = os.environ.get("FOOD_REPLICA_PATH", os.path.splitext(DB_PATH)[0] + ".replica.db")
+# Seconds between snapshot refreshes (0 = only from the Performance page)
+REFRESH_INTERVAL = float(os.environ.get("FOOD_REPLICA_INTERVAL", "60"))
+
+logger = logging.getLogger("food_wastage.replica")
+
+# Shared-cache pseudo-table of every replica read, bumped when a new snapshot is in place
+CACHE_TABLE = "replica"
+
+
+class ReplicaBackend(SQLiteBackend):
+    """SQLite backend over the snapshot file, opened read-only.
+
+    A refresh writes the new snapshot beside the old one and renames it into
+    place. Connections opened before that keep reading the old file until
+    they are returned to the pool, where they are closed instead of reused.
+    """
+
+    def __init__(self, path=REPLICA_PATH, source=DB_PATH):
+        super().__init__(path)
+        self.source = source
+        self.generation = 0
+        self.last_refresh = None
+        self.last_seconds = None
+        self._refreshed_at = None
+        self._generations = {}
+        self._refresh_lock = threading.Lock()
+
+    def connect(self, shared=False):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=not shared)
+        self.configure(conn)
+        self._generations[id(conn)] = self.generation
+        return conn
+
+    def acquire(self):
+        # A file left by an earlier run may predate this process's schema changes
+        if self.generation == 0:
+            self.refresh(initial=True)
+        return self.pool.acquire()
+
+    def release(self, conn):
+        if self._generations.get(id(conn)) == self.generation:
+            self.pool.release(conn)
+        else:
+            self._generations.pop(id(conn), None)
+            conn.close()
+
+    def refresh(self, initial=False):
+        """Copy the primary into a new snapshot and switch readers to it; returns seconds taken"""
+        with self._refresh_lock:
+            if initial and self.generation:
+                return self.last_seconds
+            start = time.perf_counter()
+            # Per process, as every worker refreshes the same file
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            conn = sqlite3.connect(self.source)
+            try:
+                conn.execute("VACUUM INTO ?", (tmp,))
+            finally:
+                conn.close()
+            os.replace(tmp, self.path)
+            # Connections still out are closed on release, as their generation is gone
+            self.generation += 1
+            self._generations.clear()
+            self.pool.close()
+            shared_cache.invalidate(CACHE_TABLE)
+            self.last_seconds = time.perf_counter() - start
+            self.last_refresh = time.strftime("%Y-%m-%d %H:%M:%S")
+            self._refreshed_at = time.time()
+            render_metrics.inc("food_replica_refreshes_total", 1, "Read-replica snapshots taken.")
+            return self.last_seconds
+
+    def age_seconds(self):
+        """Seconds since this process's readers switched to the current snapshot, or None before the first"""
+        return None if self._refreshed_at is None else time.time() - self._refreshed_at
+
+
+replica_backend = ReplicaBackend()
+
+
+class ReplicaRefresher:
+    """Background thread that refreshes the snapshot every `interval` seconds"""
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if not ENABLED or self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="replica-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                logger.exception("replica refresh failed")
+            self._stop.wait(self.interval)
+
+    def run(self):
+        return replica_backend.refresh()
+
+
+replica_refresher = ReplicaRefresher()
+
+
+if __name__ == "__main__":
+    print(f"refreshed {REPLICA_PATH} in {ReplicaRefresher().run():.2f} s")
@@ -0,0 +1,306 @@
+"""Scheduled runs of the notebook's (backend.py) fifteen analysis queries.
+
+    python reports.py     # run the catalog once, e.g. from cron
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from db import cached_query, run_many, run_query
+from schema import apply_types
+from storage import backend
+
+# ---------------- Settings ----------------
+# Seconds between scheduled runs of the whole catalog (0 = only on demand)
+REPORT_INTERVAL = float(os.environ.get("FOOD_REPORT_INTERVAL", "3600"))
+REPORT_WORKERS = int(os.environ.get("FOOD_REPORT_WORKERS", "4"))
+# Versions kept per report; older results are deleted after each run
+REPORT_KEEP = int(os.environ.get("FOOD_REPORT_KEEP", "10"))
+
+logger = logging.getLogger("food_wastage.reports")
+
+
+class Report:
+    """One catalog entry: the notebook question and its SQL"""
+
+    __slots__ = ("name", "title", "sql")
+
+    def __init__(self, name, title, sql):
+        self.name = name
+        self.title = title
+        self.sql = sql
+
+
+# ---------------- Catalog ----------------
+# Shared with backend.py, which imports the SQL from here. As in queries.ANALYTICS_QUERIES,
+# claim reports add the rollups of archived claims (archive.py) to the live table, take
+# live claims per status from claim_states, and claims per food item only counts live
+# claims. Claims per location read claim_daily, which counts every claim ever made:
+# archiving and deletes leave it unchanged, unlike the live join this report used to run.
+REPORTS = {r.name: r for r in [
+    Report("query1", "Providers and receivers per city", """
+SELECT p.City,
+       COUNT(DISTINCT p.Provider_ID) AS Total_Providers,
+       COUNT(DISTINCT r.Receiver_ID) AS Total_Receivers
+FROM providers p
+LEFT JOIN receivers r ON p.City = r.City
+GROUP BY p.City
+ORDER BY p.City;
+"""),
+    Report("query2", "Provider type by total quantity donated", """
+SELECT Provider_Type,
+       SUM(Quantity) AS Total_Quantity_Donated
+FROM food_listings
+GROUP BY Provider_Type
+ORDER BY Total_Quantity_Donated DESC;
+"""),
+    Report("query3", "Contact info of providers in Dubai", """
+SELECT Name, Type, Contact
+FROM providers
+WHERE City = 'Dubai';
+"""),
+    Report("query4", "Receivers with the most claims", """
+WITH per_receiver AS (
+    SELECT Receiver_ID AS receiver_id, COUNT(Claim_ID) AS n FROM claims GROUP BY Receiver_ID
+    UNION ALL
+    SELECT receiver_id, SUM(claim_count) FROM receiver_claim_rollups GROUP BY receiver_id
+)
+SELECT r.Name AS Receiver_Name,
+       SUM(pr.n) AS Total_Claims
+FROM per_receiver pr
+JOIN receivers r ON pr.receiver_id = r.Receiver_ID
+GROUP BY r.Name
+ORDER BY Total_Claims DESC;
+"""),
+    Report("query5", "Total quantity of food available", """
+SELECT SUM(Quantity) AS Total_Food_Quantity
+FROM food_listings;
+"""),
+    Report("query6", "Cities with most food listings", """
+SELECT Location AS City,
+       COUNT(Food_ID) AS Total_Listings
+FROM food_listings
+GROUP BY Location
+ORDER BY Total_Listings DESC;
+"""),
+    Report("query7", "Most commonly available food types", """
+SELECT Food_Type,
+       COUNT(*) AS Total_Items
+FROM food_listings
+GROUP BY Food_Type
+ORDER BY Total_Items DESC;
+"""),
+    Report("query8", "Claims per food item", """
+SELECT f.Food_Name,
+       COUNT(c.Claim_ID) AS Total_Claims
+FROM claims c
+JOIN food_listings f ON c.Food_ID = f.Food_ID
+GROUP BY f.Food_Name
+ORDER BY Total_Claims DESC;
+"""),
+    Report("query9", "Providers with most successful claims", """
+WITH completed AS (
+    SELECT f.Provider_ID AS provider_id, COUNT(c.Claim_ID) AS n
+    FROM claims c
+    JOIN food_listings f ON c.Food_ID = f.Food_ID
+    WHERE c.Status = 'Completed'
+    GROUP BY f.Provider_ID
+    UNION ALL
+    SELECT provider_id, SUM(claim_count) FROM claim_rollups WHERE status = 'Completed' GROUP BY provider_id
+)
+SELECT p.Name AS Provider_Name,
+       SUM(cp.n) AS Successful_Claims
+FROM completed cp
+JOIN providers p ON cp.provider_id = p.Provider_ID
+GROUP BY p.Name
+ORDER BY Successful_Claims DESC;
+"""),
+    Report("query10", "Claim status percentages", """
+WITH per_status AS (
+    SELECT name AS status, claim_count AS n FROM claim_states WHERE claim_count > 0
+    UNION ALL
+    SELECT status, SUM(claim_count) FROM receiver_claim_rollups GROUP BY status
+)
+SELECT status AS Status,
+       SUM(n) AS Count,
+       ROUND((SUM(n) * 100.0 / (SELECT SUM(n) FROM per_status)), 2) AS Percentage
+FROM per_status
+GROUP BY status;
+"""),
+    Report("query11", "Average quantity claimed per receiver", """
+WITH per_receiver AS (
+    SELECT c.Receiver_ID AS receiver_id, SUM(f.Quantity) AS quantity, COUNT(f.Quantity) AS n
+    FROM claims c
+    JOIN food_listings f ON c.Food_ID = f.Food_ID
+    GROUP BY c.Receiver_ID
+    UNION ALL
+    SELECT receiver_id, SUM(quantity), SUM(listed_count) FROM receiver_claim_rollups GROUP BY receiver_id
+)
+SELECT r.Name AS Receiver_Name,
+       ROUND((SUM(pr.quantity) * 1.0 / SUM(pr.n)), 2) AS Avg_Quantity_Claimed
+FROM per_receiver pr
+JOIN receivers r ON pr.receiver_id = r.Receiver_ID
+GROUP BY r.Name
+HAVING SUM(pr.n) > 0
+ORDER BY Avg_Quantity_Claimed DESC;
+"""),
+    Report("query12", "Most claimed meal types", """
+WITH per_meal AS (
+    SELECT f.Meal_Type AS meal_type, COUNT(c.Claim_ID) AS n
+    FROM claims c
+    JOIN food_listings f ON c.Food_ID = f.Food_ID
+    GROUP BY f.Meal_Type
+    UNION ALL
+    SELECT meal_type, SUM(claim_count) FROM claim_rollups WHERE meal_type IS NOT NULL GROUP BY meal_type
+)
+SELECT meal_type AS Meal_Type,
+       SUM(n) AS Total_Claims
+FROM per_meal
+GROUP BY meal_type
+ORDER BY Total_Claims DESC;
+"""),
+    Report("query13", "Total quantity donated by each provider", """
+SELECT p.Name AS Provider_Name,
+       SUM(f.Quantity) AS Total_Quantity_Donated
+FROM food_listings f
+JOIN providers p ON f.Provider_ID = p.Provider_ID
+GROUP BY p.Name
+ORDER BY Total_Quantity_Donated DESC;
+"""),
+    Report("query14", "Top 5 locations by claims ever made", """
+SELECT city AS Location,
+       SUM(claim_count) AS Total_Claims
+FROM claim_daily
+WHERE city <> ''
+GROUP BY city
+ORDER BY Total_Claims DESC
+LIMIT 5;
+"""),
+    Report("query15", "Food items nearing expiry", """
+SELECT Food_Name, Quantity, Expiry_Date, Location
+FROM food_listings
+WHERE julianday(Expiry_Date) - julianday('now') <= 3
+ORDER BY Expiry_Date ASC;
+"""),
+]}
+
+VERSION_ATTEMPTS = 5
+RESULT_INSERT = """
+  INSERT INTO report_results (report, version, created_at, elapsed_ms, row_count, payload, error)
+  VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+# ---------------- Engine ----------------
+def run_reports(workers=REPORT_WORKERS, keep=REPORT_KEEP):
+    """Run the whole catalog in parallel and store the results as one new version.
+
+    Returns the version number.
+    """
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = list(pool.map(_run_one, REPORTS.values()))
+    # Another scheduler or worker may store the same version first; take the next one
+    for attempt in range(VERSION_ATTEMPTS):
+        version = int(run_query("SELECT COALESCE(MAX(version), 0) AS v FROM report_results")["v"].iloc[0]) + 1
+        try:
+            run_many([
+                (RESULT_INSERT, [(name, version, created_at, ms, n, payload, error) for name, ms, n, payload, error in rows]),
+                ("DELETE FROM report_results WHERE version <= ?", [(version - keep,)]),
+            ])
+            return version
+        except backend.integrity_error:
+            if attempt == VERSION_ATTEMPTS - 1:
+                raise
+
+
+def _run_one(report):
+    start = time.perf_counter()
+    try:
+        df = run_query(report.sql, replica=True)
+    except Exception as e:
+        logger.warning("report %s failed: %s", report.name, e)
+        return report.name, (time.perf_counter() - start) * 1000.0, 0, None, str(e)
+    elapsed_ms = (time.perf_counter() - start) * 1000.0
+    return report.name, elapsed_ms, len(df), df.to_json(orient="split", index=False, date_format="iso"), None
+
+
+def versions(name):
+    """Stored versions of one report, newest first"""
+    return cached_query(
+        "SELECT version, created_at, elapsed_ms, row_count, error FROM report_results WHERE report = ? ORDER BY version DESC",
+        (name,),
+    )
+
+
+def load_result(name, version=None):
+    """(DataFrame, created_at) of a stored report version, the latest by default; None if never run"""
+    if version is None:
+        df = cached_query("SELECT payload, created_at FROM report_results WHERE report = ? ORDER BY version DESC LIMIT 1", (name,))
+    else:
+        df = cached_query("SELECT payload, created_at FROM report_results WHERE report = ? AND version = ?", (name, int(version)))
+    if df.empty or df["payload"].iloc[0] is None:
+        return None
+    result = pd.read_json(io.StringIO(df["payload"].iloc[0]), orient="split", convert_dates=False, dtype=False)
+    return apply_types(result), df["created_at"].iloc[0]
+
+
+def last_run_at():
+    df = run_query("SELECT MAX(created_at) AS last FROM report_results")
+    last = df["last"].iloc[0]
+    return None if last is None or pd.isna(last) else datetime.strptime(last, "%Y-%m-%d %H:%M:%S")
+
+
+# ---------------- Scheduler ----------------
+class ReportScheduler:
+    """Background thread that runs the catalog every `interval` seconds.
+
+    Due-ness is read from report_results, so several worker processes
+    sharing a database mostly skip each other's recent runs.
+    """
+
+    def __init__(self, interval=REPORT_INTERVAL):
+        self.interval = interval
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="report-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                last = last_run_at()
+                if last is None or (datetime.now() - last).total_seconds() >= self.interval:
+                    run_reports()
+            except Exception:
+                logger.exception("scheduled report run failed")
+            self._stop.wait(min(self.interval, 60.0))
+
+
+report_scheduler = ReportScheduler()
+
+
+if __name__ == "__main__":
+    import trends
+    import workflow
+    from db import ensure_schema
+
+    # The claim reports read counters the app fills at startup
+    ensure_schema()
+    workflow.sync_states()
+    if trends.needs_backfill():
+        trends.rebuild_claim_trends()
+    print(f"stored report version {run_reports()}")
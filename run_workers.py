@@ -0,0 +1,52 @@
+"""Start several app processes on consecutive ports against one database.
+
+    python run_workers.py --workers 4 --port 8501
+
+Put a local load balancer with session affinity in front of the ports
+(Streamlit sessions live on a websocket bound to one process), e.g. nginx:
+
+    upstream food_app { ip_hash; server 127.0.0.1:8501; server 127.0.0.1:8502; ... }
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+from metrics import METRICS_FILE
+from profiling import SLOW_LOG_PATH
+
+
+def per_worker(path, port):
+    """`path` with the worker's port before the extension: metrics.prom -> metrics.8501.prom"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{port}{ext}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--port", type=int, default=8501, help="port of the first worker")
+    args = parser.parse_args()
+
+    env = dict(os.environ, FOOD_MULTI_WORKER="1")
+    app = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    procs = []
+    for i in range(args.workers):
+        port = args.port + i
+        cmd = [sys.executable, "-m", "streamlit", "run", app,
+               "--server.port", str(port), "--server.headless", "true"]
+        # One metrics file and slow log per process: neither the export nor log rotation is shared-safe
+        worker_env = dict(env, FOOD_METRICS_FILE=per_worker(METRICS_FILE, port),
+                          FOOD_SLOW_LOG=per_worker(SLOW_LOG_PATH, port))
+        procs.append(subprocess.Popen(cmd, env=worker_env))
+        print(f"worker {i} on http://localhost:{port}")
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        for proc in procs:
+            proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import pandas as pd
+
+# ---------------- Column Types ----------------
+# Applied by column name to every DataFrame the data layer returns, so the same
+# column has the same compact dtype whichever query produced it.
+INT_COLUMNS = ("Provider_ID", "Receiver_ID", "Food_ID", "Claim_ID", "Quantity", "Row_Version", "State")
+CATEGORY_COLUMNS = ("Type", "City", "Provider_Type", "Location", "Food_Type", "Meal_Type", "Status", "Listing_Status")
+DATE_COLUMNS = ("Expiry_Date", "Timestamp")
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+
+
+def apply_types(df):
+    """Downcast IDs to nullable Int32, repetitive text to categoricals and parse dates"""
+    for col in df.columns.intersection(INT_COLUMNS):
+        df[col] = _to_int32(df[col])
+    for col in df.columns.intersection(CATEGORY_COLUMNS):
+        if not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    for col in df.columns.intersection(DATE_COLUMNS):
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
+            # The CSV imports use 3/17/2025 while app writes use 2025-03-17
+            df[col] = pd.to_datetime(df[col], format="mixed", errors="coerce")
+    return df
+
+
+def _to_int32(series):
+    if isinstance(series.dtype, pd.Int32Dtype):
+        return series
+    values = pd.to_numeric(series, errors="coerce")
+    if values.notna().any():
+        low, high = values.min(), values.max()
+        if low < INT32_MIN or high > INT32_MAX or (values.dropna() % 1 != 0).any():
+            return series
+    return values.astype("Int32")
+
+
+def format_date(value):
+    """Render a parsed date the way the database stores new ones"""
+    return value.strftime("%Y-%m-%d") if pd.notna(value) else ""
+
+
+# ---------------- Records ----------------
+class ActivityRecord:
+    """One audit-trail entry kept in session state"""
+
+    __slots__ = ("timestamp", "user_type", "action", "table", "record_id", "details")
+
+    def __init__(self, timestamp, user_type, action, table, record_id, details):
+        self.timestamp = timestamp
+        self.user_type = user_type
+        self.action = action
+        self.table = table
+        self.record_id = record_id
+        self.details = details
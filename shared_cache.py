@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------- Settings ----------------
+MAX_ENTRIES = int(os.environ.get("FOOD_SHARED_CACHE_SIZE", "256"))
+KEY_LOCKS = 64
+
+_TABLE_REF = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_]\w*)", re.I)
+_WRITE_TARGET = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+([A-Za-z_]\w*)",
+    re.I,
+)
+
+
+def tables_in(query):
+    """Tables a SELECT reads from"""
+    return frozenset(name.lower() for name in _TABLE_REF.findall(query))
+
+
+def written_table(query):
+    """Table an INSERT/UPDATE/DELETE writes to, or None"""
+    match = _WRITE_TARGET.match(query)
+    return match.group(1).lower() if match else None
+
+
+class Snapshot:
+    """A cached value plus the table generations it was computed from"""
+
+    __slots__ = ("value", "generations", "expires")
+
+    def __init__(self, value, generations, expires):
+        self.value = value
+        self.generations = generations
+        self.expires = expires
+
+
+class SharedCache:
+    """Process-wide cache shared by every Streamlit session.
+
+    Each table has a generation number that the commit path bumps. A snapshot
+    stays valid while the generations of the tables it read are unchanged, so
+    a write drops exactly the entries that depend on it. Stale snapshots are
+    unlinked from the cache; sessions still holding one keep a consistent
+    view, and it is freed when the last of them lets go.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        # Tables maintained by triggers on another table, e.g. {"claims": ("claim_daily",)}
+        self.derived = {}
+        self._lock = threading.Lock()
+        # Striped locks so concurrent sessions missing the same key load it once
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCKS)]
+        self.hits = self.misses = self.invalidations = 0
+
+    def get(self, key, tables, loader, ttl=None, refresh=False):
+        """Cached value of `key`, loaded if missing or stale; `refresh` reloads it regardless"""
+        snap = None if refresh else self._lookup(key)
+        if snap is None:
+            with self._key_locks[hash(key) % KEY_LOCKS]:
+                snap = None if refresh else self._lookup(key, count=False)
+                if snap is None:
+                    # Generations are read before loading, so a write that lands
+                    # mid-load leaves this snapshot already stale
+                    generations = self._current(tables)
+                    value = loader()
+                    expires = time.monotonic() + ttl if ttl else None
+                    snap = Snapshot(value, generations, expires)
+                    self._store(key, snap)
+        return snap.value
+
+    def invalidate(self, *tables):
+        tables = tables + tuple(d for t in tables for d in self.derived.get(t, ()))
+        with self._lock:
+            for table in tables:
+                if table:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "generations": dict(self._generations),
+            }
+
+    def _current(self, tables):
+        with self._lock:
+            return tuple((t, self._generations.get(t, 0)) for t in sorted(tables))
+
+    def _lookup(self, key, count=True):
+        with self._lock:
+            snap = self._entries.get(key)
+            if snap is not None:
+                fresh = all(self._generations.get(t, 0) == g for t, g in snap.generations)
+                if fresh and (snap.expires is None or snap.expires > time.monotonic()):
+                    self._entries.move_to_end(key)
+                    if count:
+                        self.hits += 1
+                    return snap
+                del self._entries[key]
+            if count:
+                self.misses += 1
+            return None
+
+    def _store(self, key, snap):
+        with self._lock:
+            self._entries[key] = snap
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+shared_cache = SharedCache()
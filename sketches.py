@@ -0,0 +1,230 @@
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+import cdc
+from storage import backend
+
+# ---------------- Settings ----------------
+# 2**14 registers: about 0.8% standard error on distinct counts
+HLL_PRECISION = 14
+# Count-Min estimates overstate a count by at most epsilon * total claims, with probability 1 - delta
+CMS_EPSILON = float(os.environ.get("FOOD_SKETCH_EPSILON", "0.001"))
+CMS_DELTA = 0.01
+# Heavy-hitter candidates kept per sketch
+CANDIDATES = 200
+SCAN_CHUNK = 100000
+
+SCAN_QUERY = "SELECT Receiver_ID, Food_ID FROM claims UNION ALL SELECT Receiver_ID, Food_ID FROM claims_archive"
+
+
+def _hash(values, seed=0):
+    """splitmix64 finaliser over an integer array; cheap and well spread"""
+    z = np.asarray(values, dtype=np.int64).astype(np.uint64)
+    z = z + np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & 0xFFFFFFFFFFFFFFFF)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _leading_zeros(words):
+    count = np.zeros(words.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        short = words < np.uint64(1 << (64 - shift))
+        count += np.uint8(shift) * short
+        words = np.where(short, words << np.uint64(shift), words)
+    return count
+
+
+class HyperLogLog:
+    """Distinct count estimate in 2**p one-byte registers"""
+
+    def __init__(self, p=HLL_PRECISION):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, values):
+        h = _hash(values)
+        index = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        # The low bit stops the rank running past the hash width
+        rest = (h << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        np.maximum.at(self.registers, index, _leading_zeros(rest) + np.uint8(1))
+
+    def estimate(self):
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    @property
+    def relative_error(self):
+        """One standard error, as a fraction of the estimate"""
+        return 1.04 / math.sqrt(self.m)
+
+
+class CountMinSketch:
+    """Per-key counts that never undercount; see CMS_EPSILON for the overcount bound"""
+
+    def __init__(self, epsilon=CMS_EPSILON, delta=CMS_DELTA):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = math.ceil(math.e / epsilon)
+        self.depth = math.ceil(math.log(1 / delta))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _columns(self, keys):
+        return np.stack([_hash(keys, seed=row) % np.uint64(self.width) for row in range(self.depth)]).astype(np.intp)
+
+    def add(self, keys):
+        columns = self._columns(keys)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], 1)
+        self.total += len(keys)
+
+    def estimate(self, keys):
+        return self.table[np.arange(self.depth)[:, None], self._columns(keys)].min(axis=0)
+
+    @property
+    def error_bound(self):
+        return self.epsilon * self.total
+
+
+class HeavyHitters:
+    """Count-Min sketch plus the keys with the largest estimates seen so far"""
+
+    def __init__(self, capacity=CANDIDATES):
+        self.sketch = CountMinSketch()
+        self.capacity = capacity
+        self.candidates = {}
+
+    def add(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        self.sketch.add(keys)
+        pool = np.union1d(np.fromiter(self.candidates, dtype=np.int64, count=len(self.candidates)), keys)
+        estimates = self.sketch.estimate(pool)
+        keep = np.argsort(-estimates, kind="stable")[:self.capacity]
+        self.candidates = dict(zip(pool[keep].tolist(), estimates[keep].tolist()))
+
+    def top(self, n):
+        return sorted(self.candidates.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+class ClaimSketches:
+    """Approximate claim statistics that cost the same to read at any claim volume.
+
+    Built from one scan of claims and claims_archive, then kept current by
+    reading claim inserts from the change_events log, so claims written by
+    any worker process are counted. The catch-up is not a named consumer, so
+    if cdc.prune has removed events it had not read yet the sketches are
+    rebuilt. A claim inserted while the scan runs may be counted twice, well
+    inside the sketch error.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._state = None
+
+    def _current(self):
+        if self._state is None:
+            with self._build_lock:
+                if self._state is None:
+                    self.rebuild()
+        self._catch_up()
+        return self._state
+
+    def _catch_up(self):
+        with self._build_lock:
+            if cdc.oldest_seq() > self._state.seq + 1:
+                self.rebuild()
+            state = self._state
+            while True:
+                events = cdc.read_events(state.seq, tables=("claims",))
+                inserts = [e.new for e in events if e.op == "insert"]
+                if inserts:
+                    receivers = np.array([row["Receiver_ID"] for row in inserts], dtype=float)
+                    foods = np.array([row["Food_ID"] for row in inserts], dtype=float)
+                    with self._lock:
+                        state.add(receivers, foods)
+                if events:
+                    state.seq = events[-1].seq
+                if len(events) < cdc.CDC_BATCH:
+                    break
+
+    def rebuild(self):
+        state = _SketchState()
+        state.seq = cdc.latest_seq()
+        conn = backend.acquire()
+        try:
+            cur = conn.cursor()
+            cur.execute(backend.translate(SCAN_QUERY))
+            while True:
+                rows = cur.fetchmany(SCAN_CHUNK)
+                if not rows:
+                    break
+                # NULL ids become NaN and are skipped
+                ids = np.array(rows, dtype=float)
+                state.add(ids[:, 0], ids[:, 1])
+            cur.close()
+        finally:
+            backend.release(conn)
+        state.built_at = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._state = state
+
+    def summary(self):
+        state = self._current()
+        with self._lock:
+            return {
+                "claims": state.claims,
+                "built_at": state.built_at,
+                "distinct_receivers": state.receivers.estimate(),
+                "distinct_foods": state.foods.estimate(),
+                "relative_error": state.receivers.relative_error,
+            }
+
+    def top_receivers(self, n=20):
+        """[(Receiver_ID, estimated claims)] and the overcount bound"""
+        state = self._current()
+        with self._lock:
+            return state.top_receivers.top(n), state.top_receivers.sketch.error_bound
+
+    def top_foods(self, n=20):
+        """[(Food_ID, estimated claims)] and the overcount bound"""
+        state = self._current()
+        with self._lock:
+            return state.top_foods.top(n), state.top_foods.sketch.error_bound
+
+
+class _SketchState:
+    def __init__(self):
+        self.receivers = HyperLogLog()
+        self.foods = HyperLogLog()
+        self.top_receivers = HeavyHitters()
+        self.top_foods = HeavyHitters()
+        self.claims = 0
+        self.built_at = None
+        # Last change_events seq folded in
+        self.seq = 0
+
+    def add(self, receivers, foods):
+        self.claims += len(receivers)
+        receivers = receivers[~np.isnan(receivers)].astype(np.int64)
+        foods = foods[~np.isnan(foods)].astype(np.int64)
+        if len(receivers):
+            self.receivers.add(receivers)
+            self.top_receivers.add(receivers)
+        if len(foods):
+            self.foods.add(foods)
+            self.top_foods.add(foods)
+
+
+claim_sketches = ClaimSketches()
@@ -0,0 +1,190 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import storage
+from db import get_conn
+from schema import apply_types
+
+# ---------------- Settings ----------------
+# FOOD_LISTING_SNAPSHOT=1 makes Browse filter an in-memory copy instead of querying SQLite.
+# It replays rowid-based change rows, so it is only available on the SQLite backend.
+ENABLED = os.environ.get("FOOD_LISTING_SNAPSHOT", "0") == "1" and storage.BACKEND == "sqlite"
+# Beyond this many pending changes a full reload is cheaper than patching rows.
+MAX_INCREMENTAL_CHANGES = 20000
+# listing_changes rows kept after a refresh; older ones are pruned.
+CHANGE_LOG_RETENTION = 100000
+SQL_CHUNK = 500
+
+SNAPSHOT_QUERY = """
+  SELECT f.rowid AS Row_ID, f.Food_ID, f.Food_Name, f.Quantity, f.Expiry_Date, f.Meal_Type, f.Food_Type, f.Location,
+         p.Provider_ID, p.Name as Provider_Name, p.Contact as Provider_Contact, p.Address as Provider_Address
+  FROM food_listings f
+  JOIN providers p ON f.Provider_ID = p.Provider_ID
+  WHERE f.Listing_Status = 'Available'
+"""
+RESULT_COLUMNS = ["Food_ID", "Food_Name", "Quantity", "Expiry_Date", "Meal_Type", "Food_Type", "Location",
+                  "Provider_ID", "Provider_Name", "Provider_Contact", "Provider_Address"]
+CATEGORICAL_COLUMNS = ["Location", "Food_Type", "Meal_Type", "Provider_Name"]
+
+
+class ListingSnapshot:
+    """Process-wide columnar copy of available food_listings JOIN providers.
+
+    Location, Food_Type, Meal_Type and provider name are dictionary encoded and
+    each code has a posting list of row positions, so a filter starts from the
+    most selective condition and checks the rest on integer codes of those rows
+    only. The frame and index are replaced together, never mutated, which lets
+    sessions read them without locking.
+    """
+
+    def __init__(self):
+        self._frame = None
+        self._index = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def refresh(self):
+        """Bring the snapshot up to date with listing_changes; returns True if it changed"""
+        conn = get_conn()
+        try:
+            if self._frame is not None and _latest_seq(conn) == self._seq:
+                return False
+            with self._lock:
+                conn.execute("BEGIN")
+                latest = _latest_seq(conn)
+                if self._frame is not None and latest == self._seq:
+                    return False
+                if self._frame is None or latest - self._seq > MAX_INCREMENTAL_CHANGES:
+                    frame = _load(conn)
+                else:
+                    frame = self._apply_changes(conn, self._frame, self._seq)
+                conn.rollback()
+                self._frame, self._index, self._seq = frame, _build_index(frame), latest
+                _prune_changes(conn, latest)
+                return True
+        finally:
+            conn.close()
+
+    def _apply_changes(self, conn, frame, since):
+        changes = conn.execute(
+            "SELECT table_name, row_id FROM listing_changes WHERE seq > ?", (since,)
+        ).fetchall()
+        row_ids = {row_id for table, row_id in changes if table == "food_listings"}
+        provider_ids = {row_id for table, row_id in changes if table == "providers"}
+        if provider_ids:
+            row_ids.update(frame.loc[frame["Provider_ID"].isin(provider_ids), "Row_ID"].tolist())
+
+        fresh = [_read(conn, "f.rowid", chunk) for chunk in _chunks(sorted(row_ids))]
+        fresh += [_read(conn, "f.Provider_ID", chunk) for chunk in _chunks(sorted(provider_ids))]
+        kept = frame[~frame["Row_ID"].isin(row_ids)]
+        if not fresh:
+            return kept
+        fresh = pd.concat(fresh, ignore_index=True).drop_duplicates("Row_ID")
+        for col in CATEGORICAL_COLUMNS:
+            known = kept[col].cat.categories
+            new = pd.Index(fresh[col].dropna().unique()).difference(known)
+            if len(new):
+                kept[col] = kept[col].cat.add_categories(new)
+            fresh[col] = pd.Categorical(fresh[col], categories=kept[col].cat.categories)
+        return _sort(pd.concat([kept, fresh], ignore_index=True))
+
+    def filter(self, city=None, provider=None, food_type=None, meal=None):
+        """Same rows and order as the Browse SQL query"""
+        return self._frame.iloc[self.positions(city, provider, food_type, meal)][RESULT_COLUMNS].reset_index(drop=True)
+
+    def positions(self, city=None, provider=None, food_type=None, meal=None):
+        """Row positions matching the filters, in Expiry_Date order"""
+        frame, index = self._frame, self._index
+        conditions = []
+        cities = city if isinstance(city, list) else [city]
+        for col, values in (("Location", cities), ("Provider_Name", [provider]),
+                            ("Meal_Type", [meal]), ("Food_Type", food_type or [])):
+            values = [v for v in values if v and v != "All"]
+            if not values:
+                continue
+            categories = frame[col].cat.categories
+            codes = np.array([categories.get_loc(v) for v in values if v in categories], dtype=np.int32)
+            if not len(codes):
+                return np.empty(0, dtype=np.intp)
+            conditions.append((index[col].count(codes), col, codes))
+        if not conditions:
+            return np.arange(len(frame))
+
+        conditions.sort(key=lambda c: c[0])
+        _, col, codes = conditions[0]
+        positions = index[col].postings(codes)
+        for _, col, codes in conditions[1:]:
+            positions = positions[index[col].matches(positions, codes)]
+        return positions
+
+
+class _CodeIndex:
+    """Integer codes of one categorical column plus a posting list per code"""
+
+    __slots__ = ("codes", "order", "offsets")
+
+    def __init__(self, series):
+        # NaN is code -1; shifting by one gives it bucket 0
+        self.codes = series.cat.codes.to_numpy()
+        self.order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes + 1, minlength=len(series.cat.categories) + 1)
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def count(self, codes):
+        return int(sum(self.offsets[c + 2] - self.offsets[c + 1] for c in codes))
+
+    def postings(self, codes):
+        lists = [self.order[self.offsets[c + 1]:self.offsets[c + 2]] for c in codes]
+        if len(lists) == 1:
+            return lists[0]
+        return np.sort(np.concatenate(lists))
+
+    def matches(self, positions, codes):
+        values = self.codes[positions]
+        if len(codes) == 1:
+            return values == codes[0]
+        return np.isin(values, codes)
+
+
+def _build_index(frame):
+    return {col: _CodeIndex(frame[col]) for col in CATEGORICAL_COLUMNS}
+
+def _latest_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM listing_changes").fetchone()[0]
+
+def _prune_changes(conn, latest):
+    if latest > CHANGE_LOG_RETENTION:
+        conn.execute("DELETE FROM listing_changes WHERE seq <= ?", (latest - CHANGE_LOG_RETENTION,))
+        conn.commit()
+
+def _read(conn, column, values=None):
+    query = SNAPSHOT_QUERY
+    if values is not None:
+        query += f" AND {column} IN ({','.join('?' * len(values))})"
+    frame = pd.read_sql_query(query, conn, params=tuple(values or ()))
+    # Browse orders by the stored text, so keep it as the sort key before parsing
+    frame["Expiry_Key"] = frame["Expiry_Date"]
+    frame = apply_types(frame)
+    frame["Provider_Name"] = frame["Provider_Name"].astype("category")
+    return frame
+
+def _load(conn):
+    return _sort(_read(conn, None))
+
+def _sort(frame):
+    # SQLite orders NULL first and compares Expiry_Date as text; keep that order
+    return frame.sort_values(["Expiry_Key", "Row_ID"], na_position="first", kind="stable").reset_index(drop=True)
+
+def _chunks(values):
+    for i in range(0, len(values), SQL_CHUNK):
+        yield values[i:i + SQL_CHUNK]
+
+
+listing_snapshot = ListingSnapshot()
@@ -0,0 +1,268 @@
+import functools
+import os
+import queue
+import re
+import sqlite3
+
+import coherence
+
+# ---------------- Settings ----------------
+# FOOD_DB_BACKEND=postgres runs the app against FOOD_DB_URL instead of the SQLite file.
+BACKEND = os.environ.get("FOOD_DB_BACKEND", "sqlite")
+DB_PATH = os.environ.get("FOOD_DB_PATH", "food_wastage.db")
+DB_URL = os.environ.get("FOOD_DB_URL", "")
+POOL_SIZE = int(os.environ.get("FOOD_DB_POOL_SIZE", "8"))
+# Prepared statements kept per connection; queries.py keeps the distinct shapes below this
+STATEMENT_CACHE = int(os.environ.get("FOOD_STATEMENT_CACHE", "256"))
+
+# SQLite storage profile, applied to every connection and the bulk loader.
+# page_size only takes effect when a file is created or rewritten by SQLiteBackend.vacuum().
+STORAGE_PROFILE = {
+    # Bytes of the file read through a memory map instead of read() calls
+    "mmap_size": int(os.environ.get("FOOD_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Page cache per connection, in KiB (stored negated). With mmap the OS page cache
+    # holds the file; benchmark_storage.py measured larger caches as slower at 1M rows.
+    "cache_size": -int(os.environ.get("FOOD_SQLITE_CACHE_KB", "2000")),
+    # Sorts and GROUP BY temporaries stay in memory
+    "temp_store": os.environ.get("FOOD_SQLITE_TEMP_STORE", "MEMORY"),
+    "page_size": int(os.environ.get("FOOD_SQLITE_PAGE_SIZE", "4096")),
+    # WAL pages written before an automatic checkpoint
+    "wal_autocheckpoint": int(os.environ.get("FOOD_SQLITE_WAL_AUTOCHECKPOINT", "1000")),
+}
+# What a connection gets without the profile, for comparison
+SQLITE_DEFAULTS = {"mmap_size": 0, "cache_size": -2000, "temp_store": "DEFAULT", "page_size": 4096, "wal_autocheckpoint": 1000}
+
+# Columns the CSV loader creates; PostgreSQL needs them quoted to keep their case
+SCHEMA_COLUMNS = frozenset([
+    "Provider_ID", "Name", "Type", "Address", "City", "Contact",
+    "Receiver_ID", "Food_ID", "Food_Name", "Quantity", "Expiry_Date",
+    "Provider_Type", "Location", "Food_Type", "Meal_Type",
+    "Claim_ID", "Status", "State", "Timestamp", "Listing_Status", "Row_Version",
+])
+
+
+class Pool:
+    """LIFO connection pool; the most recently used connection has the warmest cache"""
+
+    def __init__(self, connect, size=POOL_SIZE):
+        self._connect = connect
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        try:
+            conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, Exception):
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# ---------------- SQLite ----------------
+class SQLiteBackend:
+    name = "sqlite"
+    # Physical row identifier, for tables without a primary key
+    row_key = "rowid"
+    row_key_match = "rowid = ?"
+    # Raised when a statement violates a unique index
+    integrity_error = sqlite3.IntegrityError
+
+    def __init__(self, path=DB_PATH, profile=None):
+        self.path = path
+        self.profile = dict(STORAGE_PROFILE if profile is None else profile)
+        self.pool = Pool(functools.partial(self.connect, shared=True))
+
+    def connect(self, shared=False):
+        """A new connection; shared ones may be used from several threads in turn"""
+        conn = sqlite3.connect(self.path, check_same_thread=not shared, cached_statements=STATEMENT_CACHE)
+        self.configure(conn)
+        if coherence.ENABLED:
+            # Safe with WAL and avoids an fsync per commit from every worker
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def configure(self, conn):
+        """Apply the storage profile; page_size first, as it only counts before the first table"""
+        for pragma in ("page_size", "mmap_size", "cache_size", "temp_store", "wal_autocheckpoint"):
+            conn.execute(f"PRAGMA {pragma}={self.profile[pragma]}")
+
+    def vacuum(self):
+        """Rewrite the file at the profile's page_size; WAL files are switched out of WAL for it"""
+        conn = self.connect()
+        try:
+            journal = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if journal == "wal":
+                conn.execute("PRAGMA journal_mode=DELETE")
+            conn.execute("VACUUM")
+            if journal == "wal":
+                conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def release(self, conn):
+        self.pool.release(conn)
+
+    def translate(self, sql):
+        return sql
+
+    def lastrowid(self, cur):
+        return cur.lastrowid
+
+    def data_version(self, conn):
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def explain(self, conn, sql, params=None):
+        """EXPLAIN QUERY PLAN as indented text"""
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+        except Exception as e:
+            return f"(no plan: {e})"
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            lines.append("  " * depth[node_id] + str(detail))
+        return "\n".join(lines)
+
+    def load_table(self, df, table):
+        """Replace `table` with the DataFrame through a connection with the storage profile"""
+        conn = self.connect()
+        try:
+            # pandas inserts every chunk in one transaction
+            df.to_sql(table, conn, if_exists="replace", index=False, chunksize=50000)
+        finally:
+            conn.close()
+
+
+# ---------------- PostgreSQL ----------------
+_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_ALIAS = re.compile(r"\bAS\s+([A-Za-z_]\w*)", re.I)
+_DATE_OFFSET = re.compile(r"date\('now',\s*'([+-]?\d+) days?'\)", re.I)
+_JULIANDAY = re.compile(r"julianday\(([^()]+)\)", re.I)
+_UTC_NOW = "(now() at time zone 'UTC')"
+
+
+@functools.lru_cache(maxsize=1024)
+def sqlite_to_postgres(sql):
+    """Rewrite the SQLite dialect used by the app into PostgreSQL.
+
+    Covers ? placeholders, the date('now'...)/datetime('now')/julianday()
+    functions, and quoting of the mixed-case column names and aliases.
+    Dates are produced as text in the same formats SQLite returns, since the
+    date columns are stored as text on both backends.
+    """
+    sql = re.sub(r"datetime\('now'\)", f"to_char({_UTC_NOW}, 'YYYY-MM-DD HH24:MI:SS')", sql, flags=re.I)
+    sql = _DATE_OFFSET.sub(lambda m: f"to_char({_UTC_NOW}::date + {int(m.group(1))}, 'YYYY-MM-DD')", sql)
+    sql = re.sub(r"date\('now'\)", f"to_char({_UTC_NOW}::date, 'YYYY-MM-DD')", sql, flags=re.I)
+    sql = re.sub(r"julianday\('now'\)", "(extract(epoch from now()) / 86400.0 + 2440587.5)", sql, flags=re.I)
+    sql = _JULIANDAY.sub(r"(extract(epoch from (\1)::timestamp) / 86400.0 + 2440587.5)", sql)
+
+    parts = _LITERAL.split(sql)
+    names = set(SCHEMA_COLUMNS)
+    for i in range(0, len(parts), 2):
+        # Lower-case aliases fold to themselves and need no quotes
+        names.update(a for a in _ALIAS.findall(parts[i]) if a != a.lower())
+    ident = re.compile(r'(?<!["\w])(' + "|".join(sorted(names, key=len, reverse=True)) + r')(?!["\w])')
+    for i in range(len(parts)):
+        if i % 2 == 0:
+            parts[i] = ident.sub(r'"\1"', parts[i]).replace("%", "%%").replace("?", "%s")
+        else:
+            parts[i] = parts[i].replace("%", "%%")
+    return "".join(parts)
+
+
+class PostgresBackend:
+    name = "postgres"
+    row_key = "ctid"
+    row_key_match = "ctid = CAST(? AS tid)"
+
+    def __init__(self, url=DB_URL):
+        self.url = url
+        self.pool = Pool(self.connect)
+
+    def connect(self, shared=False):
+        """A new connection; shared ones autocommit so long-lived readers see new data"""
+        import psycopg
+        from psycopg.types.numeric import FloatLoader
+
+        conn = psycopg.connect(self.url, autocommit=shared)
+        # Statements run prepare_threshold (5) times are prepared server-side and kept
+        conn.prepared_max = STATEMENT_CACHE
+        # SUM/AVG return numeric; load them as floats like SQLite does
+        conn.adapters.register_loader("numeric", FloatLoader)
+        return conn
+
+    @property
+    def integrity_error(self):
+        import psycopg
+
+        return psycopg.IntegrityError
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def release(self, conn):
+        self.pool.release(conn)
+
+    def translate(self, sql):
+        return sqlite_to_postgres(sql)
+
+    def lastrowid(self, cur):
+        # The loaded tables have no serial key to return
+        return None
+
+    def data_version(self, conn):
+        return None
+
+    def explain(self, conn, sql, params=None):
+        try:
+            rows = conn.execute("EXPLAIN " + self.translate(sql), tuple(params or ())).fetchall()
+        except Exception as e:
+            conn.rollback()
+            return f"(no plan: {e})"
+        return "\n".join(row[0] for row in rows)
+
+    def load_table(self, df, table):
+        """Replace `table` with the DataFrame using COPY"""
+        columns = ", ".join(f'"{c}" {_pg_type(df[c].dtype)}' for c in df.columns)
+        names = ", ".join(f'"{c}"' for c in df.columns)
+        values = [df[c].tolist() for c in df.columns]
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE')
+                cur.execute(f'CREATE TABLE "{table}" ({columns})')
+                with cur.copy(f'COPY "{table}" ({names}) FROM STDIN') as copy:
+                    for row in zip(*values):
+                        copy.write_row([None if v != v else v for v in row])
+            conn.commit()
+        finally:
+            conn.close()
+
+
+def _pg_type(dtype):
+    if dtype.kind in "iu":
+        return "BIGINT"
+    if dtype.kind == "f":
+        return "DOUBLE PRECISION"
+    if dtype.kind == "b":
+        return "BOOLEAN"
+    return "TEXT"
+
+
+BACKENDS = {"sqlite": SQLiteBackend, "postgres": PostgresBackend}
+backend = BACKENDS[BACKEND]()
@@ -0,0 +1,138 @@
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+import pandas as pd
+
+from db import run_many, run_query
+from metrics import render_metrics
+from shared_cache import shared_cache
+from storage import backend
+from workflow import ALL_RECEIVERS_TABLE, APPROVED, CANCELLED, CLAIM_STATES, PENDING
+
+# ---------------- Settings ----------------
+# Seconds between expiry sweeps (0 = only from the Performance page)
+SWEEP_INTERVAL = float(os.environ.get("FOOD_SWEEP_INTERVAL", "0"))
+# Listings retired per transaction; each batch holds the write lock only briefly
+SWEEP_BATCH = int(os.environ.get("FOOD_SWEEP_BATCH", "500"))
+# Seconds to yield between batches so interactive writes get the lock
+BATCH_PAUSE = 0.01
+
+logger = logging.getLogger("food_wastage.sweeper")
+
+# Imported rows carry M/D/YYYY; rewritten to YYYY-MM-DD so the expiry index orders by date
+UNNORMALIZED_QUERY = f"""
+  SELECT {backend.row_key} AS Row_Key, Expiry_Date AS Raw_Expiry FROM food_listings
+  WHERE Expiry_Date LIKE '%/%'
+"""
+NORMALIZE_UPDATE = f"UPDATE food_listings SET Expiry_Date = ? WHERE {backend.row_key_match} AND Expiry_Date = ?"
+EXPIRED_QUERY = f"""
+  SELECT {backend.row_key} AS Row_Key, Food_ID FROM food_listings
+  WHERE Listing_Status = 'Available' AND Expiry_Date < ?
+  ORDER BY Expiry_Date LIMIT ?
+"""
+# Both re-check their condition, so a listing edited since it was read is left alone;
+# expiring bumps Row_Version so an admin form loaded earlier cannot silently revive it
+EXPIRE_UPDATE = f"""
+  UPDATE food_listings SET Listing_Status = 'Expired', Row_Version = Row_Version + 1
+  WHERE {backend.row_key_match} AND Listing_Status = 'Available' AND Expiry_Date < ?
+"""
+# Claims still open (pending or approved but not collected) go with their listing
+CANCEL_UPDATE = f"""
+  UPDATE claims SET Status = '{CLAIM_STATES[CANCELLED]}', State = {CANCELLED}
+  WHERE Food_ID = ? AND State IN ({PENDING}, {APPROVED})
+    AND NOT EXISTS (SELECT 1 FROM food_listings f WHERE f.Food_ID = claims.Food_ID AND f.Listing_Status = 'Available')
+"""
+
+
+def normalize_expiry_dates(batch=SWEEP_BATCH):
+    """Rewrite M/D/YYYY expiry dates as YYYY-MM-DD; returns the rows changed"""
+    df = run_query(UNNORMALIZED_QUERY)
+    parsed = pd.to_datetime(df["Raw_Expiry"], format="%m/%d/%Y", errors="coerce")
+    # Dates that do not parse are left as they are
+    df = df[parsed.notna()].assign(Expiry=parsed.dt.strftime("%Y-%m-%d"))
+    rows = list(zip(df["Expiry"], df["Row_Key"].tolist(), df["Raw_Expiry"].tolist()))
+    changed = 0
+    for i in range(0, len(rows), batch):
+        changed += run_many([(NORMALIZE_UPDATE, rows[i:i + batch])])[0]
+        time.sleep(BATCH_PAUSE)
+    return changed
+
+
+def sweep_expired(today=None, batch=SWEEP_BATCH):
+    """Retire listings whose Expiry_Date has passed and cancel their open claims.
+
+    Works through the expiry index in batches of `batch` listings, one short
+    transaction each. Returns {"listings": n, "claims": m}.
+    """
+    cutoff = (today or date.today()).isoformat()
+    normalize_expiry_dates(batch)
+    totals = {"listings": 0, "claims": 0}
+    while True:
+        df = run_query(EXPIRED_QUERY, (cutoff, batch))
+        if df.empty:
+            break
+        food_ids = sorted(set(df["Food_ID"].dropna().astype(int).tolist()))
+        listings, claims = run_many([
+            (EXPIRE_UPDATE, [(key, cutoff) for key in df["Row_Key"].tolist()]),
+            (CANCEL_UPDATE, [(food_id,) for food_id in food_ids]),
+        ])
+        totals["listings"] += listings
+        totals["claims"] += claims
+        render_metrics.inc("food_sweeper_listings_expired_total", listings, "Listings retired by the expiry sweeper.")
+        render_metrics.inc("food_sweeper_claims_cancelled_total", claims, "Open claims cancelled because their listing expired.")
+        if listings == 0:
+            # Every row in the batch changed under us; the next sweep will see the new state
+            break
+        time.sleep(BATCH_PAUSE)
+    if totals["claims"]:
+        shared_cache.invalidate(ALL_RECEIVERS_TABLE)
+    render_metrics.inc("food_sweeper_runs_total", 1, "Completed expiry sweeps.")
+    render_metrics.maybe_export()
+    return totals
+
+
+class ExpirySweeper:
+    """Background thread that runs sweep_expired every `interval` seconds"""
+
+    def __init__(self, interval=SWEEP_INTERVAL):
+        self.interval = interval
+        self.last_run = None
+        self.last_totals = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="expiry-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception:
+                logger.exception("expiry sweep failed")
+            self._stop.wait(self.interval)
+
+    def run(self, today=None):
+        totals = sweep_expired(today)
+        self.last_run, self.last_totals = time.strftime("%Y-%m-%d %H:%M:%S"), totals
+        return totals
+
+
+expiry_sweeper = ExpirySweeper()
+
+
+if __name__ == "__main__":
+    from db import ensure_schema
+
+    ensure_schema()
+    totals = sweep_expired()
+    print(f"expired {totals['listings']} listings, cancelled {totals['claims']} open claims")
@@ -0,0 +1,133 @@
+"""Claim lifecycle: transitions and their history, archiving, and the expiry sweep."""
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import archive
+import cascade
+import sweeper
+import workflow
+from db import run_commit, run_query
+from workflow import APPROVED, CANCELLED, COMPLETED, PENDING
+
+
+def _state(claim_id):
+    return int(run_query("SELECT State FROM claims WHERE Claim_ID = ?", (claim_id,))["State"].iloc[0])
+
+
+def _counters():
+    df = run_query("SELECT name, claim_count FROM claim_states")
+    return dict(zip(df["name"], df["claim_count"].astype(int)))
+
+
+# ---------------- Transitions ----------------
+def test_transition_moves_claims_and_records_history(new_listing, new_claim):
+    claim_id = new_claim(new_listing())
+    before = _counters()
+
+    assert workflow.transition([claim_id], APPROVED) == {"moved": 1, "skipped": 0}
+    assert workflow.transition([claim_id], COMPLETED) == {"moved": 1, "skipped": 0}
+
+    assert _state(claim_id) == COMPLETED
+    steps = workflow.history(claim_id)
+    assert list(zip(steps["From_State"], steps["To_State"])) == [("Pending", "Approved"), ("Approved", "Completed")]
+    after = _counters()
+    assert after["Pending"] == before["Pending"] - 1 and after["Completed"] == before["Completed"] + 1
+
+
+def test_finished_claims_are_not_reopened(new_listing, new_claim):
+    claim_id = new_claim(new_listing(), state=COMPLETED)
+    assert workflow.transition([claim_id], CANCELLED) == {"moved": 0, "skipped": 1}
+    assert workflow.transition([claim_id], APPROVED) == {"moved": 0, "skipped": 1}
+    assert _state(claim_id) == COMPLETED
+    assert workflow.history(claim_id).empty
+
+
+def test_no_state_moves_back_to_pending():
+    with pytest.raises(ValueError):
+        workflow.transition([1], PENDING)
+
+
+def test_transition_is_limited_to_the_provider_and_receiver(new_listing, new_claim):
+    claim_id = new_claim(new_listing(provider_id=1), receiver_id=1)
+    assert workflow.transition([claim_id], APPROVED, provider_id=2)["moved"] == 0
+    assert workflow.transition([claim_id], APPROVED, receiver_id=2)["moved"] == 0
+    assert workflow.transition([claim_id], APPROVED, provider_id=1, receiver_id=1)["moved"] == 1
+
+
+def test_deleting_a_claim_drops_its_history(new_listing, new_claim):
+    claim_id = new_claim(new_listing())
+    workflow.transition([claim_id], CANCELLED)
+    run_commit("DELETE FROM claims WHERE Claim_ID = ?", (claim_id,))
+    assert workflow.history(claim_id).empty
+
+
+# ---------------- Archiving ----------------
+def test_archive_moves_old_claims_into_rollups(new_listing, new_claim):
+    receiver_id = int(run_query("SELECT MAX(Receiver_ID) + 1 AS id FROM receivers")["id"].iloc[0])
+    food_id = new_listing(provider_id=3, meal="Dinner")
+    done = [new_claim(food_id, receiver_id, COMPLETED, "2019-01-05 10:00:00") for _ in range(2)]
+    recent = new_claim(food_id, receiver_id, COMPLETED, "2019-03-01 10:00:00")
+    still_open = new_claim(food_id, receiver_id, PENDING, "2019-01-06 10:00:00")
+    before = _counters()
+
+    # Cutoff 2019-02-01: only the January claims that are finished qualify
+    assert archive.archive_claims(30, now=pd.Timestamp("2019-03-03")) == 2
+
+    live = set(run_query("SELECT Claim_ID FROM claims WHERE Receiver_ID = ?", (receiver_id,))["Claim_ID"])
+    assert live == {recent, still_open}
+    archived = set(run_query("SELECT Claim_ID FROM claims_archive WHERE Receiver_ID = ?", (receiver_id,))["Claim_ID"])
+    assert archived == set(done)
+    by_provider = run_query("SELECT claim_count FROM claim_rollups WHERE claim_month = '2019-01' "
+                            "AND status = 'Completed' AND provider_id = 3 AND meal_type = 'Dinner'")
+    assert by_provider["claim_count"].tolist() == [2]
+    by_receiver = run_query("SELECT claim_count, listed_count, quantity FROM receiver_claim_rollups WHERE receiver_id = ?",
+                            (receiver_id,))
+    assert by_receiver.iloc[0].tolist() == [2, 2, 20]
+    assert _counters()["Completed"] == before["Completed"] - 2
+    assert workflow.receiver_summary(receiver_id)["Archived"] == 2
+
+
+def test_bulk_jobs_refresh_cached_receiver_summaries(new_listing, new_claim):
+    receiver_id = int(run_query("SELECT MAX(Receiver_ID) + 2 AS id FROM receivers")["id"].iloc[0])
+    expiring = new_listing(expiry="2002-01-01")
+    new_claim(expiring, receiver_id, PENDING)
+    new_claim(new_listing(), receiver_id, COMPLETED, "2017-01-05 10:00:00")
+    assert workflow.receiver_summary(receiver_id)["Pending"] == 1
+
+    archive.archive_claims(30, now=pd.Timestamp("2017-03-01"))
+    assert workflow.receiver_summary(receiver_id)["Archived"] == 1
+    sweeper.sweep_expired(today=date(2002, 1, 2))
+    assert workflow.receiver_summary(receiver_id)["Cancelled"] == 1
+    cascade.delete("food_listings", expiring)
+    assert workflow.receiver_summary(receiver_id)["Cancelled"] == 0
+
+
+def test_archive_run_again_moves_nothing(new_listing, new_claim):
+    new_claim(new_listing(), state=CANCELLED, timestamp="2018-06-01 10:00:00")
+    assert archive.archive_claims(30, now=pd.Timestamp("2018-08-01")) == 1
+    assert archive.archive_claims(30, now=pd.Timestamp("2018-08-01")) == 0
+
+
+# ---------------- Expiry sweep ----------------
+def test_sweep_retires_expired_listings_and_cancels_their_open_claims(new_listing, new_claim):
+    expired = new_listing(expiry="2001-01-01")
+    fresh = new_listing(expiry="2030-01-01")
+    pending, approved, completed = (new_claim(expired, state=s) for s in (PENDING, APPROVED, COMPLETED))
+    untouched = new_claim(fresh)
+
+    assert sweeper.sweep_expired(today=date(2001, 1, 2)) == {"listings": 1, "claims": 2}
+
+    status = run_query("SELECT Listing_Status FROM food_listings WHERE Food_ID = ?", (expired,))["Listing_Status"]
+    assert status.tolist() == ["Expired"]
+    assert [_state(c) for c in (pending, approved, completed, untouched)] == [CANCELLED, CANCELLED, COMPLETED, PENDING]
+    assert sweeper.sweep_expired(today=date(2001, 1, 2)) == {"listings": 0, "claims": 0}
+
+
+def test_sweep_normalizes_imported_expiry_dates(new_listing):
+    food_id = new_listing(expiry="1/15/2031")
+    sweeper.sweep_expired(today=date(2001, 1, 2))
+    stored = run_query("SELECT COUNT(*) AS n FROM food_listings WHERE Food_ID = ? AND Expiry_Date = '2031-01-15'",
+                       (food_id,))
+    assert stored["n"].iloc[0] == 1
@@ -0,0 +1,97 @@
+"""Listing edits with Row_Version conflict detection, and the in-memory Browse snapshot."""
+import pytest
+
+import snapshot
+from db import run_commit, run_query, update_row
+from queries import browse_query
+
+
+def _version(food_id):
+    return int(run_query("SELECT Row_Version FROM food_listings WHERE Food_ID = ?", (food_id,))["Row_Version"].iloc[0])
+
+
+# ---------------- Versioned edits ----------------
+def test_update_row_writes_and_bumps_the_version(new_listing):
+    food_id = new_listing()
+    version = _version(food_id)
+    assert update_row("food_listings", "Food_ID", food_id, version, {"Quantity": 4, "Meal_Type": "Dinner"})
+    row = run_query("SELECT Quantity, Meal_Type FROM food_listings WHERE Food_ID = ?", (food_id,)).iloc[0]
+    assert (int(row["Quantity"]), row["Meal_Type"]) == (4, "Dinner")
+    assert _version(food_id) == version + 1
+
+
+def test_update_row_rejects_a_stale_version(new_listing):
+    food_id = new_listing()
+    version = _version(food_id)
+    # Another editor saves first
+    assert update_row("food_listings", "Food_ID", food_id, version, {"Quantity": 7})
+    assert not update_row("food_listings", "Food_ID", food_id, version, {"Quantity": 3})
+    assert int(run_query("SELECT Quantity FROM food_listings WHERE Food_ID = ?", (food_id,))["Quantity"].iloc[0]) == 7
+
+
+def test_update_row_fails_once_the_row_is_deleted(new_listing):
+    food_id = new_listing()
+    version = _version(food_id)
+    run_commit("DELETE FROM food_listings WHERE Food_ID = ?", (food_id,))
+    assert not update_row("food_listings", "Food_ID", food_id, version, {"Quantity": 1})
+
+
+def test_update_row_without_changes_is_a_no_op(new_listing):
+    food_id = new_listing()
+    version = _version(food_id)
+    assert update_row("food_listings", "Food_ID", food_id, version + 5, {})
+    assert _version(food_id) == version
+
+
+# ---------------- Browse snapshot ----------------
+FILTERS = [
+    {},
+    {"city": "Testville"},
+    {"meal": "Dinner"},
+    {"food_type": ["Vegan", "Vegetarian"]},
+    {"city": ["Testville", "Nowhere"], "meal": "Lunch"},
+    {"provider": "Renamed provider"},
+    {"city": "Nowhere"},
+]
+
+
+def _rows(df):
+    """Comparable rows; ties on Expiry_Date may come back in either order"""
+    cols = ["Food_ID", "Expiry_Date", "Location", "Food_Type", "Meal_Type", "Provider_Name"]
+    rows = [tuple(str(v) for v in row) for row in df[cols].itertuples(index=False)]
+    expiry = [str(v) for v in df["Expiry_Date"]]
+    assert expiry == sorted(expiry)
+    return sorted(rows)
+
+
+@pytest.fixture
+def listing_snapshot():
+    snap = snapshot.ListingSnapshot()
+    snap.refresh()
+    return snap
+
+
+def _assert_parity(snap):
+    for filters in FILTERS:
+        assert _rows(snap.filter(**filters)) == _rows(run_query(*browse_query(**filters))), filters
+
+
+def test_snapshot_filters_match_the_sql_query(new_listing):
+    new_listing(location="Testville", meal="Lunch")
+    snap = snapshot.ListingSnapshot()
+    snap.refresh()
+    assert len(snap.filter(city="Testville")) > 0
+    _assert_parity(snap)
+
+
+def test_snapshot_stays_in_step_after_writes(listing_snapshot, new_listing):
+    provider_id = int(run_query("SELECT MAX(Provider_ID) AS id FROM providers")["id"].iloc[0])
+    added = new_listing(provider_id=provider_id, location="Testville", meal="Dinner")
+    removed = int(run_query("SELECT Food_ID FROM food_listings WHERE Food_ID IS NOT NULL AND Food_ID <> ? LIMIT 1",
+                            (added,))["Food_ID"].iloc[0])
+    run_commit("DELETE FROM food_listings WHERE Food_ID = ?", (removed,))
+    run_commit("UPDATE providers SET Name = 'Renamed provider' WHERE Provider_ID = ?", (provider_id,))
+
+    assert listing_snapshot.refresh()
+    assert added in set(listing_snapshot.filter(city="Testville")["Food_ID"])
+    _assert_parity(listing_snapshot)
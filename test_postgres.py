@@ -0,0 +1,145 @@
+"""PostgreSQL backend: the dialect translator, and the schema on a real server.
+
+    FOOD_PG_DSN=postgresql://localhost/postgres python -m pytest test_postgres.py
+
+The integration tests run in a throwaway schema and are skipped unless
+FOOD_PG_DSN is set; the translator tests need no server.
+"""
+import os
+import uuid
+
+import pandas as pd
+import pytest
+
+import db
+from storage import PostgresBackend, sqlite_to_postgres
+
+PG_DSN = os.environ.get("FOOD_PG_DSN", "")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ---------------- Translator ----------------
+def test_placeholders_and_mixed_case_columns_are_rewritten():
+    sql = sqlite_to_postgres("SELECT Food_ID, Quantity FROM food_listings WHERE Provider_ID = ?")
+    assert sql == 'SELECT "Food_ID", "Quantity" FROM food_listings WHERE "Provider_ID" = %s'
+
+
+def test_literals_are_left_alone_except_for_percent_signs():
+    sql = sqlite_to_postgres("SELECT 1 FROM food_listings WHERE Location LIKE '%Food_ID?%' AND Status = 'It''s'")
+    assert sql == "SELECT 1 FROM food_listings WHERE \"Location\" LIKE '%%Food_ID?%%' AND \"Status\" = 'It''s'"
+
+
+def test_mixed_case_aliases_are_quoted_everywhere_and_lower_case_ones_are_not():
+    sql = sqlite_to_postgres("SELECT COUNT(*) AS Total_Claims, 1 AS n FROM claims ORDER BY Total_Claims")
+    assert sql == 'SELECT COUNT(*) AS "Total_Claims", 1 AS n FROM claims ORDER BY "Total_Claims"'
+
+
+def test_date_functions_become_text_in_sqlite_formats():
+    assert sqlite_to_postgres("SELECT datetime('now')") == \
+        "SELECT to_char((now() at time zone 'UTC'), 'YYYY-MM-DD HH24:MI:SS')"
+    assert sqlite_to_postgres("SELECT date('now', '-7 days')") == \
+        "SELECT to_char((now() at time zone 'UTC')::date + -7, 'YYYY-MM-DD')"
+    assert sqlite_to_postgres("SELECT julianday(Expiry_Date) - julianday('now')") == (
+        'SELECT (extract(epoch from ("Expiry_Date")::timestamp) / 86400.0 + 2440587.5)'
+        " - (extract(epoch from now()) / 86400.0 + 2440587.5)"
+    )
+
+
+def test_on_conflict_upserts_and_row_key_matches_pass_through():
+    sql = sqlite_to_postgres(
+        "INSERT INTO cdc_offsets (consumer, position) VALUES (?, ?) "
+        "ON CONFLICT (consumer) DO UPDATE SET position = excluded.position"
+    )
+    assert sql.endswith("VALUES (%s, %s) ON CONFLICT (consumer) DO UPDATE SET position = excluded.position")
+    sql = sqlite_to_postgres(f"DELETE FROM claims WHERE {PostgresBackend.row_key_match} AND Receiver_ID = ?")
+    assert sql == 'DELETE FROM claims WHERE ctid = CAST(%s AS tid) AND "Receiver_ID" = %s'
+
+
+# ---------------- Server ----------------
+needs_server = pytest.mark.skipif(not PG_DSN, reason="set FOOD_PG_DSN to run against a PostgreSQL server")
+
+
+@pytest.fixture(scope="module")
+def pg():
+    """db.* pointed at a fresh schema holding a few rows of each CSV"""
+    psycopg = pytest.importorskip("psycopg")
+    from psycopg.conninfo import make_conninfo
+
+    schema = f"food_test_{uuid.uuid4().hex[:8]}"
+    admin = psycopg.connect(PG_DSN, autocommit=True)
+    admin.execute(f"CREATE SCHEMA {schema}")
+    backend = PostgresBackend(make_conninfo(PG_DSN, options=f"-c search_path={schema}"))
+    try:
+        for table, rows in (("providers", 20), ("receivers", 20), ("food_listings", 50), ("claims", 50)):
+            backend.load_table(pd.read_csv(os.path.join(HERE, f"{table}_data.csv")).head(rows), table)
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(db, "backend", backend)
+            db.ensure_schema()
+            yield backend
+    finally:
+        backend.pool.close()
+        admin.execute(f"DROP SCHEMA {schema} CASCADE")
+        admin.close()
+
+
+def _one(query, params=()):
+    return db.run_query(query, params).iloc[0, 0]
+
+
+def _new_claim(claim_id, state=0):
+    food_id = int(_one("SELECT Food_ID FROM food_listings WHERE Food_ID IS NOT NULL LIMIT 1"))
+    db.run_commit(
+        "INSERT INTO claims (Claim_ID, Food_ID, Receiver_ID, Status, State, Timestamp) VALUES (?, ?, 1, ?, ?, ?)",
+        (claim_id, food_id, db.CLAIM_STATES[state], state, "2025-03-20 12:02:00"),
+    )
+
+
+@needs_server
+def test_schema_can_be_applied_again(pg):
+    db.ensure_schema()
+    triggers = db.run_query("SELECT tgname AS name FROM pg_trigger WHERE tgrelid = 'claims'::regclass AND NOT tgisinternal")
+    assert {"claim_state_count", "claim_state_upd", "claim_daily_ins", "claims_cdc", "claims_version"} <= set(triggers["name"])
+
+
+@needs_server
+def test_on_conflict_upsert_updates_the_existing_row(pg):
+    upsert = ("INSERT INTO cdc_offsets (consumer, position, updated_at) VALUES (?, ?, ?) "
+              "ON CONFLICT (consumer) DO UPDATE SET position = excluded.position")
+    db.run_many([(upsert, [("pg-test", 1, "2025-01-01 00:00:00")])])
+    db.run_many([(upsert, [("pg-test", 7, "2025-01-01 00:00:00")])])
+    assert _one("SELECT position FROM cdc_offsets WHERE consumer = ?", ("pg-test",)) == 7
+
+
+@needs_server
+def test_ctid_row_key_stops_matching_once_the_row_moves(pg):
+    _new_claim(900001)
+    key = _one(f"SELECT {pg.row_key} AS Row_Key FROM claims WHERE Claim_ID = ?", (900001,))
+    delete = f"DELETE FROM claims WHERE {pg.row_key_match} AND Claim_ID = ?"
+    # An UPDATE writes a new tuple, so the ctid read before it is stale
+    db.run_commit("UPDATE claims SET Status = 'Completed' WHERE Claim_ID = ?", (900001,))
+    assert db.run_many([(delete, [(str(key), 900001)])]) == [0]
+    key = _one(f"SELECT {pg.row_key} AS Row_Key FROM claims WHERE Claim_ID = ?", (900001,))
+    assert db.run_many([(delete, [(str(key), 900001)])]) == [1]
+
+
+@needs_server
+def test_triggers_keep_counters_history_and_change_log(pg):
+    before = dict(db.run_query("SELECT name, claim_count FROM claim_states").itertuples(index=False))
+    seq = int(_one("SELECT COALESCE(MAX(seq), 0) AS seq FROM change_events"))
+    version = int(_one("SELECT version FROM table_versions WHERE table_name = 'claims'"))
+
+    _new_claim(900002)
+    db.run_commit("UPDATE claims SET State = 1, Status = 'Approved' WHERE Claim_ID = ?", (900002,))
+    after = dict(db.run_query("SELECT name, claim_count FROM claim_states").itertuples(index=False))
+    assert after["Approved"] == before["Approved"] + 1 and after["Pending"] == before["Pending"]
+    assert _one("SELECT COUNT(*) AS n FROM claim_transitions WHERE claim_id = ? AND from_state = 0 AND to_state = 1",
+                (900002,)) == 1
+    assert _one("SELECT SUM(claim_count) AS n FROM claim_daily WHERE day = '2025-03-20' AND status = 'Approved'") >= 1
+
+    db.run_commit("DELETE FROM claims WHERE Claim_ID = ?", (900002,))
+    assert _one("SELECT claim_count FROM claim_states WHERE name = 'Approved'") == before["Approved"]
+    assert _one("SELECT COUNT(*) AS n FROM claim_transitions WHERE claim_id = ?", (900002,)) == 0
+    ops = db.run_query("SELECT op FROM change_events WHERE seq > ? AND table_name = 'claims' AND row_id = ? ORDER BY seq",
+                       (seq, 900002))["op"].tolist()
+    assert ops == ["insert", "update", "delete"]
+    assert int(_one("SELECT version FROM table_versions WHERE table_name = 'claims'")) == version + 3
@@ -0,0 +1,66 @@
+"""Approximate claim statistics: the sketches stay inside their stated error bounds."""
+import numpy as np
+
+import cdc
+import workflow
+from db import run_commit, run_query
+from sketches import CMS_DELTA, ClaimSketches, CountMinSketch, HeavyHitters, HyperLogLog
+
+rng = np.random.default_rng(7)
+
+
+def _claims():
+    """Exact live plus archived claims"""
+    return int(run_query("SELECT (SELECT COUNT(*) FROM claims) + (SELECT COUNT(*) FROM claims_archive) AS n")["n"].iloc[0])
+
+
+def test_distinct_counts_are_within_three_standard_errors():
+    for n in (50, 5_000, 200_000):
+        values = np.unique(rng.integers(0, 2**40, n))
+        hll = HyperLogLog()
+        # Repeats must not count again
+        hll.add(np.concatenate([values, values[: len(values) // 2]]))
+        assert abs(hll.estimate() / len(values) - 1) <= 3 * hll.relative_error, n
+
+
+def test_count_min_never_undercounts_and_rarely_passes_its_bound():
+    keys = rng.zipf(1.3, 200_000) % 50_000
+    cms = CountMinSketch()
+    cms.add(keys)
+    values, counts = np.unique(keys, return_counts=True)
+    over = cms.estimate(values) - counts
+    assert (over >= 0).all()
+    assert np.mean(over > cms.error_bound) <= CMS_DELTA
+
+
+def test_heavy_hitters_find_the_true_top_keys():
+    keys = rng.zipf(1.3, 500_000) % 1_000_000
+    hitters = HeavyHitters()
+    for start in range(0, len(keys), 50_000):
+        hitters.add(keys[start:start + 50_000])
+    values, counts = np.unique(keys, return_counts=True)
+    true_top = set(values[np.argsort(-counts)[:10]].tolist())
+    assert true_top == {key for key, _ in hitters.top(10)}
+
+
+def test_claim_sketches_follow_claims_from_the_change_log(new_listing):
+    sketches = ClaimSketches()
+    assert sketches.summary()["claims"] == _claims()
+
+    food_id = new_listing()
+    for _ in range(3):
+        workflow.submit(food_id, 1)
+    top, bound = sketches.top_foods(200)
+    assert sketches.summary()["claims"] == _claims()
+    assert 3 <= dict(top).get(food_id, 0) <= 3 + bound
+
+
+def test_claim_sketches_rebuild_when_unread_events_were_pruned(new_listing):
+    sketches = ClaimSketches()
+    sketches.summary()
+    food_id = new_listing()
+    workflow.submit(food_id, 1)
+    workflow.submit(food_id, 1)
+    # A prune that ran past the sketch position: the first insert is gone from the log
+    run_commit("DELETE FROM change_events WHERE seq < ?", (cdc.latest_seq(),))
+    assert sketches.summary()["claims"] == _claims()
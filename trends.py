@@ -0,0 +1,76 @@
+import pandas as pd
+
+from db import cached_query, run_many, run_query
+
+# ---------------- Settings ----------------
+# Chart breakdowns and the claim_daily column each one reads
+DIMENSIONS = {"Status": "status", "City": "city", "Provider type": "provider_type"}
+FREQUENCIES = {"Daily": "D", "Weekly": "W-MON"}
+# Breakdowns with more values than this keep the largest and sum the rest into "Other"
+MAX_SERIES = 8
+
+BACKFILL_QUERY = """
+  SELECT c.Status, c.Timestamp, f.Location, f.Provider_Type
+  FROM claims c LEFT JOIN food_listings f ON c.Food_ID = f.Food_ID
+  UNION ALL
+  SELECT a.Status, a.Timestamp, f.Location, f.Provider_Type
+  FROM claims_archive a LEFT JOIN food_listings f ON a.Food_ID = f.Food_ID
+"""
+
+
+def needs_backfill():
+    """True until claim_daily has been filled once"""
+    return run_query("SELECT 1 AS present FROM claim_daily LIMIT 1").empty
+
+
+def rebuild_claim_trends():
+    """Recompute claim_daily from the live and archived claims; returns the rows written"""
+    df = run_query(BACKFILL_QUERY)
+    df = df[df["Timestamp"].notna()]
+    daily = pd.DataFrame({
+        "day": df["Timestamp"].dt.strftime("%Y-%m-%d"),
+        "city": df["Location"].astype(object).fillna(""),
+        "provider_type": df["Provider_Type"].astype(object).fillna(""),
+        "status": df["Status"].astype(object).fillna(""),
+    }).groupby(["day", "city", "provider_type", "status"]).size().reset_index()
+    rows = [tuple(r) for r in daily.itertuples(index=False)]
+    run_many([
+        ("DELETE FROM claim_daily", [()]),
+        ("INSERT INTO claim_daily (day, city, provider_type, status, claim_count) VALUES (?, ?, ?, ?, ?)",
+         [(day, city, ptype, status, int(n)) for day, city, ptype, status, n in rows]),
+    ])
+    return len(rows)
+
+
+def day_range():
+    """First and last day with claims, or None when there are none"""
+    df = cached_query("SELECT MIN(day) AS first_day, MAX(day) AS last_day FROM claim_daily", replica=True)
+    if df.empty or pd.isna(df["first_day"].iloc[0]):
+        return None
+    return pd.Timestamp(df["first_day"].iloc[0]), pd.Timestamp(df["last_day"].iloc[0])
+
+
+def claim_trend(start, end, by="Status", freq="Daily"):
+    """Claims per day or week between two dates, one column per value of `by`"""
+    column = DIMENSIONS[by]
+    df = cached_query(
+        f"SELECT day, {column} AS series, SUM(claim_count) AS claims FROM claim_daily "
+        f"WHERE day BETWEEN ? AND ? GROUP BY day, {column}",
+        (start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")),
+        replica=True,
+    )
+    if df.empty:
+        return pd.DataFrame()
+    series = df["series"].replace("", "Unknown")
+    totals = df.groupby(series)["claims"].sum().sort_values(ascending=False)
+    if len(totals) > MAX_SERIES:
+        series = series.where(series.isin(totals.index[:MAX_SERIES - 1]), "Other")
+    table = df.assign(series=series, day=pd.to_datetime(df["day"])).pivot_table(
+        index="day", columns="series", values="claims", aggfunc="sum", fill_value=0,
+    )
+    # Days without claims have no rows; reindex so gaps show as zero
+    table = table.reindex(pd.date_range(start, end, freq="D"), fill_value=0)
+    if FREQUENCIES[freq] != "D":
+        table = table.resample(FREQUENCIES[freq], label="left", closed="left").sum()
+    table.columns.name = None
+    return table
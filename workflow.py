@@ -0,0 +1,221 @@
+"""Claim lifecycle: validated state transitions, their history and per-state counts.
+
+A claim's State indexes db.CLAIM_STATES and its Status text is kept equal to
+the state's name, so the reports and rollups that read Status are unchanged.
+Triggers on claims keep claim_states.claim_count current and append every
+change to claim_transitions, whoever makes it (the expiry sweeper included).
+
+The Receiver Portal reads a receiver's claims a page at a time and a cached
+summary of them. The summary is keyed on a per-receiver cache table that
+submit and transition bump for the receivers they touch, so one receiver's
+claim does not drop everyone else's summary; writes made elsewhere (sweeper,
+archive, admin, other processes) show up after FOOD_RECEIVER_SUMMARY_TTL.
+"""
+import os
+import random
+import time
+
+import pandas as pd
+
+from db import CLAIM_STATES, cached_query, run_commit, run_many, run_query
+from metrics import render_metrics
+from queries import in_list
+from shared_cache import shared_cache
+from storage import backend
+
+# ---------------- Settings ----------------
+# Claims moved per transaction by bulk transitions
+TRANSITION_BATCH = int(os.environ.get("FOOD_TRANSITION_BATCH", "500"))
+# Claims per Receiver Portal page
+RECEIVER_PAGE_SIZE = int(os.environ.get("FOOD_RECEIVER_PAGE_SIZE", "20"))
+# Seconds a receiver's cached summary may miss claim changes it was not told about
+RECEIVER_SUMMARY_TTL = float(os.environ.get("FOOD_RECEIVER_SUMMARY_TTL", "300"))
+
+PENDING, APPROVED, COMPLETED, CANCELLED = range(len(CLAIM_STATES))
+STATES = {name: state for state, name in enumerate(CLAIM_STATES)}
+# Allowed moves; Completed and Cancelled are final
+TRANSITIONS = {
+    PENDING: (APPROVED, COMPLETED, CANCELLED),
+    APPROVED: (COMPLETED, CANCELLED),
+}
+OPEN = (PENDING, APPROVED)
+CLOSED = (COMPLETED, CANCELLED)
+
+# The loaded claims table has no serial key; new claims continue after the largest
+# Claim_ID, live or archived. Two submits that read the same maximum collide on the
+# unique claims_claim_id_unique index and the loser retries.
+SUBMIT_INSERT = f"""
+  INSERT INTO claims (Claim_ID, Food_ID, Receiver_ID, Status, State, Timestamp)
+  SELECT MAX(last_id) + 1, ?, ?, '{CLAIM_STATES[PENDING]}', {PENDING}, datetime('now') FROM (
+    SELECT COALESCE(MAX(Claim_ID), 0) AS last_id FROM claims
+    UNION ALL SELECT COALESCE(MAX(Claim_ID), 0) FROM claims_archive) ids
+"""
+SUBMIT_ATTEMPTS = 10
+SYNC_UPDATE = f"""
+  UPDATE claims SET State = CASE Status {" ".join(f"WHEN '{name}' THEN {i}" for i, name in enumerate(CLAIM_STATES))} END
+  WHERE State IS NULL AND Status IN ({", ".join(f"'{name}'" for name in CLAIM_STATES)})
+"""
+RECOUNT = "UPDATE claim_states SET claim_count = (SELECT COUNT(*) FROM claims c WHERE c.State = claim_states.state)"
+PROVIDER_CLAIMS_QUERY = """
+  SELECT c.Claim_ID, c.Food_ID, f.Food_Name, c.Receiver_ID, r.Name AS Receiver_Name, c.Status, c.Timestamp
+  FROM claims c
+  JOIN food_listings f ON f.Food_ID = c.Food_ID
+  LEFT JOIN receivers r ON r.Receiver_ID = c.Receiver_ID
+  WHERE f.Provider_ID = ? AND c.State IN (?, ?)
+  ORDER BY c.Claim_ID
+"""
+# Keyset pages: each page continues below the last Claim_ID shown, along claims_receiver_claim
+RECEIVER_CLAIMS_QUERY = """
+  SELECT c.Claim_ID, c.Food_ID, f.Food_Name, p.Name AS Provider_Name, c.Status, c.Timestamp
+  FROM claims c
+  LEFT JOIN food_listings f ON f.Food_ID = c.Food_ID
+  LEFT JOIN providers p ON p.Provider_ID = f.Provider_ID
+  WHERE c.Receiver_ID = ? AND c.State IN (?, ?){after}
+  ORDER BY c.Claim_ID DESC LIMIT ?
+"""
+RECEIVER_SUMMARY_QUERY = """
+  SELECT State, COUNT(*) AS claims FROM claims WHERE Receiver_ID = ? GROUP BY State
+"""
+RECEIVER_ARCHIVED_QUERY = "SELECT SUM(claim_count) AS claims FROM receiver_claim_rollups WHERE receiver_id = ?"
+HISTORY_QUERY = """
+  SELECT a.name AS From_State, b.name AS To_State, t.changed_at AS Changed_At
+  FROM claim_transitions t
+  JOIN claim_states a ON a.state = t.from_state
+  JOIN claim_states b ON b.state = t.to_state
+  WHERE t.claim_id = ? ORDER BY t.changed_at
+"""
+
+
+def sources(to_state):
+    """States a claim may move to `to_state` from"""
+    found = tuple(state for state, targets in TRANSITIONS.items() if to_state in targets)
+    if not found:
+        raise ValueError(f"no claim state moves to {to_state!r}")
+    return found
+
+
+def receiver_table(receiver_id):
+    """Shared-cache pseudo-table of one receiver's claims"""
+    return f"receiver_claims:{int(receiver_id)}"
+
+
+# Every receiver's summary also depends on this one; the archive, expiry sweep and
+# cascade compaction invalidate it, since they change many receivers' claims at once
+ALL_RECEIVERS_TABLE = "receiver_claims:*"
+
+
+def submit(food_id, receiver_id):
+    """Insert a pending claim; returns the backend's last row id"""
+    for attempt in range(SUBMIT_ATTEMPTS):
+        try:
+            last_id = run_commit(SUBMIT_INSERT, (int(food_id), int(receiver_id)))
+            break
+        except backend.integrity_error:
+            # Another submit took this Claim_ID first; back off so racing submits spread out
+            if attempt == SUBMIT_ATTEMPTS - 1:
+                raise
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+    shared_cache.invalidate(receiver_table(receiver_id))
+    return last_id
+
+
+def transition(claim_ids, to_state, provider_id=None, batch=TRANSITION_BATCH, receiver_id=None):
+    """Move claims to `to_state`, `batch` per transaction.
+
+    Claims not in a state that may move there are left alone, so a bulk
+    action over a stale selection cannot reopen a finished claim. With
+    `provider_id`, only claims on that provider's listings move; with
+    `receiver_id`, only that receiver's claims. Returns
+    {"moved": n, "skipped": n}.
+    """
+    allowed = sources(to_state)
+    ids = sorted({int(i) for i in claim_ids})
+    moved = 0
+    for start in range(0, len(ids), batch):
+        chunk = ids[start:start + batch]
+        id_clause, id_values = in_list("Claim_ID", chunk)
+        state_clause, state_values = in_list("State", allowed)
+        sql = f"UPDATE claims SET State = ?, Status = ? WHERE {id_clause} AND {state_clause}"
+        params = [to_state, CLAIM_STATES[to_state]] + id_values + state_values
+        if provider_id is not None:
+            sql += " AND Food_ID IN (SELECT Food_ID FROM food_listings WHERE Provider_ID = ?)"
+            params.append(int(provider_id))
+        if receiver_id is not None:
+            sql += " AND Receiver_ID = ?"
+            params.append(int(receiver_id))
+            receivers = [receiver_id]
+        else:
+            receivers = run_query(f"SELECT DISTINCT Receiver_ID FROM claims WHERE {id_clause}", id_values)["Receiver_ID"]
+        moved += run_many([(sql, [params])])[0]
+        shared_cache.invalidate(*(receiver_table(r) for r in receivers if pd.notna(r)))
+    render_metrics.inc("food_claim_transitions_total", moved, "Claims moved between lifecycle states.")
+    return {"moved": moved, "skipped": len(ids) - moved}
+
+
+def provider_claims(provider_id):
+    """Pending and approved claims on a provider's listings"""
+    return run_query(PROVIDER_CLAIMS_QUERY, (int(provider_id), PENDING, APPROVED))
+
+
+def approve_all(provider_id, batch=TRANSITION_BATCH):
+    """Approve every pending claim on a provider's listings"""
+    pending = provider_claims(provider_id)
+    pending = pending[pending["Status"] == CLAIM_STATES[PENDING]]
+    return transition(pending["Claim_ID"].dropna().tolist(), APPROVED, provider_id, batch)
+
+
+def counts():
+    """{state name: live claims}, read from the counters rather than claims"""
+    df = cached_query("SELECT name, claim_count FROM claim_states ORDER BY state")
+    return dict(zip(df["name"], df["claim_count"].astype(int)))
+
+
+def receiver_claims(receiver_id, states=OPEN, after=None, limit=RECEIVER_PAGE_SIZE):
+    """One page of a receiver's claims in `states`, newest Claim_ID first.
+
+    Pass the returned cursor as `after` for the next page; it is None on the
+    last one.
+    """
+    sql = RECEIVER_CLAIMS_QUERY.format(after="" if after is None else " AND c.Claim_ID < ?")
+    params = [int(receiver_id)] + list(states) + ([] if after is None else [int(after)]) + [limit + 1]
+    page = run_query(sql, params)
+    if len(page) <= limit:
+        return page, None
+    page = page.iloc[:limit]
+    return page, int(page["Claim_ID"].iloc[-1])
+
+
+def receiver_summary(receiver_id):
+    """{state name: live claims, "Archived": archived claims} for one receiver"""
+    rid = int(receiver_id)
+
+    def load():
+        live = run_query(RECEIVER_SUMMARY_QUERY, (rid,))
+        archived = run_query(RECEIVER_ARCHIVED_QUERY, (rid,))["claims"].iloc[0]
+        summary = {name: 0 for name in CLAIM_STATES}
+        for state, n in zip(live["State"], live["claims"]):
+            if pd.notna(state):
+                summary[CLAIM_STATES[int(state)]] = int(n)
+        summary["Archived"] = 0 if pd.isna(archived) else int(archived)
+        return summary
+
+    tables = (receiver_table(rid), ALL_RECEIVERS_TABLE)
+    return dict(shared_cache.get(("receiver_summary", rid), tables, load, RECEIVER_SUMMARY_TTL))
+
+
+def history(claim_id):
+    """State changes of one claim, oldest first"""
+    return run_query(HISTORY_QUERY, (int(claim_id),))
+
+
+def sync_states(recount=False):
+    """Set State on claims that only have a Status (CSV imports), then recount.
+
+    Returns the number of claims given a state. The counters are rebuilt
+    from the table whenever any were, or always with recount=True, since a
+    reloaded claims table leaves the old counts behind.
+    """
+    changed = run_many([(SYNC_UPDATE, [()])])[0]
+    if changed or recount or not sum(counts().values()):
+        run_many([(RECOUNT, [()])])
+    return changed